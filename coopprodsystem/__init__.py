@@ -1,3 +1,4 @@
 from .events import *
 from .factory import *
 from .my_dataclasses import *
+from .loggingHelpers import *
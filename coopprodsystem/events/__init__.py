@@ -1 +1,2 @@
-from .eventDefinition import *
\ No newline at end of file
+from .eventDispatcher import *
+from .eventDefinition import *
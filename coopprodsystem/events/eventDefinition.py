@@ -1,14 +1,26 @@
 import logging
+import threading
+import weakref
 
 from pubsub import pub
 from enum import Enum, auto
 import datetime
+from typing import Optional
 from dataclasses import dataclass, field
 from coopprodsystem.factory.stationTransfer import StationTransfer
 from coopprodsystem.factory.station import Station
+from coopprodsystem.factory.downtime import DowntimeWindow
+from coopprodsystem.loggingHelpers import should_log
+from coopprodsystem.events.eventDispatcher import PooledEventDispatcher, EventDispatcherNotStartedException
 
 logger = logging.getLogger('coopprodsystem.events')
 
+_event_dispatcher: PooledEventDispatcher = None
+_weak_event_refs: bool = False
+_weak_event_refs_holders: int = 0
+_deferred_consumers: int = 0
+_counters_lock = threading.Lock()
+
 class ProductionEventType(Enum):
     STATION_ADDED = auto()
     STATION_REMOVED = auto()
@@ -16,6 +28,9 @@ class ProductionEventType(Enum):
     PRODUCTION_STARTED_AT_STATION = auto()
     STATION_TRANSFER_STARTED = auto()
     STATION_TRANSFER_COMPLETED = auto()
+    STATION_TRANSFER_CANCELLED = auto()
+    STATION_DOWNTIME_STARTED = auto()
+    STATION_DOWNTIME_ENDED = auto()
 
 #region EventArgsBase
 @dataclass(frozen=True)
@@ -29,6 +44,11 @@ class EventArgsBase:
 class StationEventArgsBase(EventArgsBase):
     station: Station
 
+    def __post_init__(self):
+        super().__post_init__()
+        if weak_event_refs() and not isinstance(self.station, weakref.ProxyTypes):
+            object.__setattr__(self, 'station', weakref.proxy(self.station))
+
 @dataclass(frozen=True)
 class StationTransferEventArgsBase(EventArgsBase):
     transfer: StationTransfer
@@ -45,12 +65,21 @@ class OnStationRemovedEventArgs(StationEventArgsBase):
 
 @dataclass(frozen=True)
 class OnProductionFinishedAtStationEventArgs(StationEventArgsBase):
-    ...
+    # start of the finished run, None for stations that complete work without timed runs (e.g. sinks)
+    start_perf: Optional[float] = None
 
 @dataclass(frozen=True)
 class OnProductionStartedAtStationEventArgs(StationEventArgsBase):
     ...
 
+@dataclass(frozen=True)
+class OnStationDowntimeStartedEventArgs(StationEventArgsBase):
+    downtime: DowntimeWindow
+
+@dataclass(frozen=True)
+class OnStationDowntimeEndedEventArgs(StationEventArgsBase):
+    downtime: DowntimeWindow
+
 @dataclass(frozen=True)
 class OnStationTransferStartedEventArgs(StationTransferEventArgsBase):
     ...
@@ -59,14 +88,82 @@ class OnStationTransferStartedEventArgs(StationTransferEventArgsBase):
 class OnStationTransferCompletedEventArgs(StationTransferEventArgsBase):
     ...
 
+@dataclass(frozen=True)
+class OnStationTransferCancelledEventArgs(StationTransferEventArgsBase):
+    ...
+
 #endregion
 
 #region RaiseEvents
+def set_event_dispatcher(dispatcher: PooledEventDispatcher = None):
+    """Deliver raised events through the given dispatcher, or synchronously via pubsub when None"""
+    global _event_dispatcher
+    _event_dispatcher = dispatcher
+
+
+def get_event_dispatcher() -> PooledEventDispatcher:
+    return _event_dispatcher
+
+
+def set_weak_event_refs(enabled: bool = True):
+    """When enabled the station on event args is a weakref.proxy, so args kept by handlers or queued on a dispatcher
+    do not keep stations alive once they leave the line. Using the station of such args after it was collected raises
+    ReferenceError.
+
+    This is a process-wide override; lines in long-run mode hold weak refs on with retain_weak_event_refs() instead, so
+    one line leaving long-run mode does not turn them off for the others"""
+    global _weak_event_refs
+    _weak_event_refs = enabled
+
+
+def retain_weak_event_refs():
+    """Keep weak event refs on until the matching release_weak_event_refs()"""
+    global _weak_event_refs_holders
+    with _counters_lock:
+        _weak_event_refs_holders += 1
+
+
+def release_weak_event_refs():
+    global _weak_event_refs_holders
+    with _counters_lock:
+        _weak_event_refs_holders = max(_weak_event_refs_holders - 1, 0)
+
+
+def weak_event_refs() -> bool:
+    return _weak_event_refs or _weak_event_refs_holders > 0
+
+
+def register_deferred_consumer():
+    """Announce a subscriber that keeps event args past the handler call (e.g. on a queue). While any is registered,
+    event args must stay valid after delivery, so lines do not recycle the transfer records they reference"""
+    global _deferred_consumers
+    with _counters_lock:
+        _deferred_consumers += 1
+
+
+def unregister_deferred_consumer():
+    global _deferred_consumers
+    with _counters_lock:
+        _deferred_consumers = max(_deferred_consumers - 1, 0)
+
+
+def has_deferred_consumers() -> bool:
+    return _deferred_consumers > 0
+
+
 def raise_event(event: ProductionEventType,
                 log_lvl = logging.INFO, 
                 **kwargs):
-    args = kwargs.get('args', None)
-    logger.log(level=log_lvl, msg=f"raise event: {event.name} with args: {args}")
+    if should_log(logger, log_lvl):
+        logger.log(log_lvl, "raise event: %s with args: %s", event.name, kwargs.get('args', None))
+
+    # a dispatcher that was stopped but is still installed falls back to synchronous delivery
+    if _event_dispatcher is not None and _event_dispatcher.Started:
+        try:
+            _event_dispatcher.submit(event.name, **kwargs)
+            return
+        except EventDispatcherNotStartedException:
+            pass
     pub.sendMessage(event.name, **kwargs)
 
 
@@ -82,11 +179,20 @@ def raise_event_production_finished_at_station(args: OnProductionFinishedAtStati
 def raise_event_production_started_at_station(args: OnProductionStartedAtStationEventArgs):
     raise_event(ProductionEventType.PRODUCTION_STARTED_AT_STATION, log_lvl=logging.INFO, args=args)
 
+def raise_event_station_downtime_started(args: OnStationDowntimeStartedEventArgs):
+    raise_event(ProductionEventType.STATION_DOWNTIME_STARTED, log_lvl=logging.INFO, args=args)
+
+def raise_event_station_downtime_ended(args: OnStationDowntimeEndedEventArgs):
+    raise_event(ProductionEventType.STATION_DOWNTIME_ENDED, log_lvl=logging.INFO, args=args)
+
 def raise_event_StationTransferStarted(args: OnStationTransferStartedEventArgs):
     raise_event(ProductionEventType.STATION_TRANSFER_STARTED, log_lvl=logging.INFO, args=args)
 
 def raise_event_StationTransferCompleted(args: OnStationTransferCompletedEventArgs):
     raise_event(ProductionEventType.STATION_TRANSFER_COMPLETED, log_lvl=logging.INFO, args=args)
+
+def raise_event_StationTransferCancelled(args: OnStationTransferCancelledEventArgs):
+    raise_event(ProductionEventType.STATION_TRANSFER_CANCELLED, log_lvl=logging.INFO, args=args)
 #endregion
 
 if __name__ == "__main__":
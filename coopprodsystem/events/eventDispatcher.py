@@ -0,0 +1,264 @@
+import logging
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from enum import auto
+from typing import Deque, Dict, List, Optional, Tuple, Any
+from pubsub import pub
+from cooptools.coopEnum import CoopEnum
+
+logger = logging.getLogger('coopprodsystem.events.dispatcher')
+
+
+class EventQueueOverflowPolicy(CoopEnum):
+    BLOCK = auto()
+    DROP_OLDEST = auto()
+    COALESCE_PER_STATION = auto()
+
+
+class EventDispatcherNotStartedException(Exception):
+    def __init__(self):
+        super().__init__(str(type(self)))
+
+
+@dataclass
+class HandlerLagMetrics:
+    delivered: int = 0
+    errors: int = 0
+    total_lag_s: float = 0.0
+    max_lag_s: float = 0.0
+    last_lag_s: float = 0.0
+    total_handle_s: float = 0.0
+
+    def record(self, lag_s: float, handle_s: float):
+        self.delivered += 1
+        self.total_lag_s += lag_s
+        self.last_lag_s = lag_s
+        self.total_handle_s += handle_s
+        if lag_s > self.max_lag_s:
+            self.max_lag_s = lag_s
+
+    @property
+    def mean_lag_s(self) -> Optional[float]:
+        return self.total_lag_s / self.delivered if self.delivered else None
+
+    @property
+    def mean_handle_s(self) -> Optional[float]:
+        return self.total_handle_s / self.delivered if self.delivered else None
+
+
+class _QueuedEvent:
+    __slots__ = ('topic_name', 'kwargs', 'enqueued_perf', 'coalesce_key')
+
+    def __init__(self, topic_name: str, kwargs: Dict[str, Any], coalesce_key: Optional[Tuple]):
+        self.topic_name = topic_name
+        self.kwargs = kwargs
+        self.enqueued_perf = time.perf_counter()
+        self.coalesce_key = coalesce_key
+
+
+class PooledEventDispatcher:
+    """Delivers production events to their pubsub listeners from a bounded queue on a pool of worker threads.
+
+    Once installed via set_event_dispatcher(), raise_event() only enqueues, so a slow handler no longer stalls the
+    station or line that raised the event. With more than one worker, ordering across events is not guaranteed.
+
+    Lag metrics are kept for at most max_handler_metrics handlers; the longest-tracked ones are dropped first, which
+    keeps the table bounded when handlers come and go over a long run.
+
+    When the queue is full, BLOCK waits for room (up to block_timeout_s, then drops the event), DROP_OLDEST drops the
+    oldest queued event, and COALESCE_PER_STATION replaces the payload of the event already queued for the same topic
+    and station; an event with nothing to coalesce into falls back to dropping the oldest queued event. Under BLOCK, an
+    event a handler raises on a worker thread while the queue is full is delivered inline, as the worker would
+    otherwise wait on itself.
+    """
+
+    def __init__(self,
+                 max_queue_size: int = 1000,
+                 n_workers: int = 1,
+                 overflow_policy: EventQueueOverflowPolicy = EventQueueOverflowPolicy.BLOCK,
+                 block_timeout_s: float = None,
+                 start_on_init: bool = True,
+                 max_handler_metrics: int = 256):
+        if max_queue_size < 1:
+            raise ValueError(f"max_queue_size must be >= 1, {max_queue_size} provided")
+
+        self.max_queue_size = max_queue_size
+        self.n_workers = n_workers
+        self.overflow_policy = overflow_policy
+        self.block_timeout_s = block_timeout_s
+        self.max_handler_metrics = max_handler_metrics
+
+        self._queue: Deque[_QueuedEvent] = deque()
+        self._pending_by_key: Dict[Tuple, _QueuedEvent] = {}
+        self._cond = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._stopping = False
+        self._in_flight = 0
+        self._worker_local = threading.local()
+
+        self._handler_metrics: Dict[str, HandlerLagMetrics] = {}
+        self._metrics_lock = threading.Lock()
+        self.n_submitted = 0
+        self.n_dropped = 0
+        self.n_coalesced = 0
+
+        if start_on_init:
+            self.start()
+
+    def start(self):
+        with self._cond:
+            if self._workers:
+                return
+            self._stopping = False
+            self._workers = [threading.Thread(target=self._work, daemon=True, name=f"event_dispatch_{ii}")
+                             for ii in range(self.n_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self, drain: bool = True, timeout: float = None):
+        if drain:
+            self.join(timeout=timeout)
+
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=timeout)
+        self._workers = []
+
+    def join(self, timeout: float = None) -> bool:
+        """Block until every queued event has been delivered. Returns False on timeout"""
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        with self._cond:
+            while self._queue or self._in_flight:
+                remaining = deadline - time.perf_counter() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    @staticmethod
+    def _coalesce_key(topic_name: str, kwargs: Dict[str, Any]) -> Optional[Tuple]:
+        station = getattr(kwargs.get('args', None), 'station', None)
+        if station is None:
+            return None
+        try:
+            return topic_name, station.id
+        except ReferenceError:
+            # weak event refs (long-run mode) to a station that is already gone
+            return None
+
+    def submit(self, topic_name: str, **kwargs):
+        if not self._workers:
+            raise EventDispatcherNotStartedException()
+
+        key = self._coalesce_key(topic_name, kwargs) \
+            if self.overflow_policy == EventQueueOverflowPolicy.COALESCE_PER_STATION else None
+
+        inline = None
+        with self._cond:
+            self.n_submitted += 1
+
+            if len(self._queue) >= self.max_queue_size:
+                pending = self._pending_by_key.get(key, None) if key is not None else None
+                if pending is not None:
+                    # only a full queue coalesces: replace the payload of the pending event, keeping its place (and
+                    # age) in the queue
+                    pending.kwargs = kwargs
+                    self.n_coalesced += 1
+                    return
+
+                if self.overflow_policy == EventQueueOverflowPolicy.BLOCK:
+                    if getattr(self._worker_local, 'is_worker', False):
+                        # raised by a handler: the worker cannot wait for room only it would make
+                        inline = _QueuedEvent(topic_name, kwargs, None)
+                    elif not self._cond.wait_for(lambda: len(self._queue) < self.max_queue_size or self._stopping,
+                                               timeout=self.block_timeout_s):
+                        self.n_dropped += 1
+                        logger.warning("event queue full, dropping %s after %ss", topic_name, self.block_timeout_s)
+                        return
+                else:
+                    if self.overflow_policy == EventQueueOverflowPolicy.COALESCE_PER_STATION:
+                        logger.debug("event queue full and no pending %s to coalesce into (key %s), dropping oldest",
+                                     topic_name, key)
+                    self._drop_oldest()
+
+            if inline is None:
+                entry = _QueuedEvent(topic_name, kwargs, key)
+                self._queue.append(entry)
+                if key is not None:
+                    self._pending_by_key[key] = entry
+                self._cond.notify()
+                return
+
+        self._dispatch(inline)
+
+    def _drop_oldest(self):
+        dropped = self._queue.popleft()
+        if dropped.coalesce_key is not None:
+            self._pending_by_key.pop(dropped.coalesce_key, None)
+        self.n_dropped += 1
+
+    def _work(self):
+        self._worker_local.is_worker = True
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                entry = self._queue.popleft()
+                if entry.coalesce_key is not None:
+                    self._pending_by_key.pop(entry.coalesce_key, None)
+                self._in_flight += 1
+                self._cond.notify_all()
+
+            try:
+                self._dispatch(entry)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _dispatch(self, entry: _QueuedEvent):
+        topic = pub.getDefaultTopicMgr().getTopic(entry.topic_name, okIfNone=True)
+        if topic is not None:
+            self._deliver(topic, entry)
+
+    def _deliver(self, topic, entry: _QueuedEvent):
+        for listener in topic.getListeners():
+            t0 = time.perf_counter()
+            failed = False
+            try:
+                listener(entry.kwargs, topic)
+            except Exception as e:
+                failed = True
+                logger.error("handler %s failed on %s: %s\n%s", listener.name(), entry.topic_name, e,
+                             traceback.format_exc())
+            t1 = time.perf_counter()
+
+            with self._metrics_lock:
+                metrics = self._handler_metrics.get(listener.name(), None)
+                if metrics is None:
+                    if len(self._handler_metrics) >= self.max_handler_metrics:
+                        del self._handler_metrics[next(iter(self._handler_metrics))]
+                    metrics = self._handler_metrics[listener.name()] = HandlerLagMetrics()
+                metrics.record(lag_s=t0 - entry.enqueued_perf, handle_s=t1 - t0)
+                if failed:
+                    metrics.errors += 1
+
+    @property
+    def HandlerMetrics(self) -> Dict[str, HandlerLagMetrics]:
+        with self._metrics_lock:
+            return dict(self._handler_metrics)
+
+    @property
+    def QueueDepth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def Started(self) -> bool:
+        return len(self._workers) > 0
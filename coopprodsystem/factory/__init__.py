@@ -1,5 +1,17 @@
 from .stationResourceDefinition import *
+from .stationStatus import *
+from .downtime import *
+from .lotTracking import *
 from .station import *
 from .stationTransfer import *
+from .lineProfiler import *
+from .transferAllocation import *
 from .productionLine import *
-
+from .sourceSink import *
+from .fastForward import *
+from .stateStream import *
+from .sharedState import *
+from .eventReplay import *
+from .lineOptimizer import *
+from .asyncProductionLine import *
+from .kpiEngine import *
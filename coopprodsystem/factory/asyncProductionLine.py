@@ -0,0 +1,216 @@
+import asyncio
+import threading
+import logging
+from typing import List, Dict, Set, Callable, Optional, AsyncIterator, Iterable, Tuple, Any
+from pubsub import pub
+from coopprodsystem.factory.station import Station
+from coopprodsystem.factory.productionLine import ProductionLine
+from coopstorage.my_dataclasses import ResourceUoM, Content
+import coopprodsystem.events as cevents
+
+logger = logging.getLogger(__name__)
+
+LineEvent = Tuple['cevents.ProductionEventType', Any]
+_Waiter = Tuple[Callable[[], bool], asyncio.Future]
+
+
+class LineAlreadyRunningAsyncException(Exception):
+    def __init__(self, id):
+        super().__init__(f"{id} is already running on its own worker thread")
+
+
+class AsyncStation:
+    """asyncio view over a Station that is stepped by an AsyncProductionLine"""
+
+    def __init__(self, station: Station, line: 'AsyncProductionLine'):
+        self._station = station
+        self._line = line
+
+    def __repr__(self):
+        return f"Async<{self._station.id}>"
+
+    async def wait_for_output(self, resource_uom: ResourceUoM, qty: float, timeout: float = None) -> float:
+        """Wait until at least qty of resource_uom is available at the output and return the available qty"""
+        await self._line.wait_until(lambda: self._station.available_output.get(resource_uom, 0) >= qty,
+                                    timeout=timeout)
+        return self._station.available_output.get(resource_uom, 0)
+
+    async def wait_for_status(self, status, timeout: float = None):
+        await self._line.wait_until(lambda: status in self._station.status, timeout=timeout)
+
+    async def add_input(self, inputs: List[Content]):
+        self._station.add_input(inputs)
+        self._line.notify()
+
+    async def remove_output(self, content: List[Content]) -> List[Content]:
+        removed = self._station.remove_output(content)
+        self._line.notify()
+        return removed
+
+    @property
+    def station(self) -> Station:
+        return self._station
+
+
+class AsyncProductionLine:
+    """asyncio facade over a ProductionLine.
+
+    The line and all of its stations are stepped by a single task on the running event loop instead of their own
+    worker threads, so station events are delivered to awaiting coroutines without any thread hand-off.
+    """
+
+    def __init__(self,
+                 line: ProductionLine,
+                 tick_s: float = 0.1,
+                 time_provider: Callable[[], float] = None):
+        if line._async_worker.started:
+            raise LineAlreadyRunningAsyncException(line.Id)
+        for station in line.Stations.values():
+            if station.AsyncStarted:
+                raise LineAlreadyRunningAsyncException(station.id)
+
+        self._line = line
+        self._tick_s = tick_s
+        self._time_provider = time_provider
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id = None
+        self._task: Optional[asyncio.Task] = None
+        self._waiters: List[_Waiter] = []
+        self._event_queues: List[Tuple[asyncio.Queue, Optional[frozenset]]] = []
+        self._async_stations: Dict[str, AsyncStation] = {}
+        # ids of the stations on the line, so events raised by other lines are not delivered
+        self._station_ids: Set[str] = set(str(x) for x in line.Stations)
+
+        for event_type in cevents.ProductionEventType:
+            pub.subscribe(self._on_event, event_type.name)
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+        self.close()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def close(self):
+        for event_type in cevents.ProductionEventType:
+            pub.unsubscribe(self._on_event, event_type.name)
+
+    async def _run(self):
+        while True:
+            self.tick()
+            await asyncio.sleep(self._tick_s)
+
+    def tick(self):
+        time_perf = self._time_provider() if self._time_provider else None
+        self._line.update(time_perf)
+        self.notify()
+
+    def notify(self):
+        """Re-evaluate pending waiters. Called after every tick and every async mutation"""
+        if not self._waiters:
+            return
+
+        pending = []
+        for predicate, future in self._waiters:
+            if future.done():
+                continue
+            if predicate():
+                future.set_result(True)
+            else:
+                pending.append((predicate, future))
+        self._waiters = pending
+
+    async def wait_until(self, predicate: Callable[[], bool], timeout: float = None):
+        if predicate():
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((predicate, future))
+        await asyncio.wait_for(future, timeout=timeout)
+
+    def _is_own_event(self, event_type: 'cevents.ProductionEventType', args) -> bool:
+        if isinstance(args, cevents.StationTransferEventArgsBase):
+            return str(args.transfer.from_id) in self._station_ids and str(args.transfer.to_id) in self._station_ids
+
+        id = str(args.station.id)
+        if event_type == cevents.ProductionEventType.STATION_REMOVED:
+            if id not in self._station_ids or id in self._line.Stations:
+                return False
+            self._station_ids.discard(id)
+            return True
+
+        if self._line.Stations.get(id, None) != args.station:
+            return False
+        self._station_ids.add(id)
+        return True
+
+    def _on_event(self, args, topic=pub.AUTO_TOPIC):
+        event = (cevents.ProductionEventType[topic.getName()], args)
+        if not self._is_own_event(event[0], args):
+            return
+        if self._loop is None or not self._event_queues:
+            return
+
+        if threading.get_ident() == self._loop_thread_id:
+            self._dispatch(event)
+        else:
+            self._loop.call_soon_threadsafe(self._dispatch, event)
+
+    def _dispatch(self, event: LineEvent):
+        for queue, event_types in self._event_queues:
+            if event_types is not None and event[0] not in event_types:
+                continue
+            if queue.full():
+                logger.warning("PL %s: async event queue full, dropping %s", self._line.Id, event[0].name)
+                continue
+            queue.put_nowait(event)
+
+    async def events(self,
+                     event_types: Iterable['cevents.ProductionEventType'] = None,
+                     maxsize: int = 0) -> AsyncIterator[LineEvent]:
+        """Yield (ProductionEventType, args) for every event raised by the line while iterating"""
+        entry = (asyncio.Queue(maxsize=maxsize), frozenset(event_types) if event_types is not None else None)
+        self._event_queues.append(entry)
+        # queued args are read after delivery, lines must not recycle the transfer records they reference meanwhile
+        cevents.register_deferred_consumer()
+        try:
+            while True:
+                yield await entry[0].get()
+        finally:
+            self._event_queues.remove(entry)
+            cevents.unregister_deferred_consumer()
+
+    def station(self, id: str) -> AsyncStation:
+        if id not in self._async_stations:
+            self._async_stations[id] = AsyncStation(self._line.Stations[id], self)
+        return self._async_stations[id]
+
+    @property
+    def Stations(self) -> Dict[str, AsyncStation]:
+        return {id: self.station(id) for id in self._line.Stations}
+
+    @property
+    def line(self) -> ProductionLine:
+        return self._line
+
+    @property
+    def Running(self) -> bool:
+        return self._task is not None
@@ -0,0 +1,133 @@
+import heapq
+import itertools
+import math
+import random
+from dataclasses import dataclass, replace
+from enum import auto
+from typing import Callable, List, Optional, Tuple, Any
+from cooptools.coopEnum import CoopEnum
+from coopprodsystem.factory.stationStatus import StationStatus
+
+
+class DowntimeType(CoopEnum):
+    BREAKDOWN = auto()
+    MAINTENANCE = auto()
+    CHANGEOVER = auto()
+
+
+DOWNTIME_STATUS = {
+    DowntimeType.BREAKDOWN: StationStatus.DOWN,
+    DowntimeType.MAINTENANCE: StationStatus.MAINTENANCE,
+    DowntimeType.CHANGEOVER: StationStatus.CHANGEOVER,
+}
+
+
+@dataclass(frozen=True)
+class DowntimeWindow:
+    start: float
+    duration_s: float
+    type: DowntimeType
+    on_complete: Optional[Callable[[Any], None]] = None
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration_s
+
+
+class FailureProcess:
+    """Exponentially distributed time between failures (MTBF) and time to repair (MTTR)"""
+
+    def __init__(self,
+                 mtbf_s: float,
+                 mttr_s: float,
+                 rng: random.Random = None,
+                 fixed_repair_time: bool = False):
+        if mtbf_s <= 0 or mttr_s <= 0:
+            raise ValueError(f"mtbf_s and mttr_s must be > 0, {mtbf_s}, {mttr_s} provided")
+
+        self.mtbf_s = mtbf_s
+        self.mttr_s = mttr_s
+        self.fixed_repair_time = fixed_repair_time
+        self._rng = rng or random.Random()
+
+    def time_to_failure(self) -> float:
+        return self._rng.expovariate(1 / self.mtbf_s)
+
+    def time_to_repair(self) -> float:
+        return self.mttr_s if self.fixed_repair_time else self._rng.expovariate(1 / self.mttr_s)
+
+    def next_breakdown(self, after_perf: float) -> DowntimeWindow:
+        return DowntimeWindow(start=after_perf + self.time_to_failure(),
+                              duration_s=self.time_to_repair(),
+                              type=DowntimeType.BREAKDOWN)
+
+
+class DowntimeSchedule:
+    """Upcoming downtime of one station, kept as a heap of windows.
+
+    Breakdowns are sampled one at a time from the failure process (the next one is drawn when the previous repair ends),
+    planned maintenance and changeovers are added explicitly. A window that starts while another is active begins when
+    the active one ends. Stations only consult the schedule when next_event_perf has passed, so there is no per-tick
+    random check.
+    """
+
+    def __init__(self,
+                 failure_process: FailureProcess = None,
+                 planned: List[DowntimeWindow] = None):
+        self.failure_process = failure_process
+        self._windows: List[Tuple[float, int, DowntimeWindow]] = []
+        self._seq = itertools.count()
+        self._current: Optional[DowntimeWindow] = None
+        self._initialized = failure_process is None
+
+        for window in planned or []:
+            self.schedule(window)
+
+    def schedule(self, window: DowntimeWindow):
+        heapq.heappush(self._windows, (window.start, next(self._seq), window))
+
+    def schedule_maintenance(self, start_perf: float, duration_s: float):
+        self.schedule(DowntimeWindow(start=start_perf, duration_s=duration_s, type=DowntimeType.MAINTENANCE))
+
+    def schedule_changeover(self, start_perf: float, duration_s: float, on_complete: Callable[[Any], None] = None):
+        self.schedule(DowntimeWindow(start=start_perf, duration_s=duration_s, type=DowntimeType.CHANGEOVER,
+                                     on_complete=on_complete))
+
+    @property
+    def next_event_perf(self) -> float:
+        if self._current is not None:
+            return self._current.end
+        if not self._initialized:
+            return -math.inf
+        return self._windows[0][0] if self._windows else math.inf
+
+    @property
+    def current(self) -> Optional[DowntimeWindow]:
+        return self._current
+
+    @property
+    def upcoming(self) -> List[DowntimeWindow]:
+        return [x[2] for x in sorted(self._windows)]
+
+    def advance(self, time_perf: float) -> List[Tuple[bool, DowntimeWindow]]:
+        """Apply every transition up to time_perf. Returns (started, window) pairs in the order they happened"""
+        if not self._initialized:
+            self._initialized = True
+            self.schedule(self.failure_process.next_breakdown(time_perf))
+
+        transitions = []
+        while self.next_event_perf <= time_perf:
+            if self._current is not None:
+                ended = self._current
+                self._current = None
+                transitions.append((False, ended))
+                if ended.type == DowntimeType.BREAKDOWN and self.failure_process is not None:
+                    self.schedule(self.failure_process.next_breakdown(ended.end))
+                continue
+
+            start, _, window = heapq.heappop(self._windows)
+            prev_end = transitions[-1][1].end if transitions and not transitions[-1][0] else start
+            self._current = replace(window, start=max(start, prev_end))
+            transitions.append((True, self._current))
+
+        return transitions
@@ -0,0 +1,257 @@
+import bisect
+import copy
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Callable, Deque, Dict, Iterable, List, Optional
+from pubsub import pub
+import coopprodsystem.events as cevents
+from coopprodsystem.factory.downtime import DowntimeSchedule, DowntimeWindow, DowntimeType
+from coopprodsystem.factory.productionLine import ProductionLine
+from coopprodsystem.factory.sourceSink import PoissonProfile
+from coopprodsystem.factory.stateStream import StateFrame, FrameType, line_snapshot, snapshot_delta, apply_frame
+
+logger = logging.getLogger(__name__)
+
+# station add/remove happen outside of line updates and do not define replay ticks
+_UNTIMED_EVENTS = ('STATION_ADDED', 'STATION_REMOVED')
+
+
+class UnreplayableProfileException(Exception):
+    def __init__(self, id):
+        super().__init__(f"{id} follows a PoissonProfile, whose sampled event times are not recorded")
+
+
+@dataclass(frozen=True)
+class RecordedEvent:
+    time_perf: Optional[float]
+    event_type: str
+    station_id: Optional[str] = None
+    to_station_id: Optional[str] = None
+    duration_s: Optional[float] = None
+    downtime_type: Optional[str] = None
+    downtime_start: Optional[float] = None
+
+    @property
+    def type(self) -> 'cevents.ProductionEventType':
+        return cevents.ProductionEventType[self.event_type]
+
+
+class EventRecorder:
+    """Records the ProductionEventType stream of a line with the time of the update that raised each event.
+
+    The sampled production time of every run (before expertise), the time of every transfer and every downtime window
+    are kept with the event, which is what EventReplay needs to reproduce the run without sampling.
+
+    With max_events only the most recent events are kept, for recorders left running on long runs. A truncated log
+    can not be replayed from the start.
+    """
+
+    def __init__(self,
+                 line: ProductionLine = None,
+                 time_provider: Callable[[], float] = None,
+                 start: bool = True,
+                 max_events: int = None):
+        self._line = line
+        self._time_provider = time_provider
+        self._events: Deque[RecordedEvent] = deque(maxlen=max_events)
+        self.n_recorded = 0
+        self._subscribed = False
+        if start:
+            self.start()
+
+    def start(self):
+        if self._subscribed:
+            return
+        for event_type in cevents.ProductionEventType:
+            pub.subscribe(self._on_event, event_type.name)
+        self._subscribed = True
+
+    def stop(self):
+        if not self._subscribed:
+            return
+        for event_type in cevents.ProductionEventType:
+            pub.unsubscribe(self._on_event, event_type.name)
+        self._subscribed = False
+
+    def _now(self) -> Optional[float]:
+        if self._time_provider is not None:
+            return self._time_provider()
+        if self._line is not None:
+            return self._line.LastUpdatePerf
+        return time.perf_counter()
+
+    def _on_event(self, args, topic=pub.AUTO_TOPIC):
+        name = topic.getName()
+        time_perf = None if name in _UNTIMED_EVENTS else self._now()
+
+        if isinstance(args, cevents.StationTransferEventArgsBase):
+            transfer = args.transfer
+            event = RecordedEvent(time_perf=time_perf,
+                                  event_type=name,
+                                  station_id=str(transfer.from_id),
+                                  to_station_id=str(transfer.to_id),
+                                  duration_s=transfer.timer.time_ms / 1000)
+        elif isinstance(args, (cevents.OnStationDowntimeStartedEventArgs, cevents.OnStationDowntimeEndedEventArgs)):
+            event = RecordedEvent(time_perf=time_perf,
+                                  event_type=name,
+                                  station_id=str(args.station.id),
+                                  duration_s=args.downtime.duration_s,
+                                  downtime_type=args.downtime.type.name,
+                                  downtime_start=args.downtime.start)
+        elif name == cevents.ProductionEventType.PRODUCTION_STARTED_AT_STATION.name:
+            event = RecordedEvent(time_perf=time_perf,
+                                  event_type=name,
+                                  station_id=str(args.station.id),
+                                  duration_s=args.station.last_sampled_prod_s)
+        else:
+            event = RecordedEvent(time_perf=time_perf, event_type=name, station_id=str(args.station.id))
+
+        self._events.append(event)
+        self.n_recorded += 1
+
+    @property
+    def events(self) -> List[RecordedEvent]:
+        return list(self._events)
+
+    @property
+    def max_events(self) -> Optional[int]:
+        return self._events.maxlen
+
+    def save(self, path: str):
+        save_event_log(self._events, path)
+
+
+def save_event_log(events: Iterable[RecordedEvent], path: str):
+    """One json object per line"""
+    with open(path, 'w') as f:
+        for event in events:
+            f.write(json.dumps(asdict(event)))
+            f.write('\n')
+
+
+def load_event_log(path: str) -> List[RecordedEvent]:
+    with open(path) as f:
+        return [RecordedEvent(**json.loads(line)) for line in f if line.strip()]
+
+
+class _RecordedTimings:
+    """Callback handing out recorded durations in order, falling back to the original callback once exhausted"""
+
+    def __init__(self, durations: Iterable[float], fallback: Callable[[], float]):
+        self._durations: Deque[float] = deque(durations)
+        self._fallback = fallback
+
+    def __call__(self) -> float:
+        if self._durations:
+            return self._durations.popleft()
+        return self._fallback()
+
+
+class EventReplay:
+    """Re-runs a recorded event log on a fresh line and answers "what did the line look like at time t".
+
+    The line from line_builder must have the same stations (ids) and relationships as the recorded one. Production and
+    transfer times are fed from the log instead of being sampled and downtime windows are re-scheduled as recorded;
+    the line is only updated at the recorded event times, so the replay costs one update per distinct event time.
+
+    Source and sink profile events are not recorded, so only deterministic profiles (constant, schedule) replay as
+    they ran. Lines with a PoissonProfile station are rejected with UnreplayableProfileException; replace the profile
+    with a ScheduleProfile of the arrival times to replay them.
+
+    After every update the line state is captured as a snapshot delta (see stateStream), with a full checkpoint every
+    checkpoint_every updates. state_at(t) finds the nearest checkpoint by binary search and applies at most
+    checkpoint_every - 1 deltas.
+    """
+
+    def __init__(self,
+                 events: List[RecordedEvent],
+                 line_builder: Callable[[], ProductionLine],
+                 checkpoint_every: int = 100,
+                 progress_resolution: float = 0.01):
+        if checkpoint_every < 1:
+            raise ValueError(f"checkpoint_every must be >= 1, {checkpoint_every} provided")
+
+        self._events = events
+        self._line_builder = line_builder
+        self.checkpoint_every = checkpoint_every
+        self.progress_resolution = progress_resolution
+
+        self._line: Optional[ProductionLine] = None
+        self._times: List[float] = []
+        self._frames: List[StateFrame] = []
+
+    def _prepare_line(self) -> ProductionLine:
+        line = self._line_builder()
+        for id, station in line.Stations.items():
+            if isinstance(getattr(station, 'profile', None), PoissonProfile):
+                raise UnreplayableProfileException(id)
+
+        started = cevents.ProductionEventType.PRODUCTION_STARTED_AT_STATION.name
+        transfer_started = cevents.ProductionEventType.STATION_TRANSFER_STARTED.name
+        downtime_started = cevents.ProductionEventType.STATION_DOWNTIME_STARTED.name
+
+        production_times: Dict[str, List[float]] = {}
+        downtimes: Dict[str, List[DowntimeWindow]] = {}
+        transfer_times = []
+        for event in self._events:
+            if event.event_type == started:
+                production_times.setdefault(event.station_id, []).append(event.duration_s)
+            elif event.event_type == transfer_started:
+                transfer_times.append(event.duration_s)
+            elif event.event_type == downtime_started:
+                downtimes.setdefault(event.station_id, []).append(DowntimeWindow(
+                    start=event.downtime_start, duration_s=event.duration_s, type=DowntimeType[event.downtime_type]))
+
+        for id, station in line.Stations.items():
+            station.production_timer_sec_callback = _RecordedTimings(production_times.get(str(id), []),
+                                                                     station.production_timer_sec_callback)
+            if station.downtime_schedule is not None or str(id) in downtimes:
+                station.set_downtime_schedule(DowntimeSchedule(planned=downtimes.get(str(id), [])))
+        line.TransferTimeSCallback = _RecordedTimings(transfer_times, line.TransferTimeSCallback)
+        return line
+
+    def run(self) -> ProductionLine:
+        """Replay the whole log. Returns the line in its final state"""
+        self._line = self._prepare_line()
+        self._times = sorted({x.time_perf for x in self._events
+                              if x.time_perf is not None and x.event_type not in _UNTIMED_EVENTS})
+        self._frames = []
+
+        prev = None
+        for ii, time_perf in enumerate(self._times):
+            self._line.update(time_perf)
+            snapshot = line_snapshot(self._line, time_perf, self.progress_resolution)
+            if ii % self.checkpoint_every == 0:
+                self._frames.append(StateFrame(FrameType.KEYFRAME, ii, time_perf, snapshot))
+            else:
+                self._frames.append(StateFrame(FrameType.DELTA, ii, time_perf, snapshot_delta(prev, snapshot)))
+            prev = snapshot
+
+        logger.info("replayed %s events over %s updates", len(self._events), len(self._times))
+        return self._line
+
+    def state_at(self, time_perf: float) -> Optional[Dict]:
+        """Line snapshot as of the last replayed update at or before time_perf, None before the first one"""
+        if self._line is None:
+            self.run()
+
+        idx = bisect.bisect_right(self._times, time_perf) - 1
+        if idx < 0:
+            return None
+
+        checkpoint = idx - idx % self.checkpoint_every
+        state = copy.deepcopy(self._frames[checkpoint].payload)
+        for frame in self._frames[checkpoint + 1:idx + 1]:
+            state = apply_frame(state, frame)
+        return state
+
+    @property
+    def times(self) -> List[float]:
+        return self._times
+
+    @property
+    def line(self) -> Optional[ProductionLine]:
+        return self._line
@@ -0,0 +1,164 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, Tuple
+from cooptools.expertise.expertiseArgs import ExpertiseArgs
+from coopprodsystem.factory.station import Station
+from coopprodsystem.factory.productionLine import ProductionLine
+from coopprodsystem.factory.sourceSink import SourceStation, SinkStation
+from coopstorage.my_dataclasses import ResourceUoM
+
+logger = logging.getLogger(__name__)
+
+_StationCounters = Tuple[int, float, Dict[ResourceUoM, float]]
+
+
+@dataclass
+class FastForwardResult:
+    end_perf: float
+    n_ticks_stepped: int
+    n_jumps: int
+    n_ticks_skipped: int
+
+    @property
+    def skipped_fraction(self) -> float:
+        total = self.n_ticks_stepped + self.n_ticks_skipped
+        return self.n_ticks_skipped / total if total else 0
+
+
+def _inventory_signature(inventory: Dict[ResourceUoM, float], round_digits: int) -> Tuple:
+    return tuple(sorted((ru.resource.name, ru.uom.name, round(qty, round_digits)) for ru, qty in inventory.items()))
+
+
+class FastForwardRunner:
+    """Steps a ProductionLine on a fixed virtual-time grid and skips over whole cycles once the line is periodic.
+
+    After every tick the line state (inventories, production timer phases, in-flight transfer phases, expertise) is
+    hashed relative to the current time. When a state repeats, the line is in a periodic steady state with a period of
+    (now - first seen); the runner then jumps as many whole periods as fit before end_perf, crediting each station with
+    the runs, producing time and output of the skipped periods in closed form and shifting every timer forward.
+
+    Only meaningful for deterministic timing callbacks. No production or transfer events are raised for skipped
+    cycles. Lines with downtime, lot tracking or profile-driven (source/sink) stations are always stepped.
+    """
+
+    def __init__(self,
+                 line: ProductionLine,
+                 tick_s: float,
+                 max_history: int = 10000,
+                 round_digits: int = 6):
+        if tick_s <= 0:
+            raise ValueError(f"tick_s must be > 0, {tick_s} provided")
+
+        self._line = line
+        self._tick_s = tick_s
+        self._max_history = max_history
+        self._round_digits = round_digits
+
+    def line_signature(self, time_perf: float) -> Tuple:
+        rd = self._round_digits
+        stations = []
+        for id, station in self._line.Stations.items():
+            phases = station.production_phases(time_perf)
+            stations.append((
+                str(id),
+                _inventory_signature(station.stored_inputs, rd),
+                _inventory_signature(station.available_output, rd),
+                tuple((round(elapsed, rd), time_ms) for elapsed, time_ms in phases),
+                round(station.expertise.PercExpert, rd),
+                type(station.current_exception).__name__,
+            ))
+
+        transfers = sorted(
+            (str(x.from_id),
+             str(x.to_id),
+             x.content.resourceUoM.resource.name,
+             x.content.resourceUoM.uom.name,
+             round(x.content.qty, rd),
+             round(time_perf - x.timer.start_perf, rd),
+             x.timer.time_ms) for x in self._line.StationTransfers
+        )
+
+        return tuple(stations), tuple(transfers)
+
+    def _counters(self) -> Dict[str, _StationCounters]:
+        return {id: (station.n_runs, station.s_producing, dict(station.produced_totals))
+                for id, station in self._line.Stations.items()}
+
+    def run(self, start_perf: float, end_perf: float) -> FastForwardResult:
+        seen: Dict[Tuple, Tuple[int, Dict[str, _StationCounters]]] = {}
+        n_ticks = int((end_perf - start_perf) / self._tick_s)
+        result = FastForwardResult(end_perf=start_perf, n_ticks_stepped=0, n_jumps=0, n_ticks_skipped=0)
+
+        tick = 0
+        while tick <= n_ticks:
+            time_perf = start_perf + tick * self._tick_s
+            self._line.update(time_perf)
+            result.n_ticks_stepped += 1
+            result.end_perf = time_perf
+
+            signature = self.line_signature(time_perf)
+            counters = self._counters()
+            prev = seen.get(signature, None)
+
+            if prev is not None:
+                period_ticks = tick - prev[0]
+                n_periods = (n_ticks - tick) // period_ticks
+                if n_periods > 0 and self._jump(prev[1], counters, n_periods, period_ticks * self._tick_s):
+                    skipped = n_periods * period_ticks
+                    tick += skipped
+                    result.n_jumps += 1
+                    result.n_ticks_skipped += skipped
+                    result.end_perf = start_perf + tick * self._tick_s
+                    logger.debug("fast forwarded %s periods of %s ticks", n_periods, period_ticks)
+                seen.clear()
+                tick += 1
+                continue
+
+            if len(seen) >= self._max_history:
+                seen.clear()
+            seen[signature] = (tick, counters)
+            tick += 1
+
+        return result
+
+    def _jump(self,
+              before: Dict[str, _StationCounters],
+              after: Dict[str, _StationCounters],
+              n_periods: int,
+              period_s: float) -> bool:
+        deltas = {}
+        for id, station in self._line.Stations.items():
+            # downtime is scheduled on absolute time, so a line with downtime is never treated as periodic
+            if id not in before or station.downtime_schedule is not None:
+                return False
+            # skipped runs would produce no lots
+            if station.lot_tracker is not None:
+                return False
+            # sources and sinks follow their demand profile, whose skipped events would not be credited to the tally
+            if isinstance(station, (SourceStation, SinkStation)):
+                return False
+            runs = after[id][0] - before[id][0]
+            s_producing = after[id][1] - before[id][1]
+            produced = {ru: qty - before[id][2].get(ru, 0) for ru, qty in after[id][2].items()}
+
+            # the state only stays periodic if the expertise level (and so production time) does not move
+            if not self._expertise_stable(station, runs * n_periods, s_producing * n_periods):
+                return False
+            deltas[id] = (runs, s_producing, produced)
+
+        for id, (runs, s_producing, produced) in deltas.items():
+            self._line.Stations[id].advance_counters(
+                n_runs=runs * n_periods,
+                s_producing=s_producing * n_periods,
+                produced={ru: qty * n_periods for ru, qty in produced.items() if qty}
+            )
+        self._line.shift_time(n_periods * period_s)
+        return True
+
+    @staticmethod
+    def _expertise_stable(station: Station, added_runs: int, added_s: float) -> bool:
+        if added_runs == 0 and added_s == 0:
+            return True
+        projected = ExpertiseArgs(n_runs=station.n_runs + added_runs,
+                                  accumulated_s=station.s_producing + added_s)
+        return station.expertise.schedule.perc_expert(projected) == station.expertise.PercExpert
@@ -0,0 +1,569 @@
+import bisect
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from pubsub import pub
+import coopprodsystem.events as cevents
+from coopstorage.my_dataclasses import ResourceUoM
+from coopprodsystem.factory.station import Station
+from coopprodsystem.factory.stationStatus import StationStatus
+from coopprodsystem.factory.productionLine import ProductionLine
+from coopprodsystem.factory.sourceSink import SinkStation
+
+logger = logging.getLogger(__name__)
+
+INPUT = 'input'
+OUTPUT = 'output'
+
+# (station id, INPUT/OUTPUT, resource_uom)
+BufferKey = Tuple[str, str, ResourceUoM]
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class EwmaRate:
+    """Exponentially weighted rate (qty per second) of events in continuous time. Each recorded qty adds qty / tau_s to
+    the rate, which decays by exp(-dt / tau_s) in between, so the rate of a steady stream converges to its true rate
+    with time constant tau_s"""
+
+    def __init__(self, tau_s: float):
+        if tau_s <= 0:
+            raise ValueError(f"tau_s must be > 0, {tau_s} provided")
+        self.tau_s = tau_s
+        self._rate = 0.0
+        self._last_perf: Optional[float] = None
+
+    def record(self, qty: float, time_perf: float):
+        self._rate = self.rate(time_perf) + qty / self.tau_s
+        if self._last_perf is None or time_perf > self._last_perf:
+            self._last_perf = time_perf
+
+    def rate(self, time_perf: float = None) -> float:
+        if self._last_perf is None:
+            return 0.0
+        if time_perf is None or time_perf <= self._last_perf:
+            return self._rate
+        return self._rate * math.exp(-(time_perf - self._last_perf) / self.tau_s)
+
+
+class P2Quantile:
+    """Streaming estimate of one quantile with the P-square algorithm (Jain & Chlamtac, 1985): five markers adjusted
+    with piecewise-parabolic interpolation, O(1) per sample and constant memory. Exact for the first five samples"""
+
+    def __init__(self, q: float):
+        if not 0 < q < 1:
+            raise ValueError(f"q must be in (0, 1), {q} provided")
+        self.q = q
+        self.count = 0
+        self._heights: List[float] = []
+        self._positions = [0, 1, 2, 3, 4]
+        self._desired = [0, 2 * q, 4 * q, 2 + 2 * q, 4]
+        self._increments = [0, q / 2, q, (1 + q) / 2, 1]
+
+    def record(self, x: float):
+        self.count += 1
+        h = self._heights
+        if self.count <= 5:
+            bisect.insort(h, x)
+            return
+
+        n = self._positions
+        if x < h[0]:
+            h[0] = x
+            k = 0
+        elif x >= h[4]:
+            h[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(h, x, 1, 4) - 1
+
+        for ii in range(k + 1, 5):
+            n[ii] += 1
+        for ii in range(5):
+            self._desired[ii] += self._increments[ii]
+
+        for ii in range(1, 4):
+            d = self._desired[ii] - n[ii]
+            if (d >= 1 and n[ii + 1] - n[ii] > 1) or (d <= -1 and n[ii - 1] - n[ii] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = h[ii] + d / (n[ii + 1] - n[ii - 1]) * (
+                        (n[ii] - n[ii - 1] + d) * (h[ii + 1] - h[ii]) / (n[ii + 1] - n[ii])
+                        + (n[ii + 1] - n[ii] - d) * (h[ii] - h[ii - 1]) / (n[ii] - n[ii - 1]))
+                if h[ii - 1] < parabolic < h[ii + 1]:
+                    h[ii] = parabolic
+                else:
+                    h[ii] = h[ii] + d * (h[ii + d] - h[ii]) / (n[ii + d] - n[ii])
+                n[ii] += d
+
+    def value(self) -> Optional[float]:
+        if self.count == 0:
+            return None
+        if self.count <= 5:
+            return self._heights[min(int(round(self.q * (self.count - 1))), self.count - 1)]
+        return self._heights[2]
+
+
+class RunningStats:
+    """Count, mean, min and max of a stream of samples, in constant memory"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def record(self, x: float):
+        self.count += 1
+        self.total += x
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+
+class TimeWeightedLevel:
+    """Current, maximum and time-weighted mean of a level (a buffer's inventory, runs in progress) that changes at
+    event times"""
+
+    def __init__(self):
+        self.level = 0.0
+        self.max_level = 0.0
+        self._area = 0.0
+        self._start_perf: Optional[float] = None
+        self._last_perf: Optional[float] = None
+
+    def set(self, level: float, time_perf: float):
+        if self._last_perf is None:
+            self._start_perf = self._last_perf = time_perf
+        elif time_perf > self._last_perf:
+            self._area += self.level * (time_perf - self._last_perf)
+            self._last_perf = time_perf
+        self.level = level
+        if level > self.max_level:
+            self.max_level = level
+
+    def add(self, delta: float, time_perf: float):
+        self.set(self.level + delta, time_perf)
+
+    def mean(self, time_perf: float = None) -> Optional[float]:
+        if self._start_perf is None:
+            return None
+        end = self._last_perf if time_perf is None else max(time_perf, self._last_perf)
+        elapsed = end - self._start_perf
+        if elapsed <= 0:
+            return self.level
+        return (self._area + self.level * (end - self._last_perf)) / elapsed
+
+
+class StatusTimeTally:
+    """Time a station spent in each StationStatus, from status samples taken at event times. Statuses are not exclusive
+    (a station can be PRODUCING and STARVED), so ratios do not sum to 1"""
+
+    def __init__(self):
+        self._seconds: Dict[StationStatus, float] = {}
+        self._current: Tuple[StationStatus, ...] = ()
+        self._start_perf: Optional[float] = None
+        self._since_perf: Optional[float] = None
+
+    def observe(self, statuses: List[StationStatus], time_perf: float):
+        if self._since_perf is None:
+            self._start_perf = self._since_perf = time_perf
+        elif time_perf > self._since_perf:
+            for status in self._current:
+                self._seconds[status] = self._seconds.get(status, 0.0) + time_perf - self._since_perf
+            self._since_perf = time_perf
+        self._current = tuple(statuses)
+
+    def seconds(self, status: StationStatus, time_perf: float = None) -> float:
+        ret = self._seconds.get(status, 0.0)
+        if status in self._current and time_perf is not None and time_perf > self._since_perf:
+            ret += time_perf - self._since_perf
+        return ret
+
+    def ratio(self, status: StationStatus, time_perf: float = None) -> Optional[float]:
+        if self._start_perf is None:
+            return None
+        end = self._since_perf if time_perf is None else max(time_perf, self._since_perf)
+        elapsed = end - self._start_perf
+        return self.seconds(status, end) / elapsed if elapsed > 0 else None
+
+    @property
+    def current(self) -> Tuple[StationStatus, ...]:
+        return self._current
+
+
+@dataclass(frozen=True)
+class LittlesLawCheck:
+    """L = lambda * W. ratio is observed L over lambda * W; far from 1 means runs were started/finished outside the
+    observed window or the KPIs missed events"""
+    wip: float
+    throughput: float
+    flow_time_s: float
+    ratio: Optional[float]
+
+
+class StationKpis:
+    def __init__(self, rate_tau_s: float, baseline_tau_s: float, quantiles: Tuple[float, ...]):
+        self.runs_started = 0
+        self.runs_finished = 0
+        self.completed_qty = 0.0
+        self.transfers_out = 0
+        self.transfers_in = 0
+        self.rate = EwmaRate(rate_tau_s)
+        self.baseline_rate = EwmaRate(baseline_tau_s)
+        self.cycle_time = RunningStats()
+        self.cycle_time_quantiles: Dict[float, P2Quantile] = {q: P2Quantile(q) for q in quantiles}
+        self.in_process = TimeWeightedLevel()
+        self.status = StatusTimeTally()
+        self.first_perf: Optional[float] = None
+        self.last_completed_total = 0.0
+        self.buffer_keys: List[BufferKey] = []
+
+    def throughput(self, time_perf: float) -> Optional[float]:
+        """Mean completed qty per second since the station was first seen"""
+        if self.first_perf is None or time_perf <= self.first_perf:
+            return None
+        return self.completed_qty / (time_perf - self.first_perf)
+
+    def littles_law(self, time_perf: float) -> Optional[LittlesLawCheck]:
+        if self.first_perf is None or time_perf <= self.first_perf or not self.cycle_time.count:
+            return None
+        wip = self.in_process.mean(time_perf)
+        throughput = self.runs_finished / (time_perf - self.first_perf)
+        flow_time = self.cycle_time.mean
+        expected = throughput * flow_time
+        return LittlesLawCheck(wip=wip, throughput=throughput, flow_time_s=flow_time,
+                               ratio=wip / expected if expected > 0 else None)
+
+    def as_dict(self, time_perf: float) -> Dict:
+        return {
+            'runs_started': self.runs_started,
+            'runs_finished': self.runs_finished,
+            'completed_qty': self.completed_qty,
+            'transfers_out': self.transfers_out,
+            'transfers_in': self.transfers_in,
+            'throughput': self.throughput(time_perf),
+            'ewma_rate': self.rate.rate(time_perf),
+            'baseline_rate': self.baseline_rate.rate(time_perf),
+            'cycle_time_mean_s': self.cycle_time.mean,
+            'cycle_time_max_s': self.cycle_time.max,
+            **{f'cycle_time_p{round(q * 100)}_s': x.value() for q, x in self.cycle_time_quantiles.items()},
+            'in_process': self.in_process.level,
+            'starved_ratio': self.status.ratio(StationStatus.STARVED, time_perf),
+            'blocked_ratio': self.status.ratio(StationStatus.FULL, time_perf),
+            'producing_ratio': self.status.ratio(StationStatus.PRODUCING, time_perf),
+        }
+
+
+class KpiEngine:
+    """Streaming line KPIs fed by the ProductionEventType stream.
+
+    Every event updates only the stations it concerns: run and transfer counts, completed qty with a short (rate_tau_s)
+    and a long (baseline_tau_s) exponentially weighted rate, cycle time (start to finish of a run, paired first-in
+    first-out) with P-square quantile sketches, the inventory of each of the station's buffers and its status, from which
+    starved/blocked time ratios are kept. In-transit WIP follows transfer events. Work per event is bounded by the
+    number of buffers on one station and queries read the running values, so neither grows with the length of the run.
+
+    Event times come from time_provider, else the LastUpdatePerf of the line (events before its first update are
+    ignored), else perf_counter. Sinks count what they
+    consume as completed qty and line throughput is the completed qty of stations with no consumers in the line (or,
+    without a line, of sinks). Runs credited without events (fast-forward) are not seen. No station references are
+    kept, so the engine is safe to leave running in long-run mode.
+    """
+
+    def __init__(self,
+                 line: ProductionLine = None,
+                 time_provider: Callable[[], float] = None,
+                 rate_tau_s: float = 60,
+                 baseline_tau_s: float = 600,
+                 quantiles: Tuple[float, ...] = DEFAULT_QUANTILES,
+                 start: bool = True):
+        self._line = line
+        self._time_provider = time_provider
+        self.rate_tau_s = rate_tau_s
+        self.baseline_tau_s = baseline_tau_s
+        self.quantiles = tuple(quantiles)
+
+        self._lock = threading.Lock()
+        self._stations: Dict[str, StationKpis] = {}
+        self._buffers: Dict[BufferKey, TimeWeightedLevel] = {}
+        self._wip = TimeWeightedLevel()
+        self._in_transit = TimeWeightedLevel()
+        self._line_qty = 0.0
+        self._line_rate = EwmaRate(rate_tau_s)
+        self._line_baseline_rate = EwmaRate(baseline_tau_s)
+        self._first_perf: Optional[float] = None
+        self._last_perf: Optional[float] = None
+        self.n_events = 0
+
+        self._handlers = {
+            cevents.ProductionEventType.STATION_ADDED.name: self._on_station_added,
+            cevents.ProductionEventType.STATION_REMOVED.name: self._on_station_removed,
+            cevents.ProductionEventType.PRODUCTION_STARTED_AT_STATION.name: self._on_production_started,
+            cevents.ProductionEventType.PRODUCTION_FINISHED_AT_STATION.name: self._on_production_finished,
+            cevents.ProductionEventType.STATION_TRANSFER_STARTED.name: self._on_transfer_started,
+            cevents.ProductionEventType.STATION_TRANSFER_COMPLETED.name: self._on_transfer_completed,
+            cevents.ProductionEventType.STATION_TRANSFER_CANCELLED.name: self._on_transfer_cancelled,
+            cevents.ProductionEventType.STATION_DOWNTIME_STARTED.name: self._on_station_changed,
+            cevents.ProductionEventType.STATION_DOWNTIME_ENDED.name: self._on_station_changed,
+        }
+        self._subscribed = False
+        if start:
+            self.start()
+
+    def start(self):
+        if self._subscribed:
+            return
+        for event_type in cevents.ProductionEventType:
+            pub.subscribe(self._on_event, event_type.name)
+        self._subscribed = True
+
+    def stop(self):
+        if not self._subscribed:
+            return
+        for event_type in cevents.ProductionEventType:
+            pub.unsubscribe(self._on_event, event_type.name)
+        self._subscribed = False
+
+    def _now(self) -> Optional[float]:
+        if self._time_provider is not None:
+            return self._time_provider()
+        if self._line is not None:
+            return self._line.LastUpdatePerf
+        return time.perf_counter()
+
+    def _on_event(self, args, topic=pub.AUTO_TOPIC):
+        time_perf = self._now()
+        # raised before the first update of the line (e.g. stations added on construction), the stations are sampled
+        # on their first timed event instead
+        if time_perf is None:
+            return
+
+        with self._lock:
+            if self._first_perf is None:
+                self._first_perf = time_perf
+            self._last_perf = max(time_perf, self._last_perf) if self._last_perf is not None else time_perf
+            self.n_events += 1
+            self._handlers[topic.getName()](args, time_perf)
+
+    # -- event handlers ------------------------------------------------------------------------------------------------
+
+    def _station(self, id: str, time_perf: float) -> StationKpis:
+        kpis = self._stations.get(id, None)
+        if kpis is None:
+            kpis = self._stations[id] = StationKpis(self.rate_tau_s, self.baseline_tau_s, self.quantiles)
+            kpis.first_perf = time_perf
+        return kpis
+
+    def _set_buffer(self, key: BufferKey, level: float, time_perf: float):
+        buffer = self._buffers.get(key, None)
+        if buffer is None:
+            buffer = self._buffers[key] = TimeWeightedLevel()
+        delta = level - buffer.level
+        if delta:
+            self._wip.add(delta, time_perf)
+        buffer.set(level, time_perf)
+
+    def _sample_station(self, station: Station, time_perf: float) -> StationKpis:
+        """Refresh the buffers, runs in progress and status of one station"""
+        id = str(station.id)
+        kpis = self._station(id, time_perf)
+        if not kpis.buffer_keys:
+            kpis.buffer_keys = [(id, INPUT, x.content.resourceUoM) for x in station.input_reqs] + \
+                               [(id, OUTPUT, x.content.resourceUoM) for x in station.outputs]
+        stored, available = station.stored_inputs, station.available_output
+        for key in kpis.buffer_keys:
+            self._set_buffer(key, (stored if key[1] == INPUT else available).get(key[2], 0.0), time_perf)
+        kpis.in_process.set(station.active_productions, time_perf)
+        kpis.status.observe(station.status, time_perf)
+        return kpis
+
+    def _transfer_station(self, id: str, station: Station) -> Optional[Station]:
+        """The line's current station for id (the transfer's may have been replaced since), None once it is gone"""
+        if self._line is not None:
+            return self._line.Stations.get(str(id), None)
+        try:
+            station.id
+        except ReferenceError:
+            return None
+        return station
+
+    def _is_line_exit(self, station: Station) -> bool:
+        if self._line is not None:
+            return not self._line.check_connections_from_station(str(station.id))
+        return isinstance(station, SinkStation)
+
+    def _on_station_added(self, args, time_perf: float):
+        self._sample_station(args.station, time_perf)
+
+    def _on_station_removed(self, args, time_perf: float):
+        kpis = self._stations.get(str(args.station.id), None)
+        if kpis is not None:
+            for key in kpis.buffer_keys:
+                self._set_buffer(key, 0, time_perf)
+            kpis.in_process.set(0, time_perf)
+            kpis.status.observe([], time_perf)
+
+    def _on_station_changed(self, args, time_perf: float):
+        self._sample_station(args.station, time_perf)
+
+    def _on_production_started(self, args, time_perf: float):
+        kpis = self._sample_station(args.station, time_perf)
+        kpis.runs_started += 1
+
+    def _on_production_finished(self, args, time_perf: float):
+        station = args.station
+        kpis = self._sample_station(station, time_perf)
+        kpis.runs_finished += 1
+        # runs of multi-slot stations finish out of order, each finish carries the start of its own run
+        if args.start_perf is not None:
+            cycle_time = max(time_perf - args.start_perf, 0)
+            kpis.cycle_time.record(cycle_time)
+            for sketch in kpis.cycle_time_quantiles.values():
+                sketch.record(cycle_time)
+
+        # sinks complete what they consumed, every other station what it produced
+        total = station.tally.total_qty if isinstance(station, SinkStation) else sum(station.produced_totals.values())
+        qty = total - kpis.last_completed_total
+        kpis.last_completed_total = total
+        if qty <= 0:
+            return
+        kpis.completed_qty += qty
+        kpis.rate.record(qty, time_perf)
+        kpis.baseline_rate.record(qty, time_perf)
+
+        if self._is_line_exit(station):
+            self._line_qty += qty
+            self._line_rate.record(qty, time_perf)
+            self._line_baseline_rate.record(qty, time_perf)
+
+    def _on_transfer_started(self, args, time_perf: float):
+        transfer = args.transfer
+        self._in_transit.add(transfer.content.qty, time_perf)
+        self._wip.add(transfer.content.qty, time_perf)
+        station = self._transfer_station(transfer.from_id, transfer.from_station)
+        if station is not None:
+            self._sample_station(station, time_perf).transfers_out += 1
+
+    def _on_transfer_completed(self, args, time_perf: float):
+        transfer = args.transfer
+        self._in_transit.add(-transfer.content.qty, time_perf)
+        self._wip.add(-transfer.content.qty, time_perf)
+        station = self._transfer_station(transfer.to_id, transfer.to_station)
+        if station is not None:
+            self._sample_station(station, time_perf).transfers_in += 1
+
+    def _on_transfer_cancelled(self, args, time_perf: float):
+        transfer = args.transfer
+        self._in_transit.add(-transfer.content.qty, time_perf)
+        self._wip.add(-transfer.content.qty, time_perf)
+        # anything returned went back to the source's output
+        station = self._transfer_station(transfer.from_id, transfer.from_station)
+        if station is not None:
+            self._sample_station(station, time_perf)
+
+    # -- queries -------------------------------------------------------------------------------------------------------
+
+    def _query_time(self, time_perf: Optional[float]) -> Optional[float]:
+        if time_perf is not None:
+            return time_perf
+        return self._last_perf
+
+    def station_kpis(self, station_id: str, time_perf: float = None) -> Optional[Dict]:
+        with self._lock:
+            kpis = self._stations.get(str(station_id), None)
+            return kpis.as_dict(self._query_time(time_perf)) if kpis is not None else None
+
+    def throughput(self, station_id: str, time_perf: float = None) -> float:
+        """Short-term (ewma) completed qty per second of one station"""
+        with self._lock:
+            kpis = self._stations.get(str(station_id), None)
+            return kpis.rate.rate(self._query_time(time_perf)) if kpis is not None else 0.0
+
+    def ratio(self, station_id: str, status: StationStatus, time_perf: float = None) -> Optional[float]:
+        """Share of the time since the station was first seen that it spent in status"""
+        with self._lock:
+            kpis = self._stations.get(str(station_id), None)
+            return kpis.status.ratio(status, self._query_time(time_perf)) if kpis is not None else None
+
+    def starved_ratio(self, station_id: str, time_perf: float = None) -> Optional[float]:
+        return self.ratio(station_id, StationStatus.STARVED, time_perf)
+
+    def blocked_ratio(self, station_id: str, time_perf: float = None) -> Optional[float]:
+        return self.ratio(station_id, StationStatus.FULL, time_perf)
+
+    def cycle_time_quantile(self, station_id: str, q: float) -> Optional[float]:
+        with self._lock:
+            kpis = self._stations.get(str(station_id), None)
+            sketch = kpis.cycle_time_quantiles.get(q, None) if kpis is not None else None
+            return sketch.value() if sketch is not None else None
+
+    def buffer_wip(self, key: BufferKey, time_perf: float = None) -> Optional[Dict]:
+        """{'level', 'mean', 'max'} of one buffer"""
+        with self._lock:
+            buffer = self._buffers.get(key, None)
+            if buffer is None:
+                return None
+            return {'level': buffer.level, 'mean': buffer.mean(self._query_time(time_perf)), 'max': buffer.max_level}
+
+    def wip(self, time_perf: float = None) -> Dict:
+        """{'level', 'mean', 'max', 'in_transit'} of the line: every buffer plus material in transit"""
+        with self._lock:
+            time_perf = self._query_time(time_perf)
+            return {'level': self._wip.level, 'mean': self._wip.mean(time_perf), 'max': self._wip.max_level,
+                    'in_transit': self._in_transit.level}
+
+    def line_throughput(self, time_perf: float = None) -> float:
+        """Short-term (ewma) qty per second leaving the line"""
+        with self._lock:
+            return self._line_rate.rate(self._query_time(time_perf))
+
+    def littles_law(self, station_id: str, time_perf: float = None) -> Optional[LittlesLawCheck]:
+        """Runs in process at the station vs run completion rate * mean cycle time"""
+        with self._lock:
+            kpis = self._stations.get(str(station_id), None)
+            return kpis.littles_law(self._query_time(time_perf)) if kpis is not None else None
+
+    def line_flow_time(self, time_perf: float = None) -> Optional[float]:
+        """Mean time material spends in the line by Little's law: mean WIP / mean exit rate"""
+        with self._lock:
+            time_perf = self._query_time(time_perf)
+            if self._first_perf is None or time_perf is None or time_perf <= self._first_perf or self._line_qty <= 0:
+                return None
+            return self._wip.mean(time_perf) / (self._line_qty / (time_perf - self._first_perf))
+
+    def throughput_drops(self, drop_ratio: float = 0.5, time_perf: float = None) -> List[str]:
+        """Stations whose short-term rate fell below drop_ratio of their long-term (baseline) rate"""
+        with self._lock:
+            time_perf = self._query_time(time_perf)
+            return [id for id, kpis in self._stations.items()
+                    if kpis.baseline_rate.rate(time_perf) > 0
+                    and kpis.rate.rate(time_perf) < drop_ratio * kpis.baseline_rate.rate(time_perf)]
+
+    def snapshot(self, time_perf: float = None) -> Dict:
+        with self._lock:
+            time_perf = self._query_time(time_perf)
+            return {
+                'time_perf': time_perf,
+                'n_events': self.n_events,
+                'line': {
+                    'completed_qty': self._line_qty,
+                    'ewma_rate': self._line_rate.rate(time_perf),
+                    'baseline_rate': self._line_baseline_rate.rate(time_perf),
+                    'wip': self._wip.level,
+                    'mean_wip': self._wip.mean(time_perf),
+                    'in_transit': self._in_transit.level,
+                },
+                'stations': {id: kpis.as_dict(time_perf) for id, kpis in self._stations.items()},
+            }
+
+    @property
+    def station_ids(self) -> List[str]:
+        return list(self._stations.keys())
@@ -0,0 +1,272 @@
+import logging
+import random
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from coopstorage.my_dataclasses import ResourceUoM
+from coopprodsystem.factory.stationResourceDefinition import StationResourceDefinition
+from coopprodsystem.factory.station import Station, StationProductionStrategy
+from coopprodsystem.factory.productionLine import ProductionLine
+from coopprodsystem.factory.transferAllocation import TransferAllocationStrategy
+
+logger = logging.getLogger(__name__)
+
+INPUT = 'input'
+OUTPUT = 'output'
+
+# (station id, INPUT/OUTPUT, resource_uom)
+CapacityKey = Tuple[str, str, ResourceUoM]
+
+
+@dataclass(frozen=True)
+class LineConfig:
+    capacities: Tuple[Tuple[CapacityKey, int], ...] = ()
+    strategies: Tuple[Tuple[str, StationProductionStrategy], ...] = ()
+    transfer_allocation_strategy: Optional[TransferAllocationStrategy] = None
+
+    @property
+    def capacity_map(self) -> Dict[CapacityKey, int]:
+        return dict(self.capacities)
+
+    @property
+    def strategy_map(self) -> Dict[str, StationProductionStrategy]:
+        return dict(self.strategies)
+
+
+LineBuilder = Callable[[LineConfig], ProductionLine]
+
+
+@dataclass(frozen=True)
+class LineEvaluation:
+    config: LineConfig
+    throughput: float
+    mean_wip: float
+    score: float
+
+
+@dataclass
+class SearchSpace:
+    capacities: Dict[CapacityKey, Sequence[int]] = field(default_factory=dict)
+    strategies: Dict[str, Sequence[StationProductionStrategy]] = field(default_factory=dict)
+    transfer_allocation_strategies: Sequence[TransferAllocationStrategy] = ()
+
+    def _genes(self) -> List[Tuple[str, object, Sequence]]:
+        genes = [('capacity', key, tuple(options)) for key, options in self.capacities.items()]
+        genes += [('strategy', key, tuple(options)) for key, options in self.strategies.items()]
+        if self.transfer_allocation_strategies:
+            genes.append(('transfer', None, tuple(self.transfer_allocation_strategies)))
+        return genes
+
+    def config(self, genome: Tuple[int, ...]) -> LineConfig:
+        capacities, strategies, transfer = [], [], None
+        for (kind, key, options), idx in zip(self._genes(), genome):
+            if kind == 'capacity':
+                capacities.append((key, options[idx]))
+            elif kind == 'strategy':
+                strategies.append((key, options[idx]))
+            else:
+                transfer = options[idx]
+        return LineConfig(capacities=tuple(capacities), strategies=tuple(strategies),
+                          transfer_allocation_strategy=transfer)
+
+    def random_genome(self, rng: random.Random) -> Tuple[int, ...]:
+        return tuple(rng.randrange(len(options)) for _, _, options in self._genes())
+
+    @property
+    def gene_sizes(self) -> List[int]:
+        return [len(options) for _, _, options in self._genes()]
+
+    @property
+    def size(self) -> int:
+        ret = 1
+        for n in self.gene_sizes:
+            ret *= n
+        return ret
+
+
+def configure_station(template: Station, config: LineConfig, id: str = None) -> Station:
+    """New station from a template with the buffer capacities and production strategy of the config applied"""
+    id = id or template.id
+    capacities = config.capacity_map
+
+    def _defs(defs: List[StationResourceDefinition], side: str) -> List[StationResourceDefinition]:
+        return [StationResourceDefinition(content=x.content,
+                                          storage_capacity=capacities.get((id, side, x.content.resourceUoM),
+                                                                          x.storage_capacity))
+                for x in defs]
+
+    return Station(
+        id=id,
+        type=template.type,
+        input_reqs=_defs(template.input_reqs, INPUT),
+        output=_defs(template.outputs, OUTPUT),
+        production_timer_sec_callback=template.production_timer_sec_callback,
+        production_strategy=config.strategy_map.get(id, template.production_strategy),
+        expertise_schedule=template.expertise.schedule,
+        production_slots=template.production_slots,
+    )
+
+
+def build_line_from_config(templates: Dict[str, Station],
+                           relationships: Dict[str, List[Tuple[str, List[ResourceUoM]]]],
+                           config: LineConfig,
+                           **line_kwargs) -> ProductionLine:
+    """ProductionLine of configured copies of the templates. relationships is to_id -> [(from_id, resource_uoms)]"""
+    stations = {id: configure_station(template, config, id=id) for id, template in templates.items()}
+    line_kwargs.setdefault('start_on_init', False)
+    if config.transfer_allocation_strategy is not None:
+        line_kwargs['transfer_allocation_strategy'] = config.transfer_allocation_strategy
+
+    return ProductionLine(
+        init_stations=[(station, (ii, ii)) for ii, station in enumerate(stations.values())],
+        init_relationship_map={stations[to]: [(stations[frm], rus) for frm, rus in froms]
+                               for to, froms in relationships.items()},
+        **line_kwargs
+    )
+
+
+def evaluate_line_config(builder: LineBuilder,
+                         config: LineConfig,
+                         sim_s: float,
+                         tick_s: float,
+                         wip_weight: float,
+                         warmup_s: float = 0) -> LineEvaluation:
+    """Run the configured line in virtual time. Output of end stations (no consumers) is drained every tick and counted
+    as throughput; WIP is the stored + in-transit qty averaged over the ticks after warmup_s"""
+    line = builder(config)
+    end_stations = [station for id, station in line.Stations.items() if not line.check_connections_from_station(id)]
+
+    n_ticks = int(sim_s / tick_s)
+    drained = 0.0
+    wip_total = 0.0
+    n_measured = 0
+    for tick in range(1, n_ticks + 1):
+        time_perf = tick * tick_s
+        line.update(time_perf)
+
+        measuring = time_perf > warmup_s
+        for station in end_stations:
+            output = station.available_output_as_content
+            if output:
+                removed = station.remove_output(output)
+                if measuring:
+                    drained += sum(x.qty for x in removed)
+
+        if measuring:
+            wip_total += sum(sum(x.stored_inputs.values()) + sum(x.available_output.values())
+                             for x in line.Stations.values())
+            wip_total += sum(x.content.qty for x in line.StationTransfers)
+            n_measured += 1
+
+    measured_s = max(sim_s - warmup_s, tick_s)
+    throughput = drained / measured_s
+    mean_wip = wip_total / n_measured if n_measured else 0.0
+    return LineEvaluation(config=config,
+                          throughput=throughput,
+                          mean_wip=mean_wip,
+                          score=throughput - wip_weight * mean_wip)
+
+
+class LineOptimizer:
+    """Genetic search over buffer capacities, production strategies and the transfer allocation strategy.
+
+    Each generation the not-yet-seen configurations are simulated in parallel on the executor (a process pool by
+    default, so builder must be a picklable module-level function), results are cached by configuration, and the next
+    generation is bred from the best by tournament selection, uniform crossover and per-gene mutation with elitism.
+    The score maximised is throughput - wip_weight * mean WIP.
+    """
+
+    def __init__(self,
+                 builder: LineBuilder,
+                 search_space: SearchSpace,
+                 sim_s: float = 300,
+                 tick_s: float = 1,
+                 wip_weight: float = 0.01,
+                 warmup_s: float = 0,
+                 population_size: int = 16,
+                 n_elite: int = 2,
+                 mutation_rate: float = 0.2,
+                 tournament_size: int = 3,
+                 executor: Executor = None,
+                 n_workers: int = None,
+                 seed: int = None):
+        if population_size < 2:
+            raise ValueError(f"population_size must be >= 2, {population_size} provided")
+
+        self._builder = builder
+        self.search_space = search_space
+        self.sim_s = sim_s
+        self.tick_s = tick_s
+        self.wip_weight = wip_weight
+        self.warmup_s = warmup_s
+        self.population_size = population_size
+        self.n_elite = min(n_elite, population_size)
+        self.mutation_rate = mutation_rate
+        self.tournament_size = tournament_size
+        self._executor = executor
+        self._n_workers = n_workers
+        self._rng = random.Random(seed)
+        self._cache: Dict[LineConfig, LineEvaluation] = {}
+        self.n_simulations = 0
+
+    @property
+    def cache(self) -> Dict[LineConfig, LineEvaluation]:
+        return self._cache
+
+    def evaluate(self, configs: List[LineConfig], executor: Executor = None) -> List[LineEvaluation]:
+        todo = list(dict.fromkeys(x for x in configs if x not in self._cache))
+        if todo:
+            args = (self.sim_s, self.tick_s, self.wip_weight, self.warmup_s)
+            if executor is None:
+                results = [evaluate_line_config(self._builder, x, *args) for x in todo]
+            else:
+                futures = [executor.submit(evaluate_line_config, self._builder, x, *args) for x in todo]
+                results = [x.result() for x in futures]
+            for result in results:
+                self._cache[result.config] = result
+            self.n_simulations += len(todo)
+        return [self._cache[x] for x in configs]
+
+    def _tournament(self, scored: List[Tuple[Tuple[int, ...], float]]) -> Tuple[int, ...]:
+        entrants = self._rng.sample(scored, min(self.tournament_size, len(scored)))
+        return max(entrants, key=lambda x: x[1])[0]
+
+    def _breed(self, a: Tuple[int, ...], b: Tuple[int, ...]) -> Tuple[int, ...]:
+        child = []
+        for gene_a, gene_b, n_options in zip(a, b, self.search_space.gene_sizes):
+            gene = gene_a if self._rng.random() < 0.5 else gene_b
+            if n_options > 1 and self._rng.random() < self.mutation_rate:
+                gene = self._rng.randrange(n_options)
+            child.append(gene)
+        return tuple(child)
+
+    def run(self, n_generations: int = 10) -> LineEvaluation:
+        """Best configuration found after n_generations"""
+        owns_executor = self._executor is None and self._n_workers != 1
+        executor = self._executor or (ProcessPoolExecutor(max_workers=self._n_workers) if owns_executor else None)
+
+        try:
+            population = [self.search_space.random_genome(self._rng) for _ in range(self.population_size)]
+            best: Optional[LineEvaluation] = None
+            for generation in range(n_generations):
+                evaluations = self.evaluate([self.search_space.config(x) for x in population], executor)
+                scored = sorted(((genome, result.score) for genome, result in zip(population, evaluations)),
+                                key=lambda x: x[1], reverse=True)
+                generation_best = max(evaluations, key=lambda x: x.score)
+                if best is None or generation_best.score > best.score:
+                    best = generation_best
+                logger.info("generation %s: best score %s (throughput %s, wip %s), %s configs simulated",
+                            generation, round(best.score, 4), round(best.throughput, 4), round(best.mean_wip, 2),
+                            self.n_simulations)
+
+                if self.n_simulations >= self.search_space.size:
+                    break
+
+                population = [x[0] for x in scored[:self.n_elite]]
+                while len(population) < self.population_size:
+                    population.append(self._breed(self._tournament(scored), self._tournament(scored)))
+
+            return best
+        finally:
+            if owns_executor:
+                executor.shutdown()
@@ -0,0 +1,198 @@
+import cProfile
+import io
+import pstats
+import tracemalloc
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, TextIO
+
+logger = logging.getLogger(__name__)
+
+# bucket i holds durations in [2^(i-1), 2^i) microseconds; bucket 0 holds anything under 1us
+N_HISTOGRAM_BUCKETS = 32
+
+
+class TimingHistogram:
+    """Fixed-size log2 histogram of durations. Recording is O(1) and memory does not grow with samples"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_s = 0.0
+        self.min_s = None
+        self.max_s = None
+        self.buckets: List[int] = [0] * N_HISTOGRAM_BUCKETS
+
+    def record(self, duration_s: float):
+        self.count += 1
+        self.total_s += duration_s
+        if self.min_s is None or duration_s < self.min_s:
+            self.min_s = duration_s
+        if self.max_s is None or duration_s > self.max_s:
+            self.max_s = duration_s
+        self.buckets[min(int(duration_s * 1_000_000).bit_length(), N_HISTOGRAM_BUCKETS - 1)] += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound (in seconds) of the bucket that contains the q-th quantile"""
+        if self.count == 0:
+            return None
+
+        target = q * self.count
+        running = 0
+        for ii, n in enumerate(self.buckets):
+            running += n
+            if running >= target and n > 0:
+                return min((2 ** ii) / 1_000_000, self.max_s)
+        return self.max_s
+
+    @property
+    def mean_s(self) -> Optional[float]:
+        return self.total_s / self.count if self.count else None
+
+    def as_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'total_s': self.total_s,
+            'mean_s': self.mean_s,
+            'min_s': self.min_s,
+            'max_s': self.max_s,
+            'p50_s': self.quantile(0.5),
+            'p99_s': self.quantile(0.99),
+        }
+
+    def reset(self):
+        self.count = 0
+        self.total_s = 0.0
+        self.min_s = None
+        self.max_s = None
+        self.buckets = [0] * N_HISTOGRAM_BUCKETS
+
+
+@dataclass
+class ProfileCapture:
+    n_ticks: int
+    stats: Optional[pstats.Stats] = None
+    tracemalloc_top: List[tracemalloc.StatisticDiff] = field(default_factory=list)
+
+    def print_stats(self, stream: TextIO = None, sort_by: str = 'cumulative', limit: int = 25):
+        if self.stats is None:
+            return
+        self.stats.stream = stream or self.stats.stream
+        self.stats.sort_stats(sort_by).print_stats(limit)
+
+
+class LineProfiler:
+    """Collects per-phase and per-station tick timings for a ProductionLine and optionally captures a cProfile and/or
+    tracemalloc window over the next N ticks"""
+
+    PHASES = ['update', 'check_update_stations', 'check_create_transfers', 'check_handle_transfers']
+
+    def __init__(self):
+        self.phase_timings: Dict[str, TimingHistogram] = {x: TimingHistogram() for x in self.PHASES}
+        self.station_timings: Dict[str, TimingHistogram] = {}
+        self.last_capture: Optional[ProfileCapture] = None
+
+        self._capture_remaining = 0
+        self._capture: Optional[ProfileCapture] = None
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._tracemalloc_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._started_tracemalloc = False
+
+    def record_phase(self, phase: str, duration_s: float):
+        self.phase_timings[phase].record(duration_s)
+
+    def record_station(self, station_id: str, duration_s: float):
+        hist = self.station_timings.get(station_id, None)
+        if hist is None:
+            hist = self.station_timings[station_id] = TimingHistogram()
+        hist.record(duration_s)
+
+    def capture(self, n_ticks: int, cprofile: bool = True, trace_malloc: bool = False):
+        """Profile the next n_ticks calls to ProductionLine.update(). Results land in last_capture"""
+        if n_ticks < 1:
+            raise ValueError(f"n_ticks must be >= 1, {n_ticks} provided")
+
+        self._capture_remaining = n_ticks
+        self._capture = ProfileCapture(n_ticks=n_ticks)
+        self._cprofile = cProfile.Profile() if cprofile else None
+        if trace_malloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            self._tracemalloc_snapshot = tracemalloc.take_snapshot()
+
+    @property
+    def capturing(self) -> bool:
+        return self._capture_remaining > 0
+
+    def tick_started(self):
+        if self._capture_remaining > 0 and self._cprofile is not None:
+            try:
+                self._cprofile.enable()
+            except ValueError as e:
+                # only one profiler may be active at a time (e.g. an outer cProfile run or a debugger)
+                logger.warning("line profile capture skipped, cProfile could not be enabled: %s", e)
+                self._abandon_capture()
+
+    def tick_finished(self):
+        if self._capture_remaining <= 0:
+            return
+
+        if self._cprofile is not None:
+            self._cprofile.disable()
+
+        self._capture_remaining -= 1
+        if self._capture_remaining == 0:
+            self._finish_capture()
+
+    def _abandon_capture(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        self._capture_remaining = 0
+        self._capture = None
+        self._cprofile = None
+        self._tracemalloc_snapshot = None
+        self._started_tracemalloc = False
+
+    def _finish_capture(self):
+        if self._cprofile is not None:
+            self._capture.stats = pstats.Stats(self._cprofile, stream=io.StringIO())
+
+        if self._tracemalloc_snapshot is not None:
+            snapshot = tracemalloc.take_snapshot()
+            self._capture.tracemalloc_top = snapshot.compare_to(self._tracemalloc_snapshot, 'lineno')[:25]
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+        self.last_capture = self._capture
+        self._capture = None
+        self._cprofile = None
+        self._tracemalloc_snapshot = None
+        self._started_tracemalloc = False
+        logger.info("line profile capture finished")
+
+    def summary(self) -> Dict[str, Dict]:
+        return {
+            'phases': {name: hist.as_dict() for name, hist in self.phase_timings.items()},
+            'stations': {id: hist.as_dict() for id, hist in self.station_timings.items()},
+        }
+
+    def dump(self, stream: TextIO = None):
+        lines = [f"{'name':<40}{'count':>10}{'mean_ms':>12}{'p50_ms':>12}{'p99_ms':>12}{'max_ms':>12}"]
+        rows = [(f"phase:{name}", hist) for name, hist in self.phase_timings.items()] + \
+               [(f"station:{id}", hist) for id, hist in self.station_timings.items()]
+        for name, hist in rows:
+            if hist.count == 0:
+                continue
+            lines.append(f"{name:<40}{hist.count:>10}{hist.mean_s * 1000:>12.4f}{hist.quantile(0.5) * 1000:>12.4f}"
+                         f"{hist.quantile(0.99) * 1000:>12.4f}{hist.max_s * 1000:>12.4f}")
+
+        txt = "\n".join(lines)
+        if stream is not None:
+            stream.write(txt + "\n")
+        return txt
+
+    def reset(self):
+        for hist in self.phase_timings.values():
+            hist.reset()
+        self.station_timings.clear()
+
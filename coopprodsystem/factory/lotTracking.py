@@ -0,0 +1,300 @@
+import math
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from copy import copy
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+from coopstorage.my_dataclasses import ResourceUoM
+
+LotPortion = Tuple[int, float]
+NOT_CONSUMED = math.nan
+
+
+class LotNotRetainedException(Exception):
+    def __init__(self, lot_id):
+        super().__init__(f"lot {lot_id} was consumed and evicted from the tracker")
+
+
+@dataclass
+class CycleTimeStats:
+    n: int = 0
+    total_s: float = 0.0
+    max_s: float = 0.0
+
+    def record(self, cycle_time_s: float):
+        self.n += 1
+        self.total_s += cycle_time_s
+        if cycle_time_s > self.max_s:
+            self.max_s = cycle_time_s
+
+    @property
+    def mean_s(self) -> Optional[float]:
+        return self.total_s / self.n if self.n else None
+
+
+# (created, qty, resource idx, station idx, parents) of a live lot whose row was compacted away
+_Survivor = Tuple[float, float, int, int, Tuple[int, ...]]
+
+
+class LotTracker:
+    """Array-backed genealogy store with integer lot ids.
+
+    Every lot is a row in a set of typed arrays (created/consumed time, qty, resource_uom and station index), and every
+    consumed -> produced relationship is a (parent, child) row in two edge arrays. Children are linked once, right after
+    they are created, so the edge arrays stay sorted by child and parents are found by binary search. Memory is a fixed
+    ~60 bytes per lot plus 16 bytes per edge, with no per-lot python objects beyond the lots still in process.
+
+    With max_retained_lots, the oldest half of the rows is compacted away once more are held: consumed lots are evicted
+    (their queries raise LotNotRetainedException, genealogy and lead times stop at them) and the few lots still in
+    process are kept aside. Cycle time statistics and wip ages are kept as running aggregates, so they cover every lot
+    ever tracked without scanning the rows.
+    """
+
+    def __init__(self, max_retained_lots: int = None):
+        if max_retained_lots is not None and max_retained_lots < 2:
+            raise ValueError(f"max_retained_lots must be >= 2, {max_retained_lots} provided")
+        self.max_retained_lots = max_retained_lots
+
+        self._created = array('d')
+        self._consumed = array('d')
+        self._qty = array('d')
+        self._resource_idx = array('l')
+        self._station_idx = array('l')
+        self._edge_parent = array('q')
+        self._edge_child = array('q')
+        # id of the first row held in the arrays
+        self._base = 0
+        self._survivors: Dict[int, _Survivor] = {}
+        # lots not consumed yet: id -> (created, resource idx)
+        self._live: Dict[int, Tuple[float, int]] = {}
+        self._cycle_time_stats: Dict[Optional[int], CycleTimeStats] = {None: CycleTimeStats()}
+        self.n_evicted = 0
+
+        self._resource_uoms: List[ResourceUoM] = []
+        self._resource_uom_index: Dict[ResourceUoM, int] = {}
+        self._station_ids: List[str] = []
+        self._station_index: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        """Number of lots ever created"""
+        return self._base + len(self._created)
+
+    @property
+    def n_retained(self) -> int:
+        return len(self._created) + len(self._survivors)
+
+    @staticmethod
+    def _intern(value, values: List, index: Dict) -> int:
+        idx = index.get(value, None)
+        if idx is None:
+            idx = index[value] = len(values)
+            values.append(value)
+        return idx
+
+    def new_lot(self,
+                resource_uom: ResourceUoM,
+                qty: float,
+                created_perf: float,
+                station_id: str = None,
+                parents: Iterable[int] = None) -> int:
+        with self._lock:
+            if self.max_retained_lots is not None and len(self._created) >= self.max_retained_lots:
+                self._compact(len(self._created) - self.max_retained_lots // 2)
+
+            lot_id = self._base + len(self._created)
+            resource_idx = self._intern(resource_uom, self._resource_uoms, self._resource_uom_index)
+            self._created.append(created_perf)
+            self._consumed.append(NOT_CONSUMED)
+            self._qty.append(qty)
+            self._resource_idx.append(resource_idx)
+            self._station_idx.append(self._intern(station_id, self._station_ids, self._station_index)
+                                     if station_id is not None else -1)
+            self._live[lot_id] = (created_perf, resource_idx)
+
+            for parent in sorted(set(parents or [])):
+                self._edge_parent.append(parent)
+                self._edge_child.append(lot_id)
+
+            return lot_id
+
+    def _compact(self, n_rows: int):
+        """Drop the oldest n_rows rows; lots among them still in process are kept aside"""
+        cut = self._base + n_rows
+        for row in range(n_rows):
+            if math.isnan(self._consumed[row]):
+                lot_id = self._base + row
+                self._survivors[lot_id] = (self._created[row], self._qty[row], self._resource_idx[row],
+                                           self._station_idx[row], tuple(self.parents(lot_id)))
+            else:
+                self.n_evicted += 1
+        for column in (self._created, self._consumed, self._qty, self._resource_idx, self._station_idx):
+            del column[:n_rows]
+        n_edges = bisect_left(self._edge_child, cut)
+        del self._edge_parent[:n_edges]
+        del self._edge_child[:n_edges]
+        self._base = cut
+
+    def mark_consumed(self, lot_id: int, consumed_perf: float):
+        with self._lock:
+            live = self._live.pop(lot_id, None)
+            if live is None:
+                return
+            created, resource_idx = live
+            row = lot_id - self._base
+            if row >= 0:
+                self._consumed[row] = consumed_perf
+            elif self._survivors.pop(lot_id, None) is not None:
+                self.n_evicted += 1
+            for key in (None, resource_idx):
+                stats = self._cycle_time_stats.get(key, None)
+                if stats is None:
+                    stats = self._cycle_time_stats[key] = CycleTimeStats()
+                stats.record(consumed_perf - created)
+
+    def _field(self, lot_id: int, column: array, survivor_idx: int):
+        row = lot_id - self._base
+        if 0 <= row < len(column):
+            return column[row]
+        survivor = self._survivors.get(lot_id, None)
+        if survivor is None:
+            raise LotNotRetainedException(lot_id)
+        return survivor[survivor_idx]
+
+    def parents(self, lot_id: int) -> List[int]:
+        with self._lock:
+            survivor = self._survivors.get(lot_id, None)
+            if survivor is not None:
+                return list(survivor[4])
+            lo = bisect_left(self._edge_child, lot_id)
+            hi = bisect_right(self._edge_child, lot_id, lo=lo)
+            return list(self._edge_parent[lo:hi])
+
+    def ancestors(self, lot_id: int) -> List[int]:
+        """Every lot that went into lot_id, as far back as the lots are retained"""
+        seen = set()
+        stack = self.parents(lot_id)
+        while stack:
+            lot = stack.pop()
+            if lot in seen:
+                continue
+            seen.add(lot)
+            stack.extend(self.parents(lot))
+        return sorted(seen)
+
+    def children(self, lot_id: int) -> List[int]:
+        """Lots produced from lot_id. Linear in the number of edges"""
+        with self._lock:
+            return [child for parent, child in zip(self._edge_parent, self._edge_child) if parent == lot_id]
+
+    def resource_uom(self, lot_id: int) -> ResourceUoM:
+        with self._lock:
+            return self._resource_uoms[self._field(lot_id, self._resource_idx, 2)]
+
+    def station_id(self, lot_id: int) -> Optional[str]:
+        with self._lock:
+            idx = self._field(lot_id, self._station_idx, 3)
+            return self._station_ids[idx] if idx >= 0 else None
+
+    def qty(self, lot_id: int) -> float:
+        with self._lock:
+            return self._field(lot_id, self._qty, 1)
+
+    def created_perf(self, lot_id: int) -> float:
+        with self._lock:
+            return self._field(lot_id, self._created, 0)
+
+    def consumed_perf(self, lot_id: int) -> Optional[float]:
+        with self._lock:
+            if lot_id in self._live:
+                return None
+            consumed = self._field(lot_id, self._consumed, None)
+            return None if math.isnan(consumed) else consumed
+
+    def cycle_time(self, lot_id: int) -> Optional[float]:
+        """Time from the lot being created to it being fully consumed (or removed from the line)"""
+        with self._lock:
+            consumed = self.consumed_perf(lot_id)
+            return consumed - self.created_perf(lot_id) if consumed is not None else None
+
+    def lead_time(self, lot_id: int) -> float:
+        """Time from the earliest retained raw material that went into the lot to the lot being created"""
+        with self._lock:
+            created = []
+            for ancestor in self.ancestors(lot_id):
+                try:
+                    created.append(self.created_perf(ancestor))
+                except LotNotRetainedException:
+                    continue
+            if not created:
+                return 0.0
+            return self.created_perf(lot_id) - min(created)
+
+    def _resource_idx_of(self, resource_uom: Optional[ResourceUoM]) -> Optional[int]:
+        """None for every resource_uom, -1 for one never tracked"""
+        if resource_uom is None:
+            return None
+        return self._resource_uom_index.get(resource_uom, -1)
+
+    def cycle_times(self, resource_uom: ResourceUoM = None) -> List[float]:
+        """Cycle times of the retained consumed lots, see cycle_time_stats for all of them"""
+        with self._lock:
+            idx = self._resource_idx_of(resource_uom)
+            return [consumed - created
+                    for created, consumed, res in zip(self._created, self._consumed, self._resource_idx)
+                    if not math.isnan(consumed) and (idx is None or res == idx)]
+
+    def cycle_time_stats(self, resource_uom: ResourceUoM = None) -> CycleTimeStats:
+        """Running cycle time aggregates over every lot ever consumed"""
+        with self._lock:
+            stats = self._cycle_time_stats.get(self._resource_idx_of(resource_uom), None)
+            return copy(stats) if stats is not None else CycleTimeStats()
+
+    def wip_ages(self, now_perf: float, resource_uom: ResourceUoM = None) -> List[float]:
+        """Age of every lot that has not been consumed yet"""
+        with self._lock:
+            idx = self._resource_idx_of(resource_uom)
+            return [now_perf - created for created, res in self._live.values() if idx is None or res == idx]
+
+    @property
+    def n_edges(self) -> int:
+        return len(self._edge_child)
+
+
+class LotQueue:
+    """FIFO of lot portions held in one storage slot of a station"""
+
+    def __init__(self):
+        self._portions: Deque[List] = deque()
+
+    def __len__(self):
+        return len(self._portions)
+
+    def push(self, lot_id: int, qty: float):
+        self._portions.append([lot_id, qty])
+
+    def extend(self, portions: Iterable[LotPortion]):
+        for lot_id, qty in portions:
+            self.push(lot_id, qty)
+
+    def draw(self, qty: float) -> Tuple[List[LotPortion], List[int]]:
+        """Take qty off the front of the queue. Returns the portions taken and the lots that were emptied"""
+        drawn = []
+        emptied = []
+        remaining = qty
+        while remaining > 1e-9 and self._portions:
+            portion = self._portions[0]
+            take = min(portion[1], remaining)
+            drawn.append((portion[0], take))
+            portion[1] -= take
+            remaining -= take
+            if portion[1] <= 1e-9:
+                self._portions.popleft()
+                emptied.append(portion[0])
+        return drawn, emptied
+
+    @property
+    def portions(self) -> List[LotPortion]:
+        return [(x[0], x[1]) for x in self._portions]
@@ -1,19 +1,49 @@
 import uuid
 import time
-from coopgraph.graphs import Graph, Node, Edge
-from typing import List, Dict, Tuple, Callable
-from coopprodsystem.factory.station import Station
+import threading
+import weakref
+from contextlib import contextmanager
+from coopgraph.graphs import Graph, Node
+from typing import List, Dict, Tuple, Callable, Optional, Union
+from coopprodsystem.factory.station import Station, InvalidInputToAddToStationException, \
+    InvalidOutputToAddToStationException, StationProductionStrategy
 from coopstorage.my_dataclasses import content_factory, ResourceUoM, Content
+from coopstorage.exceptions import NoLocationWithCapacityException, NoRoomAtLocationException
 from coopprodsystem.factory import StationTransfer
 import logging
 import coopprodsystem.events as cevents
 from cooptools.timedDecay import Timer, TimedDecay
 from cooptools.coopthreading import AsyncWorker
+from cooptools.coopEnum import CoopEnum
+from enum import auto
 import cooptools.geometry_utils.vector_utils as vec
+from coopprodsystem.loggingHelpers import should_log
+from coopprodsystem.factory.lineProfiler import LineProfiler
+from coopprodsystem.factory.transferAllocation import TransferAllocationStrategy, TransferDemand, allocate_supply, \
+    SPLIT_STRATEGIES
+from coopprodsystem.factory.lotTracking import LotTracker, LotQueue, LotPortion
 
 logger = logging.getLogger(__name__)
 
 time_provider = Callable[[], float]
+StationOrId = Union[Station, str]
+
+
+class InFlightTransferPolicy(CoopEnum):
+    RETURN_TO_SOURCE = auto()
+    DROP = auto()
+
+
+def _station_id(station: StationOrId) -> str:
+    return station if isinstance(station, str) else station.id
+
+
+def _split_lots(lots: List[LotPortion], qty: float) -> Tuple[List[LotPortion], List[LotPortion]]:
+    """(first qty worth of lot portions, the rest)"""
+    queue = LotQueue()
+    queue.extend(lots)
+    taken, _ = queue.draw(qty)
+    return taken, queue.portions
 
 
 class ProductionLine:
@@ -22,17 +52,57 @@ class ProductionLine:
                  init_relationship_map: Dict[Station, List[Tuple[Station, List[ResourceUoM]]]] = None,
                  id: str = None,
                  start_on_init: bool = True,
-                 transfer_time_s_callback: time_provider = None
+                 transfer_time_s_callback: time_provider = None,
+                 profiler: LineProfiler = None,
+                 transfer_allocation_strategy: TransferAllocationStrategy = TransferAllocationStrategy.PROPORTIONAL,
+                 station_priorities: Dict[str, float] = None,
+                 lot_tracker: LotTracker = None,
+                 kanban_cards: Dict[Tuple[str, str], int] = None,
+                 default_kanban_cards: int = 2,
+                 conwip_limit: float = None,
+                 long_run: bool = False
                  ):
 
         self._id = id or uuid.uuid4()
-        self._graph = Graph()
+        self._lock = threading.RLock()
         self._stations: Dict[str, Station] = {}
         self._station_positions: Dict[str, vec.FloatVec] = {}
-        self._station_transfers: List[StationTransfer] = []
-        self._connection_resource_uom: Dict[str, List[ResourceUoM]] = {}
+
+        # adjacency index: to_station_id -> {from_station_id: resource_uoms} and the reverse
+        self._feeders: Dict[str, Dict[str, List[ResourceUoM]]] = {}
+        self._consumers: Dict[str, Dict[str, List[ResourceUoM]]] = {}
+
+        # in-flight transfers, indexed by destination, with the qty in transit per destination and resource_uom
+        self._station_transfers: Dict[str, StationTransfer] = {}
+        self._transfers_by_dest: Dict[str, Dict[str, StationTransfer]] = {}
+        self._in_transit: Dict[str, Dict[ResourceUoM, float]] = {}
+
         _def_time_provider = lambda: 3
         self._transfer_time_s_callback = transfer_time_s_callback or _def_time_provider
+        self._profiler = profiler
+        self.transfer_allocation_strategy = transfer_allocation_strategy
+        self.station_priorities: Dict[str, float] = station_priorities or {}
+        # per feeder/resource_uom, which consumer goes first when a split is tied (rotated every allocation)
+        self._allocation_turns: Dict[Tuple[str, ResourceUoM], int] = {}
+        self._lot_tracker = lot_tracker
+        self._last_update_perf = None
+
+        # demand-pull settings: kanban cards per (from_id, to_id) edge, each worth one production run of the feeder,
+        # and the cap on units in the line that CONWIP release stations respect
+        self.kanban_cards: Dict[Tuple[str, str], int] = kanban_cards or {}
+        self.default_kanban_cards = default_kanban_cards
+        self.conwip_limit = conwip_limit
+        self._conwip_wip: Optional[float] = None
+
+        self._shared_state = None
+
+        # long-run mode: weak station references on transfers and a pool of released transfer records to re-use
+        self._long_run = False
+        self._transfer_pool: List[StationTransfer] = []
+        self.transfer_pool_size = 0
+        self._weak_event_refs_release: Optional[weakref.finalize] = None
+        # before the init stations are added so their STATION_ADDED args are already weak
+        if long_run: self.enable_long_run_mode()
 
         # add init stations:
         if init_stations: self.add_stations(init_stations)
@@ -41,7 +111,7 @@ class ProductionLine:
         if init_relationship_map: self.add_relationships(init_relationship_map)
 
         # start
-        self._async_worker = AsyncWorker(update_callback=self.update, start_on_init=start_on_init)
+        self._async_worker = AsyncWorker(update_callback=self.update, start_on_init=False)
         if start_on_init:
             self.start_async()
 
@@ -53,120 +123,608 @@ class ProductionLine:
     def update(self, time_perf: float = None):
         if time_perf is None: time_perf = time.perf_counter()
 
+        with self._lock:
+            self._last_update_perf = time_perf
+            self._conwip_wip = None
+            if self._profiler is not None:
+                self._profiled_update(time_perf)
+            else:
+                self.check_update_stations(time_perf)
+                self.check_create_transfers(time_perf)
+                self.check_handle_transfers(time_perf)
+
+            if self._shared_state is not None:
+                self._shared_state.publish(self._stations, time_perf)
+
+    def _profiled_update(self, time_perf: float):
+        profiler = self._profiler
+        profiler.tick_started()
+
+        t0 = time.perf_counter()
         self.check_update_stations(time_perf)
+        t1 = time.perf_counter()
         self.check_create_transfers(time_perf)
+        t2 = time.perf_counter()
         self.check_handle_transfers(time_perf)
+        t3 = time.perf_counter()
+
+        profiler.tick_finished()
+        profiler.record_phase('check_update_stations', t1 - t0)
+        profiler.record_phase('check_create_transfers', t2 - t1)
+        profiler.record_phase('check_handle_transfers', t3 - t2)
+        profiler.record_phase('update', t3 - t0)
 
     def check_update_stations(self, time_perf: float):
+        profiler = self._profiler
         for name, station in self._stations.items():
-            if not station.AsyncStarted:
+            if station.AsyncStarted:
+                continue
+
+            if profiler is None:
+                station.update(time_perf)
+            else:
+                t0 = time.perf_counter()
                 station.update(time_perf)
+                profiler.record_station(name, time.perf_counter() - t0)
 
     def init_station_transfer(self, from_s: Station, to_s: Station, content: Content, timer: TimedDecay):
-        transfer_content = next(iter(from_s.remove_output(content=[content])), None)
-
-        new_transfer = StationTransfer(
-            from_station=from_s,
-            to_station=to_s,
-            content=transfer_content,
-            timer=timer
-        )
-        self._station_transfers.append(new_transfer)
-        logger.info(
-            f"{from_s.id} -> {to_s.id} transferring {content} in {timer.time_ms / 1000} sec [capacity at dest: {to_s.space_for_input}]")
+        removed, lots = from_s.remove_output_with_lots(content=[content])
+        transfer_content = next(iter(removed), None)
+
+        new_transfer = self._new_transfer(from_s, to_s, transfer_content, timer, tuple(lots[0]) if lots else ())
+        self._track_transfer(new_transfer)
+        if should_log(logger, logging.INFO):
+            logger.info("%s -> %s transferring %s in %s sec [capacity at dest: %s]",
+                        from_s.id, to_s.id, content, timer.time_ms / 1000, to_s.space_for_input)
         cevents.raise_event_StationTransferStarted(
             args=cevents.OnStationTransferStartedEventArgs(
                 transfer=new_transfer
             ))
 
+    def _new_transfer(self, from_s: Station, to_s: Station, content: Content, timer: TimedDecay,
+                      lots: Tuple[LotPortion, ...]) -> StationTransfer:
+        if self._long_run:
+            from_s, to_s = weakref.proxy(from_s), weakref.proxy(to_s)
+            if self._transfer_pool:
+                return self._transfer_pool.pop().recycle(from_s, to_s, content, timer, lots)
+
+        return StationTransfer(from_station=from_s, to_station=to_s, content=content, timer=timer, lots=lots)
+
+    def _release_transfer(self, transfer: StationTransfer):
+        """Pool a finished transfer record for re-use. Only while events are delivered synchronously and no subscriber
+        queues them, otherwise event args that reference the record may still be read after it was re-used"""
+        if not self._long_run \
+                or len(self._transfer_pool) >= self.transfer_pool_size \
+                or cevents.get_event_dispatcher() is not None \
+                or cevents.has_deferred_consumers():
+            return
+        transfer.release()
+        self._transfer_pool.append(transfer)
+
+    def _track_transfer(self, transfer: StationTransfer):
+        dest_id = transfer.to_id
+        self._station_transfers[transfer.id] = transfer
+        self._transfers_by_dest.setdefault(dest_id, {})[transfer.id] = transfer
+        in_transit = self._in_transit.setdefault(dest_id, {})
+        ru = transfer.content.resourceUoM
+        in_transit[ru] = in_transit.get(ru, 0) + transfer.content.qty
+
+    def _untrack_transfer(self, transfer: StationTransfer):
+        dest_id = transfer.to_id
+        del self._station_transfers[transfer.id]
+        self._transfers_by_dest.get(dest_id, {}).pop(transfer.id, None)
+        in_transit = self._in_transit.get(dest_id, None)
+        if in_transit is not None:
+            ru = transfer.content.resourceUoM
+            in_transit[ru] = in_transit.get(ru, 0) - transfer.content.qty
+
     def check_handle_transfers(self, time_perf: float):
-        for transfer in self._station_transfers:
-            if time_perf > transfer.timer.EndTime:
-                transfer.to_station.add_input(inputs=[transfer.content])
-                self._station_transfers.remove(transfer)
-                logger.info(f"{transfer.from_station.id} -> {transfer.to_station.id} transfer complete")
-                cevents.raise_event_StationTransferStarted(
-                    args=cevents.OnStationTransferStartedEventArgs(
-                        transfer=transfer
-                    ))
-
-    def check_connections_to_station(self, station: Station) -> Dict[Station, List[ResourceUoM]]:
-        edge_connections = self._graph.edges_to_node(self._graph.node_by_name(node_name=station.id))
-        feeder_stations = {self._stations[e.start.name]: self._connection_resource_uom[e.id] for e in edge_connections}
-        return feeder_stations
+        completed = [x for x in self._station_transfers.values() if time_perf > x.timer.EndTime]
+        for transfer in completed:
+            self._untrack_transfer(transfer)
+
+            # deliver to whichever station currently holds the destination id (it may have been replaced, possibly by
+            # one that no longer takes the resource or has less room for it)
+            to_station = self._stations.get(transfer.to_id, None)
+            try:
+                if to_station is None:
+                    raise InvalidInputToAddToStationException()
+                to_station.add_input(inputs=[transfer.content], lots=[list(transfer.lots)] if transfer.lots else None)
+            except (InvalidInputToAddToStationException, NoLocationWithCapacityException, NoRoomAtLocationException):
+                self._return_to_source(transfer, InFlightTransferPolicy.RETURN_TO_SOURCE)
+                continue
+
+            if should_log(logger, logging.INFO):
+                logger.info("%s -> %s transfer complete", transfer.from_id, transfer.to_id)
+            cevents.raise_event_StationTransferCompleted(
+                args=cevents.OnStationTransferCompletedEventArgs(
+                    transfer=transfer
+                ))
+            self._release_transfer(transfer)
+
+    def cancel_transfer(self,
+                        transfer: StationTransfer,
+                        policy: InFlightTransferPolicy = InFlightTransferPolicy.RETURN_TO_SOURCE):
+        with self._lock:
+            if transfer.id not in self._station_transfers:
+                return
+            self._untrack_transfer(transfer)
+            self._return_to_source(transfer, policy)
+
+    def _return_to_source(self, transfer: StationTransfer, policy: InFlightTransferPolicy):
+        source = self._stations.get(transfer.from_id, None)
+        returned = 0
+        dropped_lots = list(transfer.lots)
+        if policy == InFlightTransferPolicy.RETURN_TO_SOURCE and source is not None:
+            ru = transfer.content.resourceUoM
+            returned = min(source.space_for_output.get(ru, 0), transfer.content.qty)
+            if returned > 0:
+                returned_lots, dropped_lots = _split_lots(dropped_lots, returned)
+                try:
+                    source.add_output([content_factory(transfer.content, qty=returned)],
+                                      lots=[returned_lots] if returned_lots else None)
+                except InvalidOutputToAddToStationException:
+                    returned = 0
+                    dropped_lots = list(transfer.lots)
+
+        # dropped material has left the line
+        if self._lot_tracker is not None:
+            now = self._last_update_perf if self._last_update_perf is not None else time.perf_counter()
+            for lot_id, _ in dropped_lots:
+                self._lot_tracker.mark_consumed(lot_id, now)
+
+        if returned < transfer.content.qty:
+            logger.warning("PL %s: transfer %s cancelled, %s of %s dropped", self._id, transfer.short_str(),
+                           transfer.content.qty - returned, transfer.content.qty)
+
+        cevents.raise_event_StationTransferCancelled(
+            args=cevents.OnStationTransferCancelledEventArgs(
+                transfer=transfer
+            ))
+        self._release_transfer(transfer)
 
-    def content_in_transit_to_station(self, station_id: str) -> List[Content]:
-        return [x.content for x in self._station_transfers if x.to_station.id == station_id]
+    def shift_time(self, shift_s: float):
+        """Move every station timer and in-flight transfer forward by shift_s"""
+        for station in self._stations.values():
+            station.shift_time(shift_s)
+        for transfer in self._station_transfers.values():
+            transfer.timer.set_start(transfer.timer.start_perf + shift_s)
 
-    def check_create_transfers(self, time_perf):
-        for id, to_station in self.Stations.items():
-            feeder_stations = self.check_connections_to_station(to_station)
-            transfers_to_station = self.content_in_transit_to_station(id)
+    def check_connections_to_station(self, station: StationOrId) -> Dict[Station, List[ResourceUoM]]:
+        return {self._stations[from_id]: resource_uoms
+                for from_id, resource_uoms in self._feeders.get(_station_id(station), {}).items()}
 
-            to_s_space = to_station.space_for_input
+    def check_connections_from_station(self, station: StationOrId) -> Dict[Station, List[ResourceUoM]]:
+        return {self._stations[to_id]: resource_uoms
+                for to_id, resource_uoms in self._consumers.get(_station_id(station), {}).items()}
 
-            for feeder_station, resource_uoms in feeder_stations.items():
-                for resource_uom, avail_qty in feeder_station.available_output.items():
-                    # dont eval for transfer if no qty avail
-                    if avail_qty <= 0:
-                        continue
+    def content_in_transit_to_station(self, station_id: str) -> List[Content]:
+        return [x.content for x in self._transfers_by_dest.get(station_id, {}).values()]
 
-                    # evaulate the space available at the destination station
-                    space_for_resource_uom = to_s_space.get(resource_uom, None)
+    def qty_in_transit_to_station(self, station_id: str) -> Dict[ResourceUoM, float]:
+        return self._in_transit.get(station_id, {})
 
-                    # this resource_uom produced at feeder is not required at this to_station so skip
-                    if space_for_resource_uom is None:
+    def check_create_transfers(self, time_perf):
+        """Collect the demand of every consumer for each feeder/resource_uom and split the feeder's available output
+        across them in one batch, per transfer_allocation_strategy"""
+        # remaining demand per consumer: (space avail) - (on its way), reduced as transfers are allocated this tick
+        remaining_need: Dict[str, Dict[ResourceUoM, float]] = {}
+
+        for feeder_id, consumers in self._consumers.items():
+            if not consumers:
+                continue
+
+            feeder_station = self._stations[feeder_id]
+            available = feeder_station.available_output
+            # walk outputs in definition order so transfers are created (and timed) in the same order on every run
+            for output in feeder_station.outputs:
+                resource_uom = output.content.resourceUoM
+                avail_qty = available.get(resource_uom, 0)
+
+                # dont eval for transfer if no qty avail
+                if avail_qty <= 0:
+                    continue
+
+                demands = []
+                for to_id, resource_uoms in consumers.items():
+                    # this resource_uom is not carried on the relationship to this consumer
+                    if resource_uoms and resource_uom not in resource_uoms:
                         continue
 
-                    # calulate the amount of resourceUoM that is in existing transfers to the station.
-                    amount_resource_uom_on_its_way = sum(
-                        [c.qty for c in transfers_to_station if c.resourceUoM == resource_uom])
-
-                    # resolve the amount of resourceUoM that can be sent based on the difference of (space avail) - (on its way)
-                    space_minus_in_transit = space_for_resource_uom - amount_resource_uom_on_its_way
-
-                    # if there is capacity after transfers, then init a new transfer to the dest in the amount of min(space, avail)
-                    if space_minus_in_transit > 0:
-                        transfer_content = content_factory(resource_uom=resource_uom,
-                                                           qty=min(space_minus_in_transit, avail_qty))
-                        self.init_station_transfer(feeder_station,
-                                                   to_station,
-                                                   content=transfer_content,
-                                                   timer=TimedDecay(self._transfer_time_s_callback() * 1000,
-                                                                    start_perf=time_perf)
-                                                   )
+                    need = remaining_need.get(to_id, None)
+                    if need is None:
+                        need = remaining_need[to_id] = self._input_need(to_id)
+
+                    qty = need.get(resource_uom, 0)
+                    if qty > 0:
+                        demands.append(TransferDemand(
+                            consumer_id=to_id,
+                            qty=qty,
+                            queue=self._input_queue(to_id, resource_uom),
+                            weight=self.station_priorities.get(to_id, 1),
+                            run_qty=self._run_input_qty(to_id, resource_uom)))
+
+                if not demands:
+                    continue
+
+                # ties of the split strategies go to whoever is listed first, so the first in line rotates
+                if self.transfer_allocation_strategy in SPLIT_STRATEGIES and len(demands) > 1:
+                    turn = self._allocation_turns.get((feeder_id, resource_uom), 0) % len(demands)
+                    self._allocation_turns[(feeder_id, resource_uom)] = turn + 1
+                    demands = demands[turn:] + demands[:turn]
+
+                allocation = allocate_supply(avail_qty, demands, self.transfer_allocation_strategy)
+                for to_id, qty in allocation.items():
+                    if qty <= 0:
+                        continue
+                    remaining_need[to_id][resource_uom] -= qty
+                    self.init_station_transfer(feeder_station,
+                                               self._stations[to_id],
+                                               content=content_factory(resource_uom=resource_uom, qty=qty),
+                                               timer=TimedDecay(self._transfer_time_s_callback() * 1000,
+                                                                start_perf=time_perf)
+                                               )
+
+    def _input_need(self, station_id: str) -> Dict[ResourceUoM, float]:
+        in_transit = self._in_transit.get(station_id, {})
+        return {ru: space - in_transit.get(ru, 0)
+                for ru, space in self._stations[station_id].space_for_input.items()}
+
+    def _run_input_qty(self, station_id: str, resource_uom: ResourceUoM) -> float:
+        return next((x.content.qty for x in self._stations[station_id].input_reqs
+                     if x.content.resourceUoM == resource_uom), 0)
+
+    def _input_queue(self, station_id: str, resource_uom: ResourceUoM) -> float:
+        # greedy fills in order; every other strategy ranks or rounds by what the consumer already holds
+        if self.transfer_allocation_strategy == TransferAllocationStrategy.GREEDY:
+            return 0
+        return self._stations[station_id].stored_inputs.get(resource_uom, 0) + \
+            self._in_transit.get(station_id, {}).get(resource_uom, 0)
+
+    def _authorize_production(self, station: Station) -> bool:
+        strategy = station.production_strategy
+        if strategy == StationProductionStrategy.KANBAN:
+            return self._kanban_authorizes(station)
+        elif strategy == StationProductionStrategy.CONWIP:
+            return self._conwip_authorizes(station)
+        elif strategy == StationProductionStrategy.PRODUCE_TO_ORDER:
+            return self._order_authorizes(station)
+        return True
+
+    def _consumers_of(self, station_id: str, resource_uom: ResourceUoM) -> List[str]:
+        return [to_id for to_id, resource_uoms in self._consumers.get(station_id, {}).items()
+                if not resource_uoms or resource_uom in resource_uoms]
+
+    def _kanban_authorizes(self, station: Station) -> bool:
+        """A run may start when some output still has a free card: the output held by the station, running, in transit
+        and stored at its consumers is below cards * run qty over its outgoing edges. A partly used container frees
+        its card, so consumers that need more than one run of input per run of their own do not lock up"""
+        available = station.available_output
+        has_edges = False
+        for output in station.outputs:
+            resource_uom, run_qty = output.content.resourceUoM, output.content.qty
+            to_ids = self._consumers_of(station.id, resource_uom)
+            if not to_ids:
+                continue
+            has_edges = True
+
+            cards = sum(self.kanban_cards.get((station.id, to_id), self.default_kanban_cards) for to_id in to_ids)
+            in_loop = available.get(resource_uom, 0) + station.active_productions * run_qty
+            for to_id in to_ids:
+                in_loop += self._in_transit.get(to_id, {}).get(resource_uom, 0) + \
+                           self._stations[to_id].stored_inputs.get(resource_uom, 0)
+            if in_loop < cards * run_qty:
+                return True
+
+        # nothing downstream to pull, e.g. the end of the line
+        return not has_edges
+
+    def _shortage(self, station_id: str, resource_uom: ResourceUoM) -> float:
+        short = next((x.qty for x in self._stations[station_id].short_inputs if x.resourceUoM == resource_uom), 0)
+        return max(short - self._in_transit.get(station_id, {}).get(resource_uom, 0), 0)
+
+    def _order_authorizes(self, station: Station) -> bool:
+        """A run may start when its consumers are short of an output by more than the station already holds or has
+        running"""
+        available = station.available_output
+        has_edges = False
+        for output in station.outputs:
+            resource_uom = output.content.resourceUoM
+            to_ids = self._consumers_of(station.id, resource_uom)
+            if not to_ids:
+                continue
+            has_edges = True
+
+            ordered = sum(self._shortage(to_id, resource_uom) for to_id in to_ids)
+            coming = available.get(resource_uom, 0) + station.active_productions * output.content.qty
+            if ordered > coming:
+                return True
+
+        return not has_edges
+
+    def _conwip_authorizes(self, station: Station) -> bool:
+        """Release stations (no inputs) may start a run while the line holds less than conwip_limit units. Later
+        stations only convert WIP and are not limited"""
+        if self.conwip_limit is None or station.input_reqs:
+            return True
+
+        if self._conwip_wip is None:
+            self._conwip_wip = self.wip()
+        run_qty = sum(x.content.qty for x in station.outputs)
+        if self._conwip_wip + run_qty > self.conwip_limit:
+            return False
+        self._conwip_wip += run_qty
+        return True
+
+    def wip(self) -> float:
+        """Units stored, running and in transit across the line"""
+        total = sum(sum(x.values()) for x in self._in_transit.values())
+        for station in self._stations.values():
+            total += sum(station.stored_inputs.values()) + sum(station.available_output.values())
+            if station.active_productions:
+                total += station.active_productions * sum(x.content.qty for x in station.outputs)
+        return total
 
     def add_stations(self, stations: List[Tuple[Station, vec.FloatVec]]):
-        # add stations to the prod line
-        for station, pos in stations:
-            self._stations[station.id] = station
-            self._station_positions[station.id] = pos
-
-        # add nodes to graph
-        nodes = [Node(station.id, pos) for station, pos in stations]
-        for node in nodes:
-            self._graph.add_node(node)
+        with self._lock:
+            # add stations to the prod line
+            for station, pos in stations:
+                self._stations[station.id] = station
+                self._station_positions[station.id] = pos
+                station.set_production_authorizer(self._authorize_production)
+                if self._lot_tracker is not None and station.lot_tracker is None:
+                    station.set_lot_tracker(self._lot_tracker)
 
         # log
-        logger.info(f"PL {self._id}: Stations added: {[station.id for station, pos in stations]}")
+        if should_log(logger, logging.INFO):
+            logger.info("PL %s: Stations added: %s", self._id, [station.id for station, pos in stations])
 
         # raise events
         for station, pos in stations:
             cevents.raise_station_added(cevents.OnStationAddedEventArgs(station=station))
 
+    def remove_stations(self,
+                        stations: List[StationOrId],
+                        in_flight_policy: InFlightTransferPolicy = InFlightTransferPolicy.RETURN_TO_SOURCE):
+        """Remove stations and all of their relationships from the running line.
+
+        Transfers headed to a removed station are cancelled per in_flight_policy. Transfers that already left a removed
+        station still complete at their destination.
+        """
+        removed = []
+        with self._lock:
+            for station in stations:
+                id = _station_id(station)
+                station = self._stations.get(id, None)
+                if station is None:
+                    continue
+
+                for from_id in list(self._feeders.get(id, {})):
+                    self._remove_relationship(id, from_id)
+                for to_id in list(self._consumers.get(id, {})):
+                    self._remove_relationship(to_id, id)
+
+                for transfer in list(self._transfers_by_dest.get(id, {}).values()):
+                    self._untrack_transfer(transfer)
+                    self._return_to_source(transfer, in_flight_policy)
+
+                station.set_production_authorizer(None)
+                del self._stations[id]
+                del self._station_positions[id]
+                self._feeders.pop(id, None)
+                self._consumers.pop(id, None)
+                self._transfers_by_dest.pop(id, None)
+                self._in_transit.pop(id, None)
+
+                if station.AsyncStarted:
+                    station.stop_async()
+                removed.append(station)
+
+        if should_log(logger, logging.INFO):
+            logger.info("PL %s: Stations removed: %s", self._id, [station.id for station in removed])
+
+        for station in removed:
+            cevents.raise_station_removed(cevents.OnStationRemovedEventArgs(station=station))
+
+    def replace_station(self, station: Station, carry_inventory: bool = True) -> Station:
+        """Swap the station with the same id for a new one (e.g. built from another template), keeping its
+        position, relationships and in-flight transfers. Returns the replaced station.
+
+        With carry_inventory, the stored inputs and outputs move to the new station, and so does the input consumed by
+        runs still in progress: it goes back into the new station's input to be produced again. Whatever the new
+        station has no room for (or everything, without carry_inventory) is dropped: its lots are marked consumed and
+        the dropped qty is logged"""
+        with self._lock:
+            old = self._stations[station.id]
+            if self._lot_tracker is not None and station.lot_tracker is None:
+                station.set_lot_tracker(self._lot_tracker)
+
+            self._carry_inventory(old, station, carry_inventory)
+
+            self._stations[station.id] = station
+            old.set_production_authorizer(None)
+            station.set_production_authorizer(self._authorize_production)
+            if old.AsyncStarted:
+                old.stop_async()
+                station.start_async()
+
+        logger.info("PL %s: Station replaced: %s", self._id, station.id)
+        cevents.raise_station_removed(cevents.OnStationRemovedEventArgs(station=old))
+        cevents.raise_station_added(cevents.OnStationAddedEventArgs(station=station))
+        return old
+
+    def _carry_inventory(self, old: Station, new: Station, carry_inventory: bool = True):
+        track_lots = old.lot_tracker is not None and new.lot_tracker is not None
+        now = self._last_update_perf if self._last_update_perf is not None else time.perf_counter()
+
+        # the input of an aborted run was consumed (its lots may be closed already), so it is held as a new lot made
+        # from the ones the run drew
+        held_in = []
+        for inputs, lots in old.abort_productions():
+            for ii, content in enumerate(inputs):
+                parents = [lot_id for lot_id, _ in lots[ii]] if ii < len(lots) else []
+                lot = new.lot_tracker.new_lot(content.resourceUoM, content.qty, now, station_id=old.id,
+                                              parents=parents) if track_lots else None
+                held_in.append((content, [(lot, content.qty)] if lot is not None else []))
+        old_lots = old.input_lots
+        held_in += [(x, old_lots.get(x.resourceUoM, [])) for x in old.stored_inputs_as_content]
+        old_lots = old.output_lots
+        held_out = [(x, old_lots.get(x.resourceUoM, [])) for x in old.available_output_as_content]
+
+        dropped: Dict[ResourceUoM, float] = {}
+        dropped_lots: List[LotPortion] = []
+        carried_lot_ids = set()
+        for held, space, add in ((held_in, new.space_for_input, new.add_input),
+                                 (held_out, new.space_for_output, new.add_output)):
+            carried, carried_lots = [], []
+            for content, lots in held:
+                ru = content.resourceUoM
+                qty = min(content.qty, space.get(ru, 0)) if carry_inventory else 0
+                taken, rest = _split_lots(lots, qty)
+                if qty > 0:
+                    space[ru] -= qty
+                    carried.append(content_factory(content, qty=qty))
+                    carried_lots.append(taken)
+                    carried_lot_ids.update(lot_id for lot_id, _ in taken)
+                if content.qty > qty:
+                    dropped[ru] = dropped.get(ru, 0) + content.qty - qty
+                dropped_lots += rest
+            if carried:
+                add(carried, lots=carried_lots if track_lots else None)
+
+        # dropped material has left the line, along with the lots no part of which was carried
+        if track_lots:
+            for lot_id in {lot_id for lot_id, _ in dropped_lots} - carried_lot_ids:
+                new.lot_tracker.mark_consumed(lot_id, now)
+
+        if dropped:
+            logger.warning("PL %s: station %s replaced, dropped %s", self._id, old.id, dropped)
+
     def add_relationships(self, relationships: Dict[Station, List[Tuple[Station, List[ResourceUoM]]]]):
-        edges = []
-        for to, froms in relationships.items():
-            for station, resource_uoms in froms:
-                node_to = self._graph.node_by_name(to.id)
-                node_from = self._graph.node_by_name(station.id)
-                new_edge = Edge(node_from, node_to)
-                self._connection_resource_uom[new_edge.id] = resource_uoms
-                edges.append(new_edge)
+        """Connect feeder stations to consumers. Re-adding an existing relationship rewires its resource_uoms"""
+        added = []
+        with self._lock:
+            for to, froms in relationships.items():
+                for station, resource_uoms in froms:
+                    to_id, from_id = _station_id(to), _station_id(station)
+                    if to_id not in self._stations or from_id not in self._stations:
+                        raise KeyError(f"{from_id} -> {to_id}: both stations must be on the line")
+                    self._feeders.setdefault(to_id, {})[from_id] = resource_uoms
+                    self._consumers.setdefault(from_id, {})[to_id] = resource_uoms
+                    added.append((from_id, to_id))
+
+        logger.info("PL %s: Station relationships added: %s", self._id, added)
+
+    def remove_relationships(self, relationships: List[Tuple[StationOrId, StationOrId]]):
+        """Disconnect (from_station, to_station) pairs. In-flight transfers between them still complete"""
+        with self._lock:
+            for from_s, to_s in relationships:
+                self._remove_relationship(_station_id(to_s), _station_id(from_s))
+
+        if should_log(logger, logging.INFO):
+            logger.info("PL %s: Station relationships removed: %s", self._id,
+                        [(_station_id(frm), _station_id(to)) for frm, to in relationships])
+
+    def _remove_relationship(self, to_id: str, from_id: str):
+        self._feeders.get(to_id, {}).pop(from_id, None)
+        self._consumers.get(from_id, {}).pop(to_id, None)
+
+    def enable_profiling(self, profiler: LineProfiler = None) -> LineProfiler:
+        self._profiler = profiler or self._profiler or LineProfiler()
+        return self._profiler
+
+    def disable_profiling(self):
+        self._profiler = None
+
+    def enable_long_run_mode(self, transfer_pool_size: int = 64, weak_event_refs: bool = True):
+        """Keep memory flat over multi-million tick runs.
+
+        In-flight transfers reference their stations through weak proxies (use transfer.from_id/to_id, which outlive
+        the stations), finished transfer records are released and pooled for re-use and, when weak_event_refs, the
+        station on event args becomes a weak proxy. Weak event refs are process-wide and stay on while any line in
+        long-run mode holds them (see cevents.retain_weak_event_refs).
+
+        Handlers must copy what they need from transfer args while handling them: once the event has been delivered
+        the record is cleared and re-initialised for a later transfer. Lot genealogy is an append-only record of the
+        run, not a history, and is not capped; disable lot tracking for unbounded runs.
+        """
+        with self._lock:
+            self._long_run = True
+            self.transfer_pool_size = transfer_pool_size
+            if weak_event_refs and self._weak_event_refs_release is None:
+                cevents.retain_weak_event_refs()
+                # a line collected while still in long-run mode gives its hold back
+                self._weak_event_refs_release = weakref.finalize(self, cevents.release_weak_event_refs)
+            if self._lot_tracker is not None:
+                logger.warning("PL %s: long-run mode with lot tracking enabled, lot genealogy grows with every run",
+                               self._id)
+
+    def disable_long_run_mode(self):
+        """Back to strong references. Transfers already in flight keep the references they were created with"""
+        with self._lock:
+            self._long_run = False
+            self._transfer_pool.clear()
+            if self._weak_event_refs_release is not None:
+                self._weak_event_refs_release()
+                self._weak_event_refs_release = None
+
+    @contextmanager
+    def locked(self):
+        """Hold the line's lock, so stations and transfers read from another thread form one consistent state (no
+        update or mutation runs until the block exits)"""
+        with self._lock:
+            yield self
+
+    def enable_lot_tracking(self, lot_tracker: LotTracker = None) -> LotTracker:
+        """Record lot genealogy on every station of the line (and any added later) into one shared tracker"""
+        with self._lock:
+            # an empty tracker is falsy (len 0), so compare against None
+            if lot_tracker is None:
+                lot_tracker = self._lot_tracker if self._lot_tracker is not None else LotTracker()
+            self._lot_tracker = lot_tracker
+            for station in self._stations.values():
+                if station.lot_tracker is not self._lot_tracker:
+                    station.set_lot_tracker(self._lot_tracker)
+        return self._lot_tracker
+
+    def disable_lot_tracking(self):
+        with self._lock:
+            self._lot_tracker = None
+            for station in self._stations.values():
+                station.set_lot_tracker(None)
+
+    def enable_shared_state(self, name: str = None):
+        """Publish station inventory, status and progress into a shared memory block after every update. Returns the
+        SharedLineStateWriter; readers in other processes attach with SharedLineStateReader(writer.name)"""
+        # imported here, the shared state layout depends on modules that depend on this one
+        from coopprodsystem.factory.sharedState import SharedLineStateWriter
+
+        with self._lock:
+            self.disable_shared_state()
+            self._shared_state = SharedLineStateWriter(self._stations, name=name)
+        return self._shared_state
+
+    def disable_shared_state(self):
+        with self._lock:
+            if self._shared_state is not None:
+                self._shared_state.close()
+                self._shared_state = None
+
+    @property
+    def SharedState(self):
+        return self._shared_state
 
-        self._graph.add_edges(edges)
+    @property
+    def LongRun(self) -> bool:
+        return self._long_run
 
-        logger.info(f"PL {self._id}: Station relationships added: {[edge for edge in edges]}")
+    @property
+    def LotTracker(self) -> Optional[LotTracker]:
+        return self._lot_tracker
+
+    @property
+    def Profiler(self) -> Optional[LineProfiler]:
+        return self._profiler
 
     @property
     def Stations(self) -> Dict[str, Station]:
@@ -176,15 +734,39 @@ class ProductionLine:
     def StationPositions(self) -> Dict[str, vec.FloatVec]:
         return self._station_positions
 
+    @property
+    def Relationships(self) -> Dict[str, Dict[str, List[ResourceUoM]]]:
+        """to_station_id -> {from_station_id: resource_uoms}"""
+        return self._feeders
+
+    @property
+    def Graph(self) -> Graph:
+        """Snapshot of the line topology as a coopgraph Graph"""
+        with self._lock:
+            nodes = {id: Node(id, pos) for id, pos in self._station_positions.items()}
+            return Graph(graph_dict={node: [nodes[to_id] for to_id in self._consumers.get(id, {})]
+                                     for id, node in nodes.items()})
+
     @property
     def Id(self) -> str:
         return self._id
 
     @property
-    def StationTransfers(self):
-        return self._station_transfers
+    def LastUpdatePerf(self) -> Optional[float]:
+        return self._last_update_perf
+
+    @property
+    def TransferTimeSCallback(self) -> time_provider:
+        return self._transfer_time_s_callback
+
+    @TransferTimeSCallback.setter
+    def TransferTimeSCallback(self, callback: time_provider):
+        self._transfer_time_s_callback = callback
+
+    @property
+    def StationTransfers(self) -> List[StationTransfer]:
+        return list(self._station_transfers.values())
 
     def print_state(self):
         for id, station in self.Stations.items():
             print(station)
-
@@ -0,0 +1,209 @@
+import json
+import logging
+import math
+import struct
+import time
+from multiprocessing import shared_memory, resource_tracker
+from typing import Dict, List, Optional
+from coopprodsystem.factory.station import Station
+from coopprodsystem.factory.stationStatus import StationStatus
+from coopprodsystem.factory.stateStream import resource_uom_key
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b'CPSS'
+LAYOUT_VERSION = 1
+
+# magic, layout version, seq, time_perf, n_stations, n_input_slots, n_output_slots, metadata length
+_HEADER = struct.Struct('<4sIQdIIII')
+_SEQ_OFFSET = 8
+_SEQ = struct.Struct('<Q')
+# status bits, active productions, progress (nan when not producing), n_runs
+_STATION = struct.Struct('<IIdQ')
+
+_STATUS_ORDER = list(StationStatus)
+
+
+class SharedStateLayoutException(Exception):
+    def __init__(self):
+        super().__init__(str(type(self)))
+
+
+class SharedStateReadTimeoutException(Exception):
+    def __init__(self):
+        super().__init__(str(type(self)))
+
+
+def _status_bits(statuses: List[StationStatus]) -> int:
+    bits = 0
+    for status in statuses:
+        bits |= 1 << _STATUS_ORDER.index(status)
+    return bits
+
+
+def _align(n: int, to: int = 8) -> int:
+    return (n + to - 1) // to * to
+
+
+class SharedLineStateWriter:
+    """Publishes the stations of a line into a shared memory block other processes can read without locks.
+
+    The layout is fixed when the writer is created: a header, a json metadata block (station ids and the resource_uom
+    of every input/output slot) and one fixed-size record per station (status bits, active productions, progress,
+    n_runs, then one float64 per input and output slot). Writes are guarded by a seqlock: the sequence number is odd
+    while a write is in progress and readers retry until they see the same even number before and after their copy.
+
+    Stations added to the line after the writer was created are not published; removed stations keep their last
+    values. Create a new writer after changing the line topology.
+    """
+
+    def __init__(self, stations: Dict[str, Station], name: str = None):
+        self._station_ids = list(stations.keys())
+        self._inputs = [[x.content.resourceUoM for x in stations[id].input_reqs] for id in self._station_ids]
+        self._outputs = [[x.content.resourceUoM for x in stations[id].outputs] for id in self._station_ids]
+        self._n_input_slots = max((len(x) for x in self._inputs), default=0)
+        self._n_output_slots = max((len(x) for x in self._outputs), default=0)
+
+        metadata = json.dumps({
+            'stations': [str(x) for x in self._station_ids],
+            'inputs': [[resource_uom_key(ru) for ru in x] for x in self._inputs],
+            'outputs': [[resource_uom_key(ru) for ru in x] for x in self._outputs],
+            'statuses': [x.name for x in _STATUS_ORDER],
+        }).encode('utf-8')
+
+        self._record = struct.Struct(_STATION.format + 'd' * (self._n_input_slots + self._n_output_slots))
+        self._data_offset = _align(_HEADER.size + len(metadata))
+        size = self._data_offset + self._record.size * len(self._station_ids)
+
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self._buf = self._shm.buf
+        self._seq = 0
+        _HEADER.pack_into(self._buf, 0, _MAGIC, LAYOUT_VERSION, self._seq, math.nan, len(self._station_ids),
+                          self._n_input_slots, self._n_output_slots, len(metadata))
+        self._buf[_HEADER.size:_HEADER.size + len(metadata)] = metadata
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def publish(self, stations: Dict[str, Station], time_perf: float = None):
+        if time_perf is None:
+            time_perf = time.perf_counter()
+
+        # gather first so the odd (write in progress) window is only the memory writes
+        records = []
+        for ii, id in enumerate(self._station_ids):
+            station = stations.get(id, None)
+            if station is None:
+                records.append(None)
+                continue
+            progress = station.progress(time_perf)
+            stored, available = station.stored_inputs, station.available_output
+            records.append((
+                _status_bits(station.status),
+                station.active_productions,
+                math.nan if progress is None else progress,
+                station.n_runs,
+                *[stored.get(ru, 0.0) for ru in self._inputs[ii]],
+                *[0.0] * (self._n_input_slots - len(self._inputs[ii])),
+                *[available.get(ru, 0.0) for ru in self._outputs[ii]],
+                *[0.0] * (self._n_output_slots - len(self._outputs[ii])),
+            ))
+
+        buf = self._buf
+        self._seq += 1
+        _SEQ.pack_into(buf, _SEQ_OFFSET, self._seq)
+        struct.pack_into('<d', buf, _SEQ_OFFSET + _SEQ.size, time_perf)
+        for ii, record in enumerate(records):
+            if record is not None:
+                self._record.pack_into(buf, self._data_offset + ii * self._record.size, *record)
+        self._seq += 1
+        _SEQ.pack_into(buf, _SEQ_OFFSET, self._seq)
+
+    def close(self, unlink: bool = True):
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before python 3.13 attaching registers the block with the resource tracker, which would unlink it when
+        # this (reader) process exits
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+
+class SharedLineStateReader:
+    """Reads consistent snapshots of a line published by a SharedLineStateWriter, from any process"""
+
+    def __init__(self, name: str):
+        self._shm = _attach(name)
+        buf = self._shm.buf
+        magic, version, _, _, n_stations, n_in, n_out, meta_len = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC or version != LAYOUT_VERSION:
+            self._shm.close()
+            raise SharedStateLayoutException()
+
+        metadata = json.loads(bytes(buf[_HEADER.size:_HEADER.size + meta_len]).decode('utf-8'))
+        self._station_ids: List[str] = metadata['stations']
+        self._inputs: List[List[str]] = metadata['inputs']
+        self._outputs: List[List[str]] = metadata['outputs']
+        self._statuses: List[str] = metadata['statuses']
+        self._n_input_slots = n_in
+        self._record = struct.Struct(_STATION.format + 'd' * (n_in + n_out))
+        self._data_offset = _align(_HEADER.size + meta_len)
+        self._data_size = self._record.size * n_stations
+
+    @property
+    def station_ids(self) -> List[str]:
+        return self._station_ids
+
+    def _read_raw(self, max_retries: int) -> Optional[tuple]:
+        buf = self._shm.buf
+        for _ in range(max_retries):
+            before = _SEQ.unpack_from(buf, _SEQ_OFFSET)[0]
+            if before % 2:
+                continue
+            time_perf = struct.unpack_from('<d', buf, _SEQ_OFFSET + _SEQ.size)[0]
+            data = bytes(buf[self._data_offset:self._data_offset + self._data_size])
+            if _SEQ.unpack_from(buf, _SEQ_OFFSET)[0] == before:
+                return before, time_perf, data
+        return None
+
+    def snapshot(self, max_retries: int = 10000) -> Dict:
+        """{'seq', 'time_perf', 'stations': {id: {status, active_productions, progress, n_runs, inputs, outputs}}}"""
+        raw = self._read_raw(max_retries)
+        if raw is None:
+            raise SharedStateReadTimeoutException()
+        seq, time_perf, data = raw
+
+        stations = {}
+        for ii, id in enumerate(self._station_ids):
+            values = self._record.unpack_from(data, ii * self._record.size)
+            bits, active, progress, n_runs = values[:4]
+            slots = values[4:]
+            stations[id] = {
+                'status': [name for jj, name in enumerate(self._statuses) if bits & (1 << jj)],
+                'active_productions': active,
+                'progress': None if math.isnan(progress) else progress,
+                'n_runs': n_runs,
+                'inputs': dict(zip(self._inputs[ii], slots[:len(self._inputs[ii])])),
+                'outputs': dict(zip(self._outputs[ii], slots[self._n_input_slots:
+                                                             self._n_input_slots + len(self._outputs[ii])])),
+            }
+        return {'seq': seq, 'time_perf': time_perf, 'stations': stations}
+
+    def close(self):
+        self._shm.close()
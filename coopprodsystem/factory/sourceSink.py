@@ -0,0 +1,276 @@
+import bisect
+import csv
+import logging
+import math
+import random
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+import coopprodsystem.events as evnts
+from coopprodsystem.factory.stationResourceDefinition import StationResourceDefinition
+from coopprodsystem.factory.station import Station
+from coopprodsystem.factory.lotTracking import LotTracker
+from coopstorage.my_dataclasses import ResourceUoM, content_factory
+from coopprodsystem.loggingHelpers import should_log
+
+logger = logging.getLogger(__name__)
+
+
+class DemandProfile(ABC):
+    """Sequence of (offset_s, qty) events, offsets measured from the first update of the station using it"""
+
+    @abstractmethod
+    def next_event(self, after_offset_s: float) -> Optional[Tuple[float, float]]:
+        """First event strictly after after_offset_s"""
+        pass
+
+    def first_event(self) -> Optional[Tuple[float, float]]:
+        return self.next_event(0)
+
+
+class ConstantProfile(DemandProfile):
+    def __init__(self, interval_s: float, qty: float = 1, start_offset_s: float = None):
+        if interval_s <= 0:
+            raise ValueError(f"interval_s must be > 0, {interval_s} provided")
+        self.interval_s = interval_s
+        self.qty = qty
+        self.start_offset_s = interval_s if start_offset_s is None else start_offset_s
+
+    def first_event(self) -> Optional[Tuple[float, float]]:
+        return self.start_offset_s, self.qty
+
+    def next_event(self, after_offset_s: float) -> Optional[Tuple[float, float]]:
+        if after_offset_s < self.start_offset_s:
+            return self.start_offset_s, self.qty
+        # float rounding can land the next multiple back on after_offset_s, which would never advance the profile
+        n = math.floor((after_offset_s - self.start_offset_s) / self.interval_s) + 1
+        while self.start_offset_s + n * self.interval_s <= after_offset_s:
+            n += 1
+        return self.start_offset_s + n * self.interval_s, self.qty
+
+
+class PoissonProfile(DemandProfile):
+    def __init__(self, rate_per_s: float, qty: float = 1, rng: random.Random = None):
+        if rate_per_s <= 0:
+            raise ValueError(f"rate_per_s must be > 0, {rate_per_s} provided")
+        self.rate_per_s = rate_per_s
+        self.qty = qty
+        self._rng = rng or random.Random()
+
+    def next_event(self, after_offset_s: float) -> Optional[Tuple[float, float]]:
+        return after_offset_s + self._rng.expovariate(self.rate_per_s), self.qty
+
+
+class ScheduleProfile(DemandProfile):
+    """Explicit (offset_s, qty) schedule, optionally repeated every repeat_every_s"""
+
+    def __init__(self, schedule: List[Tuple[float, float]], repeat_every_s: float = None):
+        schedule = sorted(schedule)
+        if repeat_every_s is not None and schedule and schedule[-1][0] >= repeat_every_s:
+            raise ValueError(f"every schedule offset must be < repeat_every_s {repeat_every_s}")
+        self._offsets = [x[0] for x in schedule]
+        self._qtys = [x[1] for x in schedule]
+        self.repeat_every_s = repeat_every_s
+
+    @classmethod
+    def from_csv(cls,
+                 path: str,
+                 time_column: str = 'time_s',
+                 qty_column: str = 'qty',
+                 repeat_every_s: float = None) -> 'ScheduleProfile':
+        with open(path, newline='') as f:
+            schedule = [(float(row[time_column]), float(row[qty_column])) for row in csv.DictReader(f)]
+        return cls(schedule, repeat_every_s=repeat_every_s)
+
+    def first_event(self) -> Optional[Tuple[float, float]]:
+        idx = bisect.bisect_left(self._offsets, 0)
+        if idx < len(self._offsets):
+            return self._offsets[idx], self._qtys[idx]
+        return self.next_event(0)
+
+    def next_event(self, after_offset_s: float) -> Optional[Tuple[float, float]]:
+        if not self._offsets:
+            return None
+
+        cycle_start = 0.0
+        if self.repeat_every_s is not None:
+            cycle_start = (after_offset_s // self.repeat_every_s) * self.repeat_every_s if after_offset_s >= 0 else 0.0
+        idx = bisect.bisect_right(self._offsets, after_offset_s - cycle_start)
+        if idx < len(self._offsets):
+            return cycle_start + self._offsets[idx], self._qtys[idx]
+        if self.repeat_every_s is None:
+            return None
+        return cycle_start + self.repeat_every_s + self._offsets[0], self._qtys[0]
+
+
+class ThroughputTally:
+    """Running totals of what a sink consumed, in constant memory"""
+
+    def __init__(self):
+        self.n_events = 0
+        self.total_qty = 0.0
+        self.qty_by_resource_uom: Dict[ResourceUoM, float] = {}
+        self.unmet_qty = 0.0
+        self.first_perf: Optional[float] = None
+        self.last_perf: Optional[float] = None
+
+    def record(self, resource_uom: ResourceUoM, qty: float, time_perf: float):
+        self.n_events += 1
+        self.total_qty += qty
+        self.qty_by_resource_uom[resource_uom] = self.qty_by_resource_uom.get(resource_uom, 0) + qty
+        if self.first_perf is None:
+            self.first_perf = time_perf
+        self.last_perf = time_perf
+
+    def rate(self, since_perf: float, now_perf: float) -> float:
+        elapsed = now_perf - since_perf
+        return self.total_qty / elapsed if elapsed > 0 else 0.0
+
+
+class _ProfileDrivenStation(Station, ABC):
+    """Station whose update follows a demand profile instead of timed production runs"""
+
+    def __init__(self, profile: Optional[DemandProfile], **kwargs):
+        super().__init__(production_timer_sec_callback=lambda: 0, **kwargs)
+        self.profile = profile
+        self._origin_perf: Optional[float] = None
+        self._next_event: Optional[Tuple[float, float]] = None
+
+    def update(self, time_perf: float = None):
+        if time_perf is None:
+            time_perf = time.perf_counter()
+
+        if self._origin_perf is None:
+            self._origin_perf = time_perf
+            self._last_perf = time_perf
+            if self.profile is not None:
+                self._next_event = self.profile.first_event()
+
+        if self.profile is None:
+            self._handle_event(None, time_perf)
+        else:
+            while self._next_event is not None and self._origin_perf + self._next_event[0] <= time_perf:
+                offset, qty = self._next_event
+                self._last_perf = self._origin_perf + offset
+                self._handle_event(qty, self._last_perf)
+                self._next_event = self.profile.next_event(offset)
+                if self._next_event is not None and self._next_event[0] <= offset:
+                    logger.error("station_id %s: profile did not advance past offset %s, it is no longer followed",
+                                 self.id, offset)
+                    self._next_event = None
+
+        self._last_perf = time_perf
+
+    @abstractmethod
+    def _handle_event(self, qty: Optional[float], time_perf: float):
+        pass
+
+    def shift_time(self, shift_s: float):
+        super().shift_time(shift_s)
+        if self._origin_perf is not None:
+            self._origin_perf += shift_s
+
+
+class SourceStation(_ProfileDrivenStation):
+    """Releases material into the line per its arrival profile. Arrivals that do not fit in the output storage are
+    counted as lost"""
+
+    def __init__(self,
+                 output: StationResourceDefinition,
+                 profile: DemandProfile,
+                 id: str = None,
+                 type: str = None,
+                 lot_tracker: LotTracker = None):
+        super().__init__(profile=profile, output=[output], input_reqs=[], id=id, type=type, lot_tracker=lot_tracker)
+        self.lost_qty = 0.0
+
+    def _handle_event(self, qty: Optional[float], time_perf: float):
+        output = self._output[0].content
+        space = self.space_for_output[output.resourceUoM]
+        added = min(qty, space)
+        if added < qty:
+            self.lost_qty += qty - added
+            if should_log(logger, logging.DEBUG):
+                logger.debug("station_id %s: %s arrivals lost, output full", self.id, qty - added)
+        if added <= 0:
+            return
+
+        content = content_factory(output, qty=added)
+        self._output_storage.add_content(content)
+        if self._lot_tracker is not None:
+            self._push_lots(self._output_lots, content)
+        self._produced_totals[output.resourceUoM] = self._produced_totals.get(output.resourceUoM, 0) + added
+        self._n_runs += 1
+        evnts.raise_event_production_finished_at_station(args=evnts.OnProductionFinishedAtStationEventArgs(
+            station=self
+        ))
+
+
+class SinkStation(_ProfileDrivenStation):
+    """Consumes finished goods from its input storage per its demand profile and keeps a running tally of them.
+
+    With no profile everything delivered is consumed on the next update. With backlog, demand that cannot be met is
+    carried forward and served as soon as material arrives; otherwise it is counted as unmet and dropped. An update that
+    consumed anything raises PRODUCTION_FINISHED_AT_STATION, the sink's equivalent of a finished run.
+    """
+
+    def __init__(self,
+                 input_reqs: List[StationResourceDefinition],
+                 profile: DemandProfile = None,
+                 backlog: bool = True,
+                 id: str = None,
+                 type: str = None,
+                 lot_tracker: LotTracker = None):
+        super().__init__(profile=profile, output=[], input_reqs=input_reqs, id=id, type=type, lot_tracker=lot_tracker)
+        self.backlog = backlog
+        self.tally = ThroughputTally()
+        self._backlog_qty: Dict[ResourceUoM, float] = {x.content.resourceUoM: 0.0 for x in input_reqs}
+
+    def update(self, time_perf: float = None):
+        if time_perf is None:
+            time_perf = time.perf_counter()
+        consumed_before = self.tally.total_qty
+        super().update(time_perf)
+        if self.backlog and self.profile is not None and any(x > 0 for x in self._backlog_qty.values()):
+            self._serve_backlog(time_perf)
+
+        if self.tally.total_qty > consumed_before:
+            self._n_runs += 1
+            evnts.raise_event_production_finished_at_station(args=evnts.OnProductionFinishedAtStationEventArgs(
+                station=self
+            ))
+
+    def _handle_event(self, qty: Optional[float], time_perf: float):
+        for input_req in self._input_reqs:
+            ru = input_req.content.resourceUoM
+            if qty is None:
+                self._consume(ru, self.stored_inputs.get(ru, 0), time_perf)
+                continue
+
+            wanted = qty * input_req.content.qty + (self._backlog_qty[ru] if self.backlog else 0)
+            consumed = self._consume(ru, wanted, time_perf)
+            if self.backlog:
+                self._backlog_qty[ru] = wanted - consumed
+            else:
+                self.tally.unmet_qty += wanted - consumed
+
+    def _serve_backlog(self, time_perf: float):
+        for ru, owed in self._backlog_qty.items():
+            if owed > 0:
+                self._backlog_qty[ru] = owed - self._consume(ru, owed, time_perf)
+
+    def _consume(self, resource_uom: ResourceUoM, qty: float, time_perf: float) -> float:
+        qty = min(qty, self.stored_inputs.get(resource_uom, 0))
+        if qty <= 0:
+            return 0
+        self._input_storage.remove_content(content_factory(resource_uom=resource_uom, qty=qty))
+        if self._lot_tracker is not None:
+            _, emptied = self._lot_queue(self._input_lots, resource_uom).draw(qty)
+            for lot_id in emptied:
+                self._lot_tracker.mark_consumed(lot_id, time_perf)
+        self.tally.record(resource_uom, qty, time_perf)
+        return qty
+
+    @property
+    def backlog_qty(self) -> Dict[ResourceUoM, float]:
+        return dict(self._backlog_qty)
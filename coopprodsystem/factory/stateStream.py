@@ -0,0 +1,449 @@
+import io
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import auto
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+from cooptools.coopEnum import CoopEnum
+from coopstorage.my_dataclasses import ResourceUoM
+from coopprodsystem.factory.productionLine import ProductionLine
+from coopprodsystem.loggingHelpers import should_log
+
+logger = logging.getLogger(__name__)
+
+# frame header: frame type, sequence number, time_perf, payload length
+_HEADER = struct.Struct('<BIdI')
+
+
+class FrameType(CoopEnum):
+    KEYFRAME = auto()
+    DELTA = auto()
+
+
+class StateStreamDecodeException(Exception):
+    def __init__(self):
+        super().__init__(str(type(self)))
+
+
+# -- compact tagged binary encoding of None/bool/int/float/str/list/dict ------------------------------------------------
+
+_U32 = struct.Struct('<I')
+_I64 = struct.Struct('<q')
+_F64 = struct.Struct('<d')
+
+
+def _encode_value(value: Any, out: bytearray):
+    if value is None:
+        out += b'N'
+    elif value is True:
+        out += b'T'
+    elif value is False:
+        out += b'F'
+    elif isinstance(value, int):
+        out += b'i'
+        out += _I64.pack(value)
+    elif isinstance(value, float):
+        out += b'd'
+        out += _F64.pack(value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        out += b's'
+        out += _U32.pack(len(data))
+        out += data
+    elif isinstance(value, (list, tuple)):
+        out += b'l'
+        out += _U32.pack(len(value))
+        for x in value:
+            _encode_value(x, out)
+    elif isinstance(value, dict):
+        out += b'm'
+        out += _U32.pack(len(value))
+        for k, v in value.items():
+            _encode_value(k, out)
+            _encode_value(v, out)
+    else:
+        raise TypeError(f"Cannot encode value of type {type(value)} into a state frame")
+
+
+def _decode_value(data: memoryview, pos: int) -> Tuple[Any, int]:
+    tag = data[pos:pos + 1].tobytes()
+    pos += 1
+    if tag == b'N':
+        return None, pos
+    if tag == b'T':
+        return True, pos
+    if tag == b'F':
+        return False, pos
+    if tag == b'i':
+        return _I64.unpack_from(data, pos)[0], pos + 8
+    if tag == b'd':
+        return _F64.unpack_from(data, pos)[0], pos + 8
+    if tag == b's':
+        n = _U32.unpack_from(data, pos)[0]
+        pos += 4
+        return data[pos:pos + n].tobytes().decode('utf-8'), pos + n
+    if tag == b'l':
+        n = _U32.unpack_from(data, pos)[0]
+        pos += 4
+        ret = []
+        for _ in range(n):
+            value, pos = _decode_value(data, pos)
+            ret.append(value)
+        return ret, pos
+    if tag == b'm':
+        n = _U32.unpack_from(data, pos)[0]
+        pos += 4
+        ret = {}
+        for _ in range(n):
+            key, pos = _decode_value(data, pos)
+            ret[key], pos = _decode_value(data, pos)
+        return ret, pos
+    raise StateStreamDecodeException()
+
+
+@dataclass(frozen=True)
+class StateFrame:
+    type: FrameType
+    seq: int
+    time_perf: float
+    payload: Dict
+
+    def encode(self) -> bytes:
+        body = bytearray()
+        _encode_value(self.payload, body)
+        return _HEADER.pack(self.type.value, self.seq, self.time_perf, len(body)) + bytes(body)
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'StateFrame':
+        frame_type, seq, time_perf, length = _HEADER.unpack_from(data, 0)
+        payload, _ = _decode_value(memoryview(data)[_HEADER.size:_HEADER.size + length], 0)
+        return StateFrame(type=FrameType(frame_type), seq=seq, time_perf=time_perf, payload=payload)
+
+
+def read_frames(stream: BinaryIO) -> Iterator[StateFrame]:
+    """Frames from a stream written by a FileFrameSink or SocketFrameSink"""
+    while True:
+        header = stream.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        length = _HEADER.unpack(header)[3]
+        body = stream.read(length)
+        if len(body) < length:
+            return
+        yield StateFrame.decode(header + body)
+
+
+# -- snapshots and deltas ----------------------------------------------------------------------------------------------
+
+def resource_uom_key(resource_uom: ResourceUoM) -> str:
+    return f"{resource_uom.resource.name}/{resource_uom.uom.name}"
+
+
+def line_snapshot(line: ProductionLine, time_perf: float, progress_resolution: float = 0.01) -> Dict:
+    """Plain-data view of the line: per station status, inventory and progress, plus every in-flight transfer.
+
+    Progress is quantized to progress_resolution so that a producing station does not change on every tick. Transfers
+    carry their start and duration instead of progress; viewers interpolate. The snapshot is taken under the line's
+    lock so a publisher thread never sees a half-applied update.
+    """
+    with line.locked():
+        stations = {}
+        for id, station in list(line.Stations.items()):
+            progress = station.progress(time_perf)
+            if progress is not None:
+                progress = round(round(progress / progress_resolution) * progress_resolution, 6)
+            stations[str(id)] = {
+                'status': [x.name for x in station.status],
+                'inputs': {resource_uom_key(ru): float(qty) for ru, qty in station.stored_inputs.items()},
+                'outputs': {resource_uom_key(ru): float(qty) for ru, qty in station.available_output.items()},
+                'progress': progress,
+            }
+
+        transfers = {str(x.id): [str(x.from_id),
+                                 str(x.to_id),
+                                 resource_uom_key(x.content.resourceUoM),
+                                 float(x.content.qty),
+                                 float(x.timer.start_perf),
+                                 int(x.timer.time_ms)] for x in line.StationTransfers}
+
+    return {'stations': stations, 'transfers': transfers}
+
+
+def _dict_delta(prev: Dict, curr: Dict) -> Dict:
+    """Changed keys of a flat dict; removed keys are sent as None"""
+    delta = {k: v for k, v in curr.items() if prev.get(k, None) != v}
+    for k in prev:
+        if k not in curr:
+            delta[k] = None
+    return delta
+
+
+def snapshot_delta(prev: Dict, curr: Dict) -> Dict:
+    stations = {}
+    for id, state in curr['stations'].items():
+        prev_state = prev['stations'].get(id, None)
+        if prev_state is None:
+            stations[id] = state
+            continue
+
+        changed = {}
+        for field, value in state.items():
+            if value == prev_state[field]:
+                continue
+            changed[field] = _dict_delta(prev_state[field], value) if isinstance(value, dict) else value
+        if changed:
+            stations[id] = changed
+
+    delta = {}
+    if stations:
+        delta['stations'] = stations
+    removed = [id for id in prev['stations'] if id not in curr['stations']]
+    if removed:
+        delta['removed_stations'] = removed
+    started = {id: x for id, x in curr['transfers'].items() if id not in prev['transfers']}
+    if started:
+        delta['transfers_started'] = started
+    finished = [id for id in prev['transfers'] if id not in curr['transfers']]
+    if finished:
+        delta['transfers_finished'] = finished
+    return delta
+
+
+def apply_frame(state: Optional[Dict], frame: StateFrame) -> Dict:
+    """Fold a frame into a viewer-side snapshot. Deltas received before the first keyframe are ignored"""
+    if frame.type == FrameType.KEYFRAME:
+        return frame.payload
+    if state is None:
+        return None
+
+    payload = frame.payload
+    for id, changed in payload.get('stations', {}).items():
+        station = state['stations'].setdefault(id, {})
+        for field, value in changed.items():
+            if isinstance(value, dict) and field in station:
+                for k, v in value.items():
+                    if v is None:
+                        station[field].pop(k, None)
+                    else:
+                        station[field][k] = v
+            else:
+                station[field] = value
+    for id in payload.get('removed_stations', []):
+        state['stations'].pop(id, None)
+    state['transfers'].update(payload.get('transfers_started', {}))
+    for id in payload.get('transfers_finished', []):
+        state['transfers'].pop(id, None)
+    return state
+
+
+# -- sinks -------------------------------------------------------------------------------------------------------------
+
+class FrameSink(ABC):
+    """Destination for encoded frames. needs_keyframe asks the publisher to send a full frame next"""
+
+    needs_keyframe: bool = False
+
+    @abstractmethod
+    def write(self, data: bytes):
+        pass
+
+    def close(self):
+        pass
+
+
+class FileFrameSink(FrameSink):
+    def __init__(self, path: str, flush: bool = True):
+        self._file = open(path, 'ab')
+        self._flush = flush
+        self.needs_keyframe = True
+
+    def write(self, data: bytes):
+        self._file.write(data)
+        if self._flush:
+            self._file.flush()
+        self.needs_keyframe = False
+
+    def close(self):
+        self._file.close()
+
+
+class BufferFrameSink(FrameSink):
+    """Keeps frames in memory, mostly for tests and in-process viewers"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data: bytes):
+        self.buffer.write(data)
+
+    def frames(self) -> List[StateFrame]:
+        return list(read_frames(io.BytesIO(self.buffer.getvalue())))
+
+
+class SocketFrameSink(FrameSink):
+    """Serves the stream to any number of local viewers over a unix domain socket (or TCP when address is a
+    (host, port) tuple). A viewer that connects gets a keyframe first; a viewer that cannot keep up is dropped"""
+
+    def __init__(self, address, backlog: int = 8, send_timeout_s: float = 0.05):
+        # AF_UNIX only exists where unix domain sockets do, it is not touched for TCP addresses
+        if isinstance(address, str):
+            family = socket.AF_UNIX
+            if os.path.exists(address):
+                os.remove(address)
+        else:
+            family = socket.AF_INET
+
+        self._server = socket.socket(family, socket.SOCK_STREAM)
+        self._server.bind(address)
+        self._server.listen(backlog)
+        self._server.setblocking(False)
+        self._address = address
+        self._send_timeout_s = send_timeout_s
+        self._clients: List[socket.socket] = []
+
+    @property
+    def address(self):
+        return self._server.getsockname()
+
+    @property
+    def n_clients(self) -> int:
+        return len(self._clients)
+
+    def accept_pending(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            client.settimeout(self._send_timeout_s)
+            self._clients.append(client)
+            self.needs_keyframe = True
+
+    def write(self, data: bytes):
+        self.needs_keyframe = False
+        for client in list(self._clients):
+            try:
+                client.sendall(data)
+            except OSError:
+                logger.warning("state stream viewer disconnected or too slow, dropping it")
+                self._clients.remove(client)
+                client.close()
+
+    def close(self):
+        for client in self._clients:
+            client.close()
+        self._clients.clear()
+        self._server.close()
+        if not isinstance(self._address, tuple) and os.path.exists(self._address):
+            os.remove(self._address)
+
+
+# -- publisher ---------------------------------------------------------------------------------------------------------
+
+class StateStreamPublisher:
+    """Publishes the line state as a stream of frames: a keyframe every keyframe_every frames (and whenever a sink asks
+    for one) and in between only what changed since the previous frame. Empty deltas are still sent as a heartbeat.
+
+    Frames are built from one snapshot per publish, so the cost is one pass over the line per frame regardless of the
+    number of viewers.
+    """
+
+    def __init__(self,
+                 line: ProductionLine,
+                 sinks: List[FrameSink],
+                 rate_hz: float = 10,
+                 keyframe_every: int = 50,
+                 progress_resolution: float = 0.01,
+                 time_provider=None):
+        if rate_hz <= 0:
+            raise ValueError(f"rate_hz must be > 0, {rate_hz} provided")
+        if keyframe_every < 1:
+            raise ValueError(f"keyframe_every must be >= 1, {keyframe_every} provided")
+
+        self._line = line
+        self._sinks = sinks
+        self.rate_hz = rate_hz
+        self.keyframe_every = keyframe_every
+        self.progress_resolution = progress_resolution
+        self._time_provider = time_provider or time.perf_counter
+
+        self._seq = 0
+        self._last_snapshot: Optional[Dict] = None
+        self._since_keyframe = 0
+        self._bytes_sent = 0
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def publish(self, time_perf: float = None) -> StateFrame:
+        if time_perf is None:
+            time_perf = self._time_provider()
+
+        for sink in self._sinks:
+            if isinstance(sink, SocketFrameSink):
+                sink.accept_pending()
+
+        snapshot = line_snapshot(self._line, time_perf, self.progress_resolution)
+        keyframe = self._last_snapshot is None \
+                   or self._since_keyframe >= self.keyframe_every - 1 \
+                   or any(x.needs_keyframe for x in self._sinks)
+
+        if keyframe:
+            frame = StateFrame(FrameType.KEYFRAME, self._seq, time_perf, snapshot)
+            self._since_keyframe = 0
+        else:
+            frame = StateFrame(FrameType.DELTA, self._seq, time_perf, snapshot_delta(self._last_snapshot, snapshot))
+            self._since_keyframe += 1
+
+        data = frame.encode()
+        for sink in self._sinks:
+            sink.write(data)
+
+        self._seq += 1
+        self._bytes_sent += len(data)
+        self._last_snapshot = snapshot
+        if should_log(logger, logging.DEBUG):
+            logger.debug("state frame %s (%s): %s bytes", frame.seq, frame.type.name, len(data))
+        return frame
+
+    def start_async(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="state_stream_publisher")
+        self._thread.start()
+
+    def stop_async(self, timeout: float = None):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        period = 1 / self.rate_hz
+        next_perf = time.perf_counter()
+        while not self._stop_event.is_set():
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error("state stream publish failed: %s", e)
+            next_perf += period
+            self._stop_event.wait(max(next_perf - time.perf_counter(), 0))
+
+    def close(self):
+        self.stop_async()
+        for sink in self._sinks:
+            sink.close()
+
+    @property
+    def n_frames(self) -> int:
+        return self._seq
+
+    @property
+    def bytes_sent(self) -> int:
+        return self._bytes_sent
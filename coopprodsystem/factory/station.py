@@ -1,13 +1,17 @@
 import time
 import threading
 import uuid
+import heapq
+import itertools
 
-from typing import List, Optional, Callable, Dict
+from typing import List, Optional, Callable, Dict, Tuple
 from cooptools.timedDecay import Timer, TimedDecay
 import logging
 import coopprodsystem.events as evnts
 from coopprodsystem.factory.stationResourceDefinition import StationResourceDefinition
 from coopprodsystem.factory.stationStatus import StationStatus
+from coopprodsystem.factory.downtime import DowntimeSchedule, DowntimeWindow, DOWNTIME_STATUS
+from coopprodsystem.factory.lotTracking import LotTracker, LotQueue, LotPortion
 from cooptools.coopEnum import CoopEnum
 from enum import auto
 from cooptools.expertise.expertiseSchedules import ExpertiseSchedule, ExpertiseCalculator
@@ -16,6 +20,7 @@ from cooptools.timeWindow import TaggedTimeWindow, TimeWindow
 from cooptools.metrics import Metrics
 from coopstorage.storage import Storage, Location, StorageState
 from coopstorage.my_dataclasses import UoMCapacity, Content, content_factory, ResourceUoM
+from coopprodsystem.loggingHelpers import should_log
 
 logger = logging.getLogger(__name__)
 
@@ -42,9 +47,30 @@ class InvalidInputToAddToStationException(Exception):
         super().__init__(str(type(self)))
 
 
+class InvalidOutputToAddToStationException(Exception):
+    def __init__(self):
+        super().__init__(str(type(self)))
+
+
+class ProductionNotAuthorizedException(Exception):
+    def __init__(self):
+        super().__init__(str(type(self)))
+
+
 class StationProductionStrategy(CoopEnum):
     PRODUCE_IF_ALL_SPACE_AVAIL = auto()
     PRODUCE_IF_ANY_SPACE_AVAIL = auto()
+    KANBAN = auto()
+    CONWIP = auto()
+    PRODUCE_TO_ORDER = auto()
+
+
+# demand-pull strategies: need room for a run and a go-ahead from the line the station is on
+PULL_STRATEGIES = (StationProductionStrategy.KANBAN,
+                   StationProductionStrategy.CONWIP,
+                   StationProductionStrategy.PRODUCE_TO_ORDER)
+
+ProductionAuthorizer = Callable[['Station'], bool]
 
 
 class Station:
@@ -57,7 +83,13 @@ class Station:
                  production_strategy: StationProductionStrategy = None,
                  expertise_schedule: ExpertiseSchedule = None,
                  start_on_init: bool = False,
+                 production_slots: int = 1,
+                 downtime_schedule: DowntimeSchedule = None,
+                 lot_tracker: LotTracker = None,
                  ):
+        if production_slots < 1:
+            raise ValueError(f"production_slots must be >= 1, {production_slots} provided")
+
         self.id = id if id else uuid.uuid4()
         self.type = type
         self._input_reqs = input_reqs or []
@@ -74,16 +106,34 @@ class Station:
                                 uom_capacities=frozenset([UoMCapacity(x.content.uom, x.storage_capacity)]),
                                 resource_limitations=frozenset([x.content.resource])) for ii, x in enumerate(output)])
         self._production_time_sec_callback = production_timer_sec_callback
-        self._production_timer: Optional[TimedDecay] = None
+        self._production_slots = production_slots
+        # heap of [end_perf, seq, timer, consumed lot portions per input req] for the runs in progress; the earliest
+        # finishing run is always first
+        self._production_timers: List[list] = []
+        self._production_seq = itertools.count()
         self.production_strategy: StationProductionStrategy = production_strategy or StationProductionStrategy.PRODUCE_IF_ALL_SPACE_AVAIL
 
         self._production_time_sec = None
         self.last_prod_s = None
+        self.last_sampled_prod_s = None
 
         self._expertise_calculator = ExpertiseCalculator(schedule=expertise_schedule)
+        self._n_runs = 0
+        self._s_producing = 0.0
+        self._produced_totals: Dict[ResourceUoM, float] = {}
 
         self.current_exception = None
         self._last_perf = None
+        self._production_authorizer: Optional[ProductionAuthorizer] = None
+
+        self._downtime_schedule = downtime_schedule
+        self._next_downtime_event_perf = downtime_schedule.next_event_perf if downtime_schedule else None
+
+        self._lot_tracker = None
+        self._input_lots: Dict[ResourceUoM, LotQueue] = {}
+        self._output_lots: Dict[ResourceUoM, LotQueue] = {}
+        if lot_tracker is not None:
+            self.set_lot_tracker(lot_tracker)
 
         self._metrics = Metrics()
 
@@ -102,6 +152,9 @@ class Station:
     def start_async(self):
         self._async_worker.start_async()
 
+    def stop_async(self):
+        self._async_worker.stop_async()
+
     def _async_loop(self):
         while True:
             self.update()
@@ -114,46 +167,125 @@ class Station:
         if self._last_perf is None:
             self._last_perf = time_perf
 
-        if not self.producing:
-            self._try_start_producing(time_perf)
-        elif self.production_complete(time_perf):
-            self.finish_producing()
-            self._expertise_calculator.increment_s_producting(time_perf - self._last_perf)
-        else:
-            logger.debug(f"station_id {self.id}: producing...")
-            self._expertise_calculator.increment_s_producting(time_perf - self._last_perf)
+        if self._downtime_schedule is not None:
+            if time_perf >= self._next_downtime_event_perf:
+                self._handle_downtime_transitions(time_perf)
+            if self._downtime_schedule.current is not None:
+                self._last_perf = time_perf
+                return
+
+        # slots that finish on this update are only refilled on the next one
+        free_slots = self._production_slots - len(self._production_timers)
+
+        if self.producing:
+            while self.production_complete(time_perf):
+                self.finish_producing()
+            if should_log(logger, logging.DEBUG):
+                logger.debug("station_id %s: producing...", self.id)
+            self._increment_s_producing(time_perf - self._last_perf)
+
+        # the exception only clears once every free slot started, a partial start leaves the limiting one in place
+        started_all = True
+        for _ in range(free_slots):
+            if not self._try_start_producing(time_perf):
+                started_all = False
+                break
+        if free_slots > 0 and started_all:
+            self._set_current_exception(None)
 
         # self._metrics.add_time_windows([TaggedTimeWindow(window=TimeWindow(start=self._last_perf, end=time_perf), tags=self.status)])
         self._last_perf = time_perf
 
+    def _handle_downtime_transitions(self, time_perf: float):
+        for started, window in self._downtime_schedule.advance(time_perf):
+            if started:
+                evnts.raise_event_station_downtime_started(args=evnts.OnStationDowntimeStartedEventArgs(
+                    station=self,
+                    downtime=window
+                ))
+                logger.info("station_id %s: %s started for %ss", self.id, window.type.name, window.duration_s)
+                continue
+
+            # runs in progress were paused for the length of the window
+            self.shift_time(window.duration_s)
+            self._last_perf = time_perf
+            if window.on_complete is not None:
+                window.on_complete(self)
+            evnts.raise_event_station_downtime_ended(args=evnts.OnStationDowntimeEndedEventArgs(
+                station=self,
+                downtime=window
+            ))
+            logger.info("station_id %s: %s ended", self.id, window.type.name)
+
+        self._next_downtime_event_perf = self._downtime_schedule.next_event_perf
+
+    def _increment_s_producing(self, seconds: float):
+        self._s_producing += seconds
+        self._expertise_calculator.increment_s_producting(seconds)
+
+    def advance_counters(self, n_runs: int, s_producing: float, produced: Dict[ResourceUoM, float]):
+        """Credit the station with runs and output that happened without being stepped (e.g. fast-forwarded)"""
+        self._n_runs += n_runs
+        self._expertise_calculator.increment_n_runs(n_runs)
+        self._increment_s_producing(s_producing)
+        for resource_uom, qty in produced.items():
+            self._produced_totals[resource_uom] = self._produced_totals.get(resource_uom, 0) + qty
+
+    def shift_time(self, shift_s: float):
+        """Move the in-progress production timers and last update forward by shift_s"""
+        for entry in self._production_timers:
+            entry[0] += shift_s
+            entry[2].set_start(entry[2].start_perf + shift_s)
+        if self._last_perf is not None:
+            self._last_perf += shift_s
+
+    def production_phases(self, time_perf: float) -> List[Tuple[float, int]]:
+        """(seconds since production started, production time ms) of every run in progress, earliest finishing first"""
+        return [(time_perf - entry[2].start_perf, entry[2].time_ms) for entry in sorted(self._production_timers)]
+
     def progress(self, time_perf=None):
-        if self._production_timer is None:
+        """Progress of the run that will finish first, None when not producing"""
+        if not self._production_timers:
             return None
 
         if time_perf is None: time_perf = time.perf_counter()
-        return self._production_timer.progress_at_time(time_perf)
+        return self._production_timers[0][2].progress_at_time(time_perf)
 
     @property
     def producing(self):
-        return True if self._production_timer is not None else False
+        return len(self._production_timers) > 0
+
+    @property
+    def active_productions(self) -> int:
+        return len(self._production_timers)
+
+    @property
+    def production_slots(self) -> int:
+        return self._production_slots
 
     def _set_current_exception(self, e: Exception):
-        if type(e) != type(self.current_exception):
-            logger.warning(f"station_id {self.id}: {e}")
+        # neither the log record nor the station keeps the traceback, its frames would keep the station (and everything
+        # the raising calls referenced) alive for as long as the record or the exception is retained
+        if e is not None:
+            e = e.with_traceback(None)
+        if e is not None and type(e) != type(self.current_exception):
+            logger.warning("station_id %s: %s", self.id, type(e).__name__)
 
         self.current_exception = e
 
 
-    def _try_start_producing(self, time_perf):
+    def _try_start_producing(self, time_perf) -> bool:
         try:
             self._start_producing(time_perf)
-            self._set_current_exception(None)
+            return True
             # self.current_exception = None
         except (AtMaxCapacityException,
                 OutputStorageToFullToProduceException,
                 NotEnoughInputToProduceException,
-                InvalidInputToAddToStationException) as e:
+                InvalidInputToAddToStationException,
+                ProductionNotAuthorizedException) as e:
             self._set_current_exception(e)
+            return False
             #
             # self.current_exception = e
             # logger.warning(f"station_id {self.id}: {e}")
@@ -163,7 +295,7 @@ class Station:
 
     def _start_producing(self, time_perf: float = None):
         # verify have capacity to produce
-        if self.producing:
+        if len(self._production_timers) >= self._production_slots:
             raise AtMaxCapacityException()
 
         # check if room for outputs to be produced
@@ -172,42 +304,71 @@ class Station:
         # check if enough input to produce
         self._raise_if_not_enough_inputs()
 
+        # check if demand downstream pulls for another run
+        self._raise_if_not_authorized()
+
         # consume inputs
-        self._consume_input()
+        if time_perf is None: time_perf = time.perf_counter()
+        consumed_lots = self._consume_input(time_perf)
 
         # get the production time
-        self._production_time_sec = self._production_time_sec_callback() * (
+        self.last_sampled_prod_s = self._production_time_sec_callback()
+        self._production_time_sec = self.last_sampled_prod_s * (
                     1 - self._expertise_calculator.CurrentTimeReductionPerc)
 
         # update last prod time
         self.last_prod_s = self._production_time_sec
 
         # start the timer
-        if time_perf is None: time_perf = time.perf_counter()
-        self._production_timer = TimedDecay(time_ms=int(self._production_time_sec * 1000),
-                                            start_perf=time_perf)
-        # self._production_timer = Timer(int(self._production_time_sec * 1000), start_on_init=True)
+        timer = TimedDecay(time_ms=int(self._production_time_sec * 1000), start_perf=time_perf)
+        heapq.heappush(self._production_timers,
+                       [time_perf + timer.time_ms / 1000, next(self._production_seq), timer, consumed_lots])
 
         # raise event
         evnts.raise_event_production_started_at_station(args=evnts.OnProductionStartedAtStationEventArgs(
             station=self
         ))
 
-        logger.info(f"station_id {self.id}: Production Started")
+        if should_log(logger, logging.INFO):
+            logger.info("station_id %s: Production Started", self.id)
 
     def _raise_if_no_room_for_outputs(self):
+        # space is reserved for the output of the runs already in progress
+        n_running = len(self._production_timers)
         space_minus_prod_run = self.output_space_minus_production_run
         open_space = self.space_for_output
-        if self.production_strategy == StationProductionStrategy.PRODUCE_IF_ALL_SPACE_AVAIL and \
+        if n_running > 0:
+            run_qty = {x.content.resourceUoM: x.content.qty for x in self._output}
+            space_minus_prod_run = {ru: qty - n_running * run_qty[ru] for ru, qty in space_minus_prod_run.items()}
+            open_space = {ru: qty - n_running * run_qty[ru] for ru, qty in open_space.items()}
+
+        # a pull station that is not on a line has nothing pulling on it and behaves like PRODUCE_IF_ALL_SPACE_AVAIL
+        pulled = self.production_strategy in PULL_STRATEGIES and self._production_authorizer is not None
+        if (self.production_strategy == StationProductionStrategy.PRODUCE_IF_ALL_SPACE_AVAIL or
+                self.production_strategy in PULL_STRATEGIES and not pulled) and \
                 not all(x >= 0 for x in space_minus_prod_run.values()):
             raise OutputStorageToFullToProduceException()
+        # pull stations need room for a whole run of at least one output, so one slow-moving joint output does not
+        # block the others
+        elif pulled and not any(x >= 0 for x in space_minus_prod_run.values()):
+            raise OutputStorageToFullToProduceException()
         elif self.production_strategy == StationProductionStrategy.PRODUCE_IF_ANY_SPACE_AVAIL and \
                 not any(x > 0 for x in open_space.values()):
             raise OutputStorageToFullToProduceException()
         elif self.production_strategy not in [StationProductionStrategy.PRODUCE_IF_ANY_SPACE_AVAIL,
-                                              StationProductionStrategy.PRODUCE_IF_ALL_SPACE_AVAIL]:
+                                              StationProductionStrategy.PRODUCE_IF_ALL_SPACE_AVAIL,
+                                              *PULL_STRATEGIES]:
             raise NotImplementedError(f"Production Strategy: {self.production_strategy} is unrecognized for producing")
 
+    def _raise_if_not_authorized(self):
+        if self.production_strategy in PULL_STRATEGIES and self._production_authorizer is not None and \
+                not self._production_authorizer(self):
+            raise ProductionNotAuthorizedException()
+
+    def set_production_authorizer(self, authorizer: Optional[ProductionAuthorizer]):
+        """Callback deciding whether a station with a pull strategy may start a run, set by the line it is on"""
+        self._production_authorizer = authorizer
+
     def _raise_if_not_enough_inputs(self):
         for input_req in self._input_reqs:
             stored_in = self._input_storage.state.qty_of_resource_uoms(resource_uoms=[input_req.content.resourceUoM])[
@@ -215,18 +376,73 @@ class Station:
             if stored_in < input_req.content.qty:
                 raise NotEnoughInputToProduceException()
 
-    def add_input(self, inputs: List[Content]):
+    def add_input(self, inputs: List[Content], lots: List[List[LotPortion]] = None):
+        """Add content to the input storage. When lot tracking, lots[ii] are the lot portions making up inputs[ii];
+        content added without lots is treated as raw material and gets a new lot"""
         with threading.Lock():
-            for input in inputs:
+            for ii, input in enumerate(inputs):
                 if not any([x.content.match_resouce_uom(input) for x in self._input_reqs]):
                     raise InvalidInputToAddToStationException()
                 self._input_storage.add_content(content_factory(input))
-                logger.info(f"station_id {self.id}: Content added: {input}")
-
-    def _consume_input(self):
+                if self._lot_tracker is not None:
+                    self._push_lots(self._input_lots, input, lots[ii] if lots else None)
+                if should_log(logger, logging.INFO):
+                    logger.info("station_id %s: Content added: %s", self.id, input)
+
+    def _consume_input(self, time_perf: float) -> List[List[LotPortion]]:
+        """Remove one run worth of input. Returns the lot portions drawn for each input req when lot tracking"""
+        consumed_lots = []
         with threading.Lock():
             for input_req in self._input_reqs:
                 self._input_storage.remove_content(content_factory(input_req.content))
+                if self._lot_tracker is not None:
+                    drawn, emptied = self._lot_queue(self._input_lots, input_req.content.resourceUoM).draw(
+                        input_req.content.qty)
+                    consumed_lots.append(drawn)
+                    for lot_id in emptied:
+                        self._lot_tracker.mark_consumed(lot_id, time_perf)
+        return consumed_lots
+
+    def set_lot_tracker(self, lot_tracker: Optional[LotTracker]):
+        """Start (or stop, with None) recording lots. Inventory already held is recorded as new lots"""
+        self._lot_tracker = lot_tracker
+        self._input_lots = {}
+        self._output_lots = {}
+        if lot_tracker is None:
+            return
+
+        for content in self.stored_inputs_as_content:
+            self._push_lots(self._input_lots, content)
+        for content in self.available_output_as_content:
+            self._push_lots(self._output_lots, content)
+
+    @staticmethod
+    def _lot_queue(queues: Dict[ResourceUoM, LotQueue], resource_uom: ResourceUoM) -> LotQueue:
+        queue = queues.get(resource_uom, None)
+        if queue is None:
+            queue = queues[resource_uom] = LotQueue()
+        return queue
+
+    def _push_lots(self, queues: Dict[ResourceUoM, LotQueue], content: Content, lots: List[LotPortion] = None):
+        if content.qty <= 0:
+            return
+        if not lots:
+            created = self._last_perf if self._last_perf is not None else time.perf_counter()
+            lots = [(self._lot_tracker.new_lot(content.resourceUoM, content.qty, created, station_id=self.id),
+                     content.qty)]
+        self._lot_queue(queues, content.resourceUoM).extend(lots)
+
+    @property
+    def lot_tracker(self) -> Optional[LotTracker]:
+        return self._lot_tracker
+
+    @property
+    def input_lots(self) -> Dict[ResourceUoM, List[LotPortion]]:
+        return {ru: queue.portions for ru, queue in self._input_lots.items()}
+
+    @property
+    def output_lots(self) -> Dict[ResourceUoM, List[LotPortion]]:
+        return {ru: queue.portions for ru, queue in self._output_lots.items()}
 
     @property
     def available_output(self) -> Dict[ResourceUoM, float]:
@@ -237,20 +453,64 @@ class Station:
         return self.resource_uom_float_nested_to_content(self.available_output)
 
     def remove_output(self, content: List[Content]) -> List[Content]:
+        """Remove content from the output storage. When lot tracking, lots emptied this way have left the line and
+        are marked consumed; partly drawn lots stay open for the qty still in storage"""
+        removed, _, emptied = self._remove_output(content)
+        if self._lot_tracker is not None:
+            now = self._last_perf if self._last_perf is not None else time.perf_counter()
+            for lot_id in emptied:
+                self._lot_tracker.mark_consumed(lot_id, now)
+        return removed
+
+    def remove_output_with_lots(self, content: List[Content]) -> Tuple[List[Content], List[List[LotPortion]]]:
+        """Remove content from the output storage along with the lot portions (oldest first) that make it up"""
+        removed, lots, _ = self._remove_output(content)
+        return removed, lots
+
+    def _remove_output(self, content: List[Content]) -> Tuple[List[Content], List[List[LotPortion]], List[int]]:
         with threading.Lock():
             removed = []
+            lots = []
+            emptied = []
             for c in content:
                 rmvd = self._output_storage.remove_content(c)
                 removed.append(rmvd)
-                logger.info(f"station_id {self.id}: Content removed: {content}")
+                if self._lot_tracker is not None:
+                    portions, emptied_lots = self._lot_queue(self._output_lots, c.resourceUoM).draw(rmvd.qty)
+                    lots.append(portions)
+                    emptied += emptied_lots
+                if should_log(logger, logging.INFO):
+                    logger.info("station_id %s: Content removed: %s", self.id, c)
 
-            return removed
+            return removed, lots, emptied
+
+    def add_output(self, outputs: List[Content], lots: List[List[LotPortion]] = None):
+        """Put content back into the output storage, e.g. material returned from a cancelled transfer"""
+        with threading.Lock():
+            for ii, output in enumerate(outputs):
+                if not any([x.content.match_resouce_uom(output) for x in self._output]):
+                    raise InvalidOutputToAddToStationException()
+                self._output_storage.add_content(content_factory(output))
+                if self._lot_tracker is not None:
+                    self._push_lots(self._output_lots, output, lots[ii] if lots else None)
+                if should_log(logger, logging.INFO):
+                    logger.info("station_id %s: Content returned: %s", self.id, output)
 
     def reset_production(self):
         self._production_time_sec = None
-        self._production_timer = None
+        self._production_timers.clear()
+
+    def abort_productions(self) -> List[Tuple[List[Content], List[List[LotPortion]]]]:
+        """Stop every run in progress without producing. Returns the input each run had consumed, with the lot
+        portions it was drawn from when lot tracking, so the caller can put it back or account for it"""
+        runs = sorted(self._production_timers)
+        self.reset_production()
+        return [([content_factory(x.content) for x in self._input_reqs], run[3]) for run in runs]
 
     def finish_producing(self):
+        # the earliest finishing run is the one completing
+        run = heapq.heappop(self._production_timers) if self._production_timers else None
+
         # generate outputs
         with threading.Lock():
             output_space = self.space_for_output
@@ -261,21 +521,36 @@ class Station:
                 self._output_storage.add_content(
                     content_factory(output.content, qty=qty)
                 )
-                logger.info(f"station_id {self.id}: Content produced: {output.content}")
+                self._produced_totals[output.content.resourceUoM] = \
+                    self._produced_totals.get(output.content.resourceUoM, 0) + qty
+                if self._lot_tracker is not None:
+                    self._record_produced_lot(output.content.resourceUoM, qty, run)
+                if should_log(logger, logging.INFO):
+                    logger.info("station_id %s: Content produced: %s", self.id, output.content)
 
-        # reset production
-        self.reset_production()
+        if not self._production_timers:
+            self._production_time_sec = None
 
         # update expertise
+        self._n_runs += 1
         self._expertise_calculator.increment_n_runs()
 
         # raise event
         evnts.raise_event_production_finished_at_station(args=evnts.OnProductionFinishedAtStationEventArgs(
-            station=self
+            station=self,
+            start_perf=run[2].start_perf if run is not None else None
         ))
 
+    def _record_produced_lot(self, resource_uom: ResourceUoM, qty: float, run: Optional[list]):
+        if run is not None:
+            created, parents = run[0], [lot_id for drawn in run[3] for lot_id, _ in drawn]
+        else:
+            created, parents = self._last_perf if self._last_perf is not None else time.perf_counter(), []
+        lot_id = self._lot_tracker.new_lot(resource_uom, qty, created, station_id=self.id, parents=parents)
+        self._lot_queue(self._output_lots, resource_uom).push(lot_id, qty)
+
     def production_complete(self, time_perf) -> bool:
-        if self._production_timer and self._production_timer.EndTime and time_perf > self._production_timer.EndTime:
+        if self._production_timers and time_perf > self._production_timers[0][0]:
             return True
         return False
 
@@ -315,6 +590,10 @@ class Station:
     def production_timer_sec_callback(self):
         return self._production_time_sec_callback
 
+    @production_timer_sec_callback.setter
+    def production_timer_sec_callback(self, callback: ProductionTimeSecCallback):
+        self._production_time_sec_callback = callback
+
     @property
     def stored_inputs(self) -> Dict[ResourceUoM, float]:
         return self._input_storage.state.InventoryByResourceUom
@@ -342,7 +621,10 @@ class Station:
     def status(self) -> List[StationStatus]:
         ret = []
 
-        if self.producing:
+        downtime = self.current_downtime
+        if downtime is not None:
+            ret.append(DOWNTIME_STATUS[downtime.type])
+        elif self.producing:
             ret.append(StationStatus.PRODUCING)
         else:
             ret.append(StationStatus.IDLE)
@@ -350,12 +632,36 @@ class Station:
         if len(self.short_inputs) > 0:
             ret.append(StationStatus.STARVED)
 
-        out_space_minus_production_run = self.output_space_minus_production_run
-        if any([x < 0 for x in out_space_minus_production_run.values()]):
+        # runs in progress are not blocked, the station is only full once it can not start anything
+        if not self._production_timers and any(x < 0 for x in self.output_space_minus_production_run.values()):
             ret.append(StationStatus.FULL)
 
         return ret
 
+    @property
+    def downtime_schedule(self) -> Optional[DowntimeSchedule]:
+        return self._downtime_schedule
+
+    def set_downtime_schedule(self, downtime_schedule: Optional[DowntimeSchedule]):
+        self._downtime_schedule = downtime_schedule
+        self._next_downtime_event_perf = downtime_schedule.next_event_perf if downtime_schedule else None
+
+    @property
+    def current_downtime(self) -> Optional[DowntimeWindow]:
+        return self._downtime_schedule.current if self._downtime_schedule is not None else None
+
+    @property
+    def n_runs(self) -> int:
+        return self._n_runs
+
+    @property
+    def s_producing(self) -> float:
+        return self._s_producing
+
+    @property
+    def produced_totals(self) -> Dict[ResourceUoM, float]:
+        return self._produced_totals
+
     @property
     def expertise(self):
         return self._expertise_calculator
@@ -385,7 +691,10 @@ class Station:
 def station_factory(station_template: Station,
                     id: str = None,
                     start_on_init: bool = False,
-                    expertise_schedule: ExpertiseSchedule = None) -> Station:
+                    expertise_schedule: ExpertiseSchedule = None,
+                    production_slots: int = None,
+                    downtime_schedule: DowntimeSchedule = None,
+                    lot_tracker: LotTracker = None) -> Station:
     expertise_schedule = expertise_schedule or (station_template.expertise.schedule)
 
     return Station(
@@ -396,7 +705,10 @@ def station_factory(station_template: Station,
         type=station_template.type,
         start_on_init=start_on_init,
         expertise_schedule=expertise_schedule,
-        production_strategy=station_template.production_strategy
+        production_strategy=station_template.production_strategy,
+        production_slots=production_slots or station_template.production_slots,
+        downtime_schedule=downtime_schedule,
+        lot_tracker=lot_tracker
     )
 
 
@@ -6,3 +6,6 @@ class StationStatus(CoopEnum):
     STARVED = auto()
     FULL = auto()
     PRODUCING = auto()
+    DOWN = auto()
+    MAINTENANCE = auto()
+    CHANGEOVER = auto()
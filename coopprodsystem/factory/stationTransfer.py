@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field
+from typing import Tuple
 from coopprodsystem.factory.station import Station
 from coopstorage.my_dataclasses import Content
 from cooptools.timedDecay import TimedDecay
@@ -10,17 +11,43 @@ class StationTransfer:
     to_station: Station
     content: Content
     timer: TimedDecay
+    lots: Tuple[Tuple[int, float], ...] = ()
     id: str = field(init=False)
+    # kept separately so the ids outlive stations referenced through weak proxies (long-run mode)
+    from_id: str = field(init=False)
+    to_id: str = field(init=False)
 
     def __post_init__(self):
         object.__setattr__(self, 'id', uuid.uuid4())
+        object.__setattr__(self, 'from_id', self.from_station.id)
+        object.__setattr__(self, 'to_id', self.to_station.id)
 
     def __hash__(self):
         return hash(self.id)
 
+    def recycle(self,
+                from_station: Station,
+                to_station: Station,
+                content: Content,
+                timer: TimedDecay,
+                lots: Tuple[Tuple[int, float], ...] = ()) -> 'StationTransfer':
+        """Re-initialise a released record in place, with a new id"""
+        object.__setattr__(self, 'from_station', from_station)
+        object.__setattr__(self, 'to_station', to_station)
+        object.__setattr__(self, 'content', content)
+        object.__setattr__(self, 'timer', timer)
+        object.__setattr__(self, 'lots', lots)
+        self.__post_init__()
+        return self
+
+    def release(self):
+        """Drop the references to the stations, content and timer. The record must not be used again until recycled"""
+        for name in ('from_station', 'to_station', 'content', 'timer'):
+            object.__setattr__(self, name, None)
+        object.__setattr__(self, 'lots', ())
+
 
     def short_str(self):
-        from_station_txt = f"{self.from_station.id[:7]}..." if len(self.from_station.id) > 10 else self.from_station.id
-        to_station_txt = f"{self.to_station.id[:7]}..." if len(self.to_station.id) > 10 else self.to_station.id
+        from_station_txt = f"{self.from_id[:7]}..." if len(self.from_id) > 10 else self.from_id
+        to_station_txt = f"{self.to_id[:7]}..." if len(self.to_id) > 10 else self.to_id
         return f"{from_station_txt}->{to_station_txt}: {self.content.resourceUoM.resource.name}/{self.content.resourceUoM.uom.name} {self.content.qty}"
-
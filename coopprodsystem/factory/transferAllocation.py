@@ -0,0 +1,146 @@
+import math
+from dataclasses import dataclass
+from enum import auto
+from typing import Dict, List
+from cooptools.coopEnum import CoopEnum
+
+
+class TransferAllocationStrategy(CoopEnum):
+    GREEDY = auto()
+    PROPORTIONAL = auto()
+    PRIORITY = auto()
+    SHORTEST_QUEUE_FIRST = auto()
+
+
+# strategies that split supply across consumers (and round the split to whole runs) rather than fill them in an order
+SPLIT_STRATEGIES = (TransferAllocationStrategy.PROPORTIONAL, TransferAllocationStrategy.PRIORITY)
+
+@dataclass(frozen=True)
+class TransferDemand:
+    consumer_id: str
+    qty: float
+    queue: float = 0
+    weight: float = 1
+    # input qty the consumer uses per production run, 0 when allocations need not be whole runs
+    run_qty: float = 0
+
+
+def _is_integral(x: float) -> bool:
+    return float(x).is_integer()
+
+
+def _round_to_integers(shares: Dict[str, float], caps: Dict[str, float], total: int) -> Dict[str, float]:
+    """Largest-remainder rounding of shares so that they sum to total without exceeding the caps"""
+    floored = {id: min(math.floor(share), caps[id]) for id, share in shares.items()}
+    leftover = total - sum(floored.values())
+    by_remainder = sorted(shares.keys(), key=lambda id: shares[id] - floored[id], reverse=True)
+    while leftover > 0:
+        progressed = False
+        for id in by_remainder:
+            if leftover <= 0:
+                break
+            if floored[id] < caps[id]:
+                floored[id] += 1
+                leftover -= 1
+                progressed = True
+        if not progressed:
+            break
+    return floored
+
+
+def _weighted_fill(supply: float, demands: List[TransferDemand], weights: Dict[str, float]) -> Dict[str, float]:
+    """Water-filling: split supply by weight, capping each consumer at its demand and redistributing the excess"""
+    shares = {x.consumer_id: 0.0 for x in demands}
+    active = {x.consumer_id: x.qty for x in demands if x.qty > 0 and weights[x.consumer_id] > 0}
+    remaining = supply
+
+    while active and remaining > 1e-12:
+        total_weight = sum(weights[id] for id in active)
+        saturated = [id for id, need in active.items() if remaining * weights[id] / total_weight >= need]
+        if not saturated:
+            for id in active:
+                shares[id] += remaining * weights[id] / total_weight
+            break
+
+        for id in saturated:
+            shares[id] += active[id]
+            remaining -= active[id]
+            del active[id]
+
+    return shares
+
+
+def _fill_in_order(supply: float, demands: List[TransferDemand]) -> Dict[str, float]:
+    shares = {}
+    remaining = supply
+    for demand in demands:
+        qty = min(demand.qty, remaining)
+        shares[demand.consumer_id] = max(qty, 0)
+        remaining -= shares[demand.consumer_id]
+    return shares
+
+
+def _runs_shortfall(demand: TransferDemand, allocated: float) -> float:
+    """Qty still missing for the consumer to hold whole runs (stored + in transit + allocated)"""
+    held = demand.queue + allocated
+    return math.ceil(held / demand.run_qty - 1e-9) * demand.run_qty - held
+
+
+def _round_to_runs(shares: Dict[str, float], demands: List[TransferDemand], supply: float) -> Dict[str, float]:
+    """Trim each share so the consumer ends up holding whole runs of input, then use the trimmed supply to complete
+    further runs, largest trim first (ties go to the consumer holding less). Whatever completes no run is handed back
+    as it was shared, so completing one consumer's run never starves another of its share"""
+    by_id = {x.consumer_id: x for x in demands if x.run_qty > 0}
+    rounded = dict(shares)
+    for id, demand in by_id.items():
+        whole_runs = math.floor((demand.queue + shares[id]) / demand.run_qty + 1e-9) * demand.run_qty
+        rounded[id] = max(whole_runs - demand.queue, 0)
+
+    leftover = supply - sum(rounded.values())
+    for id in sorted(by_id, key=lambda id: (rounded[id] - shares[id], by_id[id].queue)):
+        top_up = _runs_shortfall(by_id[id], rounded[id]) or by_id[id].run_qty
+        if top_up <= leftover + 1e-9 and rounded[id] + top_up <= by_id[id].qty + 1e-9:
+            rounded[id] += top_up
+            leftover -= top_up
+
+    for id, demand in by_id.items():
+        back = min(shares[id] - rounded[id], leftover)
+        if back > 0:
+            rounded[id] += back
+            leftover -= back
+    return rounded
+
+
+def allocate_supply(supply: float,
+                    demands: List[TransferDemand],
+                    strategy: TransferAllocationStrategy = TransferAllocationStrategy.PROPORTIONAL) -> Dict[str, float]:
+    """Split the supply of one feeder/resource_uom across all consumers that demand it in a tick.
+
+    GREEDY fills consumers in the given order, PROPORTIONAL splits by demanded qty, PRIORITY splits by demand weight
+    (water-filling, so no consumer gets more than it asked for), and SHORTEST_QUEUE_FIRST fills the consumers with the
+    least stored + in-transit input first. When the supply and every demand are whole numbers, so are the allocations.
+    PROPORTIONAL and PRIORITY splits are rounded to whole runs of the consumers that give a run_qty.
+    """
+    demands = [x for x in demands if x.qty > 0]
+    if supply <= 0 or not demands:
+        return {}
+
+    total_demand = sum(x.qty for x in demands)
+    if total_demand <= supply:
+        return {x.consumer_id: x.qty for x in demands}
+
+    if strategy == TransferAllocationStrategy.GREEDY:
+        return _fill_in_order(supply, demands)
+    elif strategy == TransferAllocationStrategy.SHORTEST_QUEUE_FIRST:
+        return _fill_in_order(supply, sorted(demands, key=lambda x: x.queue))
+    elif strategy == TransferAllocationStrategy.PROPORTIONAL:
+        shares = {x.consumer_id: supply * x.qty / total_demand for x in demands}
+    elif strategy == TransferAllocationStrategy.PRIORITY:
+        shares = _weighted_fill(supply, demands, {x.consumer_id: x.weight for x in demands})
+    else:
+        raise NotImplementedError(f"Transfer allocation strategy: {strategy} is unrecognized")
+
+    if _is_integral(supply) and all(_is_integral(x.qty) for x in demands):
+        shares = _round_to_integers(shares, {x.consumer_id: x.qty for x in demands}, int(supply))
+
+    return _round_to_runs(shares, demands, supply)
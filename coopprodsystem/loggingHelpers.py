@@ -0,0 +1,126 @@
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+
+PACKAGE_LOGGER_NAME = 'coopprodsystem'
+
+_sample_every_n: Dict[str, int] = {}
+_sample_counters: Dict[str, int] = {}
+# should_log is called from station, line and dispatcher worker threads
+_sample_lock = threading.Lock()
+
+_background_lock = threading.Lock()
+_background_listener: Optional[QueueListener] = None
+_background_handler: Optional[QueueHandler] = None
+_background_prev_propagate: Optional[bool] = None
+
+
+def should_log(logger: logging.Logger, level: int) -> bool:
+    """Guard for hot-path log calls.
+
+    Returns False without touching the message args when the level is disabled for the logger, and otherwise only lets
+    through every Nth call when sampling has been enabled for the logger (or one of its parents) via
+    enable_sampled_logging()
+    """
+    if not logger.isEnabledFor(level):
+        return False
+
+    if not _sample_every_n:
+        return True
+
+    n = _sample_rate(logger.name)
+    if n <= 1:
+        return True
+
+    with _sample_lock:
+        count = _sample_counters.get(logger.name, 0) + 1
+        _sample_counters[logger.name] = count
+    return count % n == 0
+
+
+def _sample_rate(logger_name: str) -> int:
+    name = logger_name
+    while True:
+        n = _sample_every_n.get(name, None)
+        if n is not None:
+            return n
+        if '.' not in name:
+            return 1
+        name = name.rsplit('.', 1)[0]
+
+
+def enable_sampled_logging(every_n: int,
+                           logger_name: str = PACKAGE_LOGGER_NAME,
+                           level: int = logging.DEBUG):
+    """Log only every Nth guarded hot-path event of logger_name (and its children) at the given level"""
+    if every_n < 1:
+        raise ValueError(f"every_n must be >= 1, {every_n} provided")
+
+    _sample_every_n[logger_name] = every_n
+    logging.getLogger(logger_name).setLevel(level)
+
+
+def disable_sampled_logging(logger_name: str = PACKAGE_LOGGER_NAME):
+    _sample_every_n.pop(logger_name, None)
+    with _sample_lock:
+        for name in [x for x in _sample_counters if x == logger_name or x.startswith(f"{logger_name}.")]:
+            del _sample_counters[name]
+
+
+def start_background_logging(handlers: List[logging.Handler] = None,
+                             logger_name: str = PACKAGE_LOGGER_NAME,
+                             max_queue_size: int = None) -> QueueListener:
+    """Route records of logger_name through a queue and emit them with the given handlers on a background thread.
+
+    If no handlers are provided the handlers currently configured on the root logger are used. The message is rendered
+    on the calling thread, so args (stations, event args) are read as they were when logged and are not kept by the
+    queued record; handler formatting and I/O happen on the listener thread. When max_queue_size is set, records that do
+    not fit in the queue are dropped rather than blocking the caller.
+    """
+    global _background_listener, _background_handler, _background_prev_propagate
+
+    with _background_lock:
+        if _background_listener is not None:
+            return _background_listener
+
+        handlers = handlers or logging.getLogger().handlers
+        log_queue = queue.Queue(maxsize=max_queue_size) if max_queue_size else queue.SimpleQueue()
+
+        logger = logging.getLogger(logger_name)
+        _background_handler = _DroppingQueueHandler(log_queue)
+        _background_prev_propagate = logger.propagate
+        logger.addHandler(_background_handler)
+        logger.propagate = False
+
+        _background_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _background_listener.start()
+        return _background_listener
+
+
+def stop_background_logging(logger_name: str = PACKAGE_LOGGER_NAME):
+    """Flush the queued records and restore direct logging for logger_name"""
+    global _background_listener, _background_handler, _background_prev_propagate
+
+    with _background_lock:
+        if _background_listener is None:
+            return
+
+        _background_listener.stop()
+        logger = logging.getLogger(logger_name)
+        logger.removeHandler(_background_handler)
+        logger.propagate = _background_prev_propagate
+
+        _background_listener = None
+        _background_handler = None
+        _background_prev_propagate = None
+
+
+class _DroppingQueueHandler(QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
@@ -2,18 +2,19 @@ from dummyEventHandler import DummyEventHandler
 import time
 import logging
 from tests.station_manifest import STATIONS, StationType
-from coopprodsystem.factory import ProductionLine, Station, station_factory, ByRunsExpertiseSchedule
+from coopprodsystem.factory import ProductionLine, Station, station_factory, ByRunsExpertiseSchedule, SinkStation, \
+    station_resource_def_EA_uom, KpiEngine
 from coopstorage.my_dataclasses import ResourceUoM, UoM
 import random as rnd
 import tests.sku_manifest as skus
 from tests.uom_manifest import each
+from coopprodsystem.loggingHelpers import start_background_logging, enable_sampled_logging
 
 format = '%(asctime)s [%(levelname)s]: %(name)s -- %(message)s (%(filename)s:%(lineno)d)'
 logging.basicConfig(format=format, level=logging.INFO)
-logging.getLogger('station').setLevel(logging.CRITICAL)
-logging.getLogger('coopprodsystem.station').setLevel(logging.CRITICAL)
-logging.getLogger('coopprodsystem.productionLine').setLevel(logging.CRITICAL)
 logging.getLogger('coopstorage').setLevel(logging.CRITICAL)
+start_background_logging()
+enable_sampled_logging(every_n=100)
 
 deh = DummyEventHandler()
 expertise_schedule = ByRunsExpertiseSchedule(runs_until_expert=1000, max_time_reduction_perc=.33)
@@ -40,33 +41,29 @@ relationship_map = {next(station for station, _ in stations_pos if station.type
                         [(next(station for station, _ in stations_pos if station.type == srs[0].name), srs[1]) for srs in srss]
                     for dest_type, srss in relationship_mapper.items()}
 
+# finished goods leave the line through a sink that ships everything delivered to it
+end_station = next(station for station, _ in stations_pos if station.type == StationType.DUMMY_3.name)
+sink = SinkStation(id='SHIPPING',
+                   input_reqs=[station_resource_def_EA_uom(content_resource=skus.sku_g, content_qty=1, storage_capacity=100)],
+                   profile=None)
+stations_pos.append((sink, (rnd.randint(0, 10), rnd.randint(0, 10))))
+relationship_map[sink] = [(end_station, [ResourceUoM(skus.sku_g, each)])]
+
 pl = ProductionLine(
     init_stations=stations_pos,
     init_relationship_map=relationship_map,
     start_on_init=True
 )
+kpis = KpiEngine(line=pl)
 
-
-generated = []
-s1_timer = None
-s2_timer = None
-s3_timer = None
 while True:
     #display
     pl.print_state()
 
-    # Hack to remove content from s3 when there is output
-    end_station = next(station for name, station in pl.Stations.items() if station.type == StationType.DUMMY_3.name)
-
-    if len(end_station.available_output) > 0 and s3_timer is None:
-        s3_timer = time.perf_counter()
-    elif s3_timer and time.perf_counter() - s3_timer > 3:
-        content_removed = end_station.remove_output(end_station.available_output_as_content)
-        generated += content_removed
-        s3_timer = None
-
     # epoch
-    print(sum(x.qty for x in generated))
+    line_kpis = kpis.snapshot()['line']
+    print(f"shipped: {sink.tally.total_qty}, rate: {round(line_kpis['ewma_rate'], 3)}/s, wip: {line_kpis['wip']}, "
+          f"slowed: {kpis.throughput_drops()}")
     time.sleep(1)
 
 
@@ -0,0 +1,33 @@
+from coopprodsystem.factory import ProductionLine, station_factory
+from coopstorage.my_dataclasses import ResourceUoM
+from tests.station_manifest import STATIONS, StationType
+import tests.sku_manifest as skus
+from tests.uom_manifest import each
+
+RELATIONSHIPS = {
+    StationType.DUMMY_3: [
+        (StationType.DUMMY_1, [ResourceUoM(skus.sku_c, each)]),
+        (StationType.DUMMY_2, [ResourceUoM(skus.sku_f, each)])
+    ],
+    StationType.DUMMY_1: [
+        (StationType.RAW_1, [ResourceUoM(skus.sku_a, each)]),
+        (StationType.RAW_2, [ResourceUoM(skus.sku_b, each)])
+    ],
+    StationType.DUMMY_2: [
+        (StationType.RAW_1, [ResourceUoM(skus.sku_d, each)]),
+        (StationType.RAW_2, [ResourceUoM(skus.sku_e, each)])
+    ]
+}
+
+
+def build_line(**kwargs) -> ProductionLine:
+    stations = {station_type: station_factory(template, id=template.id) for station_type, template in STATIONS.items()}
+    relationship_map = {stations[to]: [(stations[frm], resource_uoms) for frm, resource_uoms in froms]
+                        for to, froms in RELATIONSHIPS.items()}
+    kwargs.setdefault('start_on_init', False)
+
+    return ProductionLine(
+        init_stations=[(station, (ii, ii)) for ii, station in enumerate(stations.values())],
+        init_relationship_map=relationship_map,
+        **kwargs
+    )
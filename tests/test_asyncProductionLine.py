@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+from coopprodsystem import ProductionLine, Station, station_resource_def_EA_uom, ProductionEventType
+from coopprodsystem.factory import AsyncProductionLine
+from coopstorage.my_dataclasses import ResourceUoM, Content
+import tests.sku_manifest as skus
+from tests.uom_manifest import each
+
+
+def _fast_raw_station(id: str) -> Station:
+    return Station(id=id,
+                   input_reqs=[],
+                   output=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=3, storage_capacity=9)],
+                   production_timer_sec_callback=lambda: 0.01,
+                   start_on_init=False)
+
+
+class Test_AsyncProductionLine(unittest.TestCase):
+
+    def test__wait_for_output(self):
+        # arrange
+        station = _fast_raw_station('async_raw')
+        pl = ProductionLine(init_stations=[(station, (0, 0))], start_on_init=False)
+        ru = ResourceUoM(skus.sku_a, each)
+
+        async def run():
+            async with AsyncProductionLine(pl, tick_s=0.005) as apl:
+                qty = await apl.station('async_raw').wait_for_output(ru, 6, timeout=5)
+                removed = await apl.station('async_raw').remove_output([Content(ru, qty)])
+                return qty, removed
+
+        # act
+        qty, removed = asyncio.run(run())
+
+        # assert
+        self.assertGreaterEqual(qty, 6)
+        self.assertEqual(sum(x.qty for x in removed), qty)
+
+    def test__events(self):
+        # arrange
+        station = _fast_raw_station('async_raw_events')
+        pl = ProductionLine(init_stations=[(station, (0, 0))], start_on_init=False)
+
+        async def run():
+            async with AsyncProductionLine(pl, tick_s=0.005) as apl:
+                received = []
+                async for event_type, args in apl.events([ProductionEventType.PRODUCTION_FINISHED_AT_STATION]):
+                    received.append((event_type, args))
+                    if len(received) == 2:
+                        break
+                return received
+
+        # act
+        received = asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+        # assert
+        self.assertEqual(len(received), 2)
+        self.assertTrue(all(x[0] == ProductionEventType.PRODUCTION_FINISHED_AT_STATION for x in received))
+        self.assertTrue(all(x[1].station.id == 'async_raw_events' for x in received))
+
+    def test__events_from_other_lines_are_dropped(self):
+        # arrange
+        pl = ProductionLine(init_stations=[(_fast_raw_station('async_raw_own'), (0, 0))], start_on_init=False)
+        other = ProductionLine(init_stations=[(_fast_raw_station('async_raw_own'), (0, 0))], start_on_init=False)
+
+        async def run():
+            async with AsyncProductionLine(pl, tick_s=0.005) as apl:
+                received = []
+
+                async def consume():
+                    async for event_type, args in apl.events([ProductionEventType.PRODUCTION_FINISHED_AT_STATION]):
+                        received.append(args.station)
+
+                consumer = asyncio.ensure_future(consume())
+                await asyncio.sleep(0)
+                for t in range(1, 20):
+                    other.update(t)
+                await asyncio.sleep(0.1)
+                consumer.cancel()
+                return received
+
+        # act
+        received = asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+        # assert
+        self.assertTrue(received)
+        self.assertTrue(all(x is pl.Stations['async_raw_own'] for x in received))
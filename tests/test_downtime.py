@@ -0,0 +1,71 @@
+import random
+import unittest
+from coopprodsystem import Station, station_resource_def_EA_uom, StationStatus
+from coopprodsystem.factory import DowntimeSchedule, DowntimeWindow, DowntimeType, FailureProcess
+import tests.sku_manifest as skus
+
+
+def _raw_station(id: str, downtime_schedule: DowntimeSchedule) -> Station:
+    return Station(id=id,
+                   input_reqs=[],
+                   output=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=1, storage_capacity=1000)],
+                   production_timer_sec_callback=lambda: 3,
+                   downtime_schedule=downtime_schedule)
+
+
+class Test_Downtime(unittest.TestCase):
+
+    def test__maintenance_pauses_production(self):
+        # arrange
+        schedule = DowntimeSchedule()
+        schedule.schedule_maintenance(start_perf=2, duration_s=5)
+        station = _raw_station('maintained', schedule)
+
+        # act
+        station.update(1)
+        station.update(2.5)
+        status_during = station.status
+        station.update(7.5)
+        station.update(8.5)
+        n_runs_before_end = station.n_runs
+        station.update(9.5)
+
+        # assert
+        self.assertIn(StationStatus.MAINTENANCE, status_during)
+        self.assertEqual(n_runs_before_end, 0)
+        self.assertEqual(station.n_runs, 1)
+        self.assertIsNone(station.current_downtime)
+
+    def test__changeover_applies_on_complete(self):
+        # arrange
+        applied = []
+        schedule = DowntimeSchedule(planned=[DowntimeWindow(start=5, duration_s=2, type=DowntimeType.CHANGEOVER,
+                                                            on_complete=lambda s: applied.append(s.id))])
+        station = _raw_station('changeover', schedule)
+
+        # act
+        station.update(1)
+        station.update(5.5)
+        status_during = station.status
+        station.update(7.5)
+
+        # assert
+        self.assertIn(StationStatus.CHANGEOVER, status_during)
+        self.assertEqual(applied, ['changeover'])
+
+    def test__breakdowns_reduce_throughput(self):
+        # arrange
+        reliable = _raw_station('reliable', None)
+        failing = _raw_station('failing', DowntimeSchedule(
+            failure_process=FailureProcess(mtbf_s=20, mttr_s=10, rng=random.Random(7))))
+
+        # act
+        down_ticks = 0
+        for ii in range(2000):
+            reliable.update(1 + ii * 0.5)
+            failing.update(1 + ii * 0.5)
+            down_ticks += StationStatus.DOWN in failing.status
+
+        # assert
+        self.assertGreater(down_ticks, 0)
+        self.assertLess(failing.n_runs, reliable.n_runs)
@@ -0,0 +1,184 @@
+import threading
+import time
+import unittest
+from pubsub import pub
+from coopprodsystem.events import PooledEventDispatcher, EventQueueOverflowPolicy, ProductionEventType, \
+    set_event_dispatcher, raise_event
+
+
+class _Station:
+    def __init__(self, id):
+        self.id = id
+
+
+class _Args:
+    def __init__(self, station):
+        self.station = station
+
+
+class _Recorder:
+    def __init__(self, delay_s: float = 0, gate: threading.Event = None):
+        self.received = []
+        self.delay_s = delay_s
+        self.gate = gate
+
+    def on_event(self, args):
+        if self.gate is not None:
+            self.gate.wait(timeout=5)
+        time.sleep(self.delay_s)
+        self.received.append(args)
+
+
+class Test_EventDispatcher(unittest.TestCase):
+
+    def test__submit_does_not_wait_for_slow_handler(self):
+        # arrange
+        topic = 'TEST_DISPATCH_SLOW'
+        recorder = _Recorder(delay_s=0.05)
+        pub.subscribe(recorder.on_event, topic)
+        dispatcher = PooledEventDispatcher(max_queue_size=10)
+
+        # act
+        t0 = time.perf_counter()
+        for ii in range(3):
+            dispatcher.submit(topic, args=_Args(_Station(ii)))
+        submit_s = time.perf_counter() - t0
+        dispatcher.stop(drain=True, timeout=5)
+
+        # assert
+        self.assertLess(submit_s, 0.05)
+        self.assertEqual(len(recorder.received), 3)
+        metrics = next(iter(dispatcher.HandlerMetrics.values()))
+        self.assertEqual(metrics.delivered, 3)
+        self.assertGreater(metrics.max_lag_s, 0)
+
+    def test__coalesce_per_station(self):
+        # arrange
+        topic = 'TEST_DISPATCH_COALESCE'
+        gate = threading.Event()
+        recorder = _Recorder(gate=gate)
+        pub.subscribe(recorder.on_event, topic)
+        dispatcher = PooledEventDispatcher(max_queue_size=2,
+                                           overflow_policy=EventQueueOverflowPolicy.COALESCE_PER_STATION)
+        a, b = _Station('a'), _Station('b')
+
+        # act
+        dispatcher.submit(topic, args=_Args(a))
+        time.sleep(0.05)  # first event is now held by the worker at the gate
+        for _ in range(5):
+            dispatcher.submit(topic, args=_Args(a))
+            dispatcher.submit(topic, args=_Args(b))
+        gate.set()
+        dispatcher.stop(drain=True, timeout=5)
+
+        # assert
+        self.assertEqual([x.station.id for x in recorder.received], ['a', 'a', 'b'])
+        self.assertEqual(dispatcher.n_coalesced, 8)
+
+    def test__coalesce_only_when_full(self):
+        # arrange
+        topic = 'TEST_DISPATCH_COALESCE_ROOM'
+        gate = threading.Event()
+        recorder = _Recorder(gate=gate)
+        pub.subscribe(recorder.on_event, topic)
+        dispatcher = PooledEventDispatcher(max_queue_size=10,
+                                           overflow_policy=EventQueueOverflowPolicy.COALESCE_PER_STATION)
+        a = _Station('a')
+
+        # act
+        for _ in range(5):
+            dispatcher.submit(topic, args=_Args(a))
+        gate.set()
+        dispatcher.stop(drain=True, timeout=5)
+
+        # assert
+        self.assertEqual(len(recorder.received), 5)
+        self.assertEqual(dispatcher.n_coalesced, 0)
+
+    def test__coalesce_without_pending_drops_oldest(self):
+        # arrange
+        topic = 'TEST_DISPATCH_COALESCE_FALLBACK'
+        gate = threading.Event()
+        recorder = _Recorder(gate=gate)
+        pub.subscribe(recorder.on_event, topic)
+        dispatcher = PooledEventDispatcher(max_queue_size=2,
+                                           overflow_policy=EventQueueOverflowPolicy.COALESCE_PER_STATION)
+
+        # act
+        dispatcher.submit(topic, args=_Args(_Station('a')))
+        time.sleep(0.05)
+        with self.assertLogs('coopprodsystem.events.dispatcher', level='DEBUG'):
+            for id in ('b', 'c', 'd'):
+                dispatcher.submit(topic, args=_Args(_Station(id)))
+        gate.set()
+        dispatcher.stop(drain=True, timeout=5)
+
+        # assert
+        self.assertEqual([x.station.id for x in recorder.received], ['a', 'c', 'd'])
+        self.assertEqual(dispatcher.n_dropped, 1)
+        self.assertEqual(dispatcher.n_coalesced, 0)
+
+    def test__block_from_handler_delivers_inline(self):
+        # arrange
+        topic, nested_topic = 'TEST_DISPATCH_REENTRANT', 'TEST_DISPATCH_REENTRANT_NESTED'
+        gate = threading.Event()
+        dispatcher = PooledEventDispatcher(max_queue_size=1, overflow_policy=EventQueueOverflowPolicy.BLOCK)
+        nested = _Recorder()
+        pub.subscribe(nested.on_event, nested_topic)
+
+        def raise_nested(args):
+            gate.wait(timeout=5)
+            dispatcher.submit(nested_topic, args=args)
+        pub.subscribe(raise_nested, topic)
+
+        # act
+        dispatcher.submit(topic, args=_Args(_Station('a')))
+        time.sleep(0.05)  # the worker is in the handler, the next event fills the queue
+        dispatcher.submit(topic, args=_Args(_Station('b')))
+        gate.set()
+        drained = dispatcher.join(timeout=5)
+        dispatcher.stop(drain=False, timeout=5)
+
+        # assert
+        self.assertTrue(drained)
+        self.assertEqual([x.station.id for x in nested.received], ['a', 'b'])
+
+    def test__stopped_dispatcher_delivers_synchronously(self):
+        # arrange
+        topic = ProductionEventType.PRODUCTION_STARTED_AT_STATION
+        recorder = _Recorder()
+        pub.subscribe(recorder.on_event, topic.name)
+        dispatcher = PooledEventDispatcher(max_queue_size=10)
+        set_event_dispatcher(dispatcher)
+        dispatcher.stop()
+
+        # act
+        try:
+            raise_event(topic, args=_Args(_Station('a')))
+        finally:
+            set_event_dispatcher(None)
+            pub.unsubscribe(recorder.on_event, topic.name)
+
+        # assert
+        self.assertEqual([x.station.id for x in recorder.received], ['a'])
+
+    def test__drop_oldest(self):
+        # arrange
+        topic = 'TEST_DISPATCH_DROP'
+        gate = threading.Event()
+        recorder = _Recorder(gate=gate)
+        pub.subscribe(recorder.on_event, topic)
+        dispatcher = PooledEventDispatcher(max_queue_size=2,
+                                           overflow_policy=EventQueueOverflowPolicy.DROP_OLDEST)
+
+        # act
+        dispatcher.submit(topic, args=_Args(_Station(0)))
+        time.sleep(0.05)
+        for ii in range(1, 5):
+            dispatcher.submit(topic, args=_Args(_Station(ii)))
+        gate.set()
+        dispatcher.stop(drain=True, timeout=5)
+
+        # assert
+        self.assertEqual([x.station.id for x in recorder.received], [0, 3, 4])
+        self.assertEqual(dispatcher.n_dropped, 2)
@@ -0,0 +1,75 @@
+import os
+import random
+import tempfile
+import unittest
+from coopprodsystem.factory import EventRecorder, EventReplay, DowntimeSchedule, FailureProcess, line_snapshot, \
+    load_event_log, SourceStation, PoissonProfile, UnreplayableProfileException, station_resource_def_EA_uom
+import tests.sku_manifest as skus
+from tests.line_manifest import build_line
+from tests.station_manifest import StationType
+
+
+def _comparable(snapshot):
+    return snapshot['stations'], sorted(tuple(x) for x in snapshot['transfers'].values())
+
+
+class Test_EventReplay(unittest.TestCase):
+
+    def test__replay_reconstructs_recorded_run(self):
+        # arrange
+        rng = random.Random(7)
+        pl = build_line()
+        for station in pl.Stations.values():
+            station.production_timer_sec_callback = lambda: rng.uniform(1, 4)
+        pl.TransferTimeSCallback = lambda: rng.choice([1, 2, 3])
+        pl.Stations[StationType.DUMMY_1.name].set_downtime_schedule(
+            DowntimeSchedule(failure_process=FailureProcess(mtbf_s=20, mttr_s=5, rng=random.Random(3))))
+        recorder = EventRecorder(line=pl)
+        original = {}
+
+        # act
+        for tick in range(2, 400):
+            t = tick / 2
+            pl.update(t)
+            original[t] = line_snapshot(pl, t)
+        recorder.stop()
+        path = os.path.join(tempfile.mkdtemp(), 'events.jsonl')
+        recorder.save(path)
+        replay = EventReplay(load_event_log(path), line_builder=build_line, checkpoint_every=16)
+        replay.run()
+
+        # assert
+        self.assertTrue(any(x.event_type == 'STATION_DOWNTIME_STARTED' for x in recorder.events))
+        for t in replay.times[::7] + [replay.times[-1]]:
+            self.assertEqual(_comparable(replay.state_at(t)), _comparable(original[t]))
+        self.assertEqual(_comparable(replay.state_at(replay.times[20] + 0.25)),
+                         _comparable(replay.state_at(replay.times[20])))
+        self.assertIsNone(replay.state_at(0))
+
+    def test__poisson_profile_lines_are_rejected(self):
+        # arrange
+        def _build():
+            pl = build_line()
+            source = SourceStation(id='ARRIVALS',
+                                   output=station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=1,
+                                                                      storage_capacity=10),
+                                   profile=PoissonProfile(rate_per_s=0.5))
+            pl.add_stations([(source, (9, 9))])
+            return pl
+
+        pl = _build()
+        recorder = EventRecorder(line=pl)
+        for tick in range(1, 20):
+            pl.update(tick)
+        recorder.stop()
+
+        # act
+        replay = EventReplay(recorder.events, line_builder=_build)
+
+        # assert
+        with self.assertRaises(UnreplayableProfileException):
+            replay.run()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from coopprodsystem.factory import FastForwardRunner, SinkStation, ConstantProfile, station_resource_def_EA_uom
+import tests.sku_manifest as skus
+from tests.line_manifest import build_line
+
+
+def _line_with_unfed_sink():
+    pl = build_line()
+    sink = SinkStation(id='SHIPPING',
+                       input_reqs=[station_resource_def_EA_uom(content_resource=skus.sku_g, content_qty=1,
+                                                               storage_capacity=100)],
+                       profile=ConstantProfile(interval_s=5),
+                       backlog=False)
+    pl.add_stations([(sink, (9, 9))])
+    return pl
+
+
+class Test_FastForward(unittest.TestCase):
+
+    def test__fast_forward_matches_stepping(self):
+        # arrange
+        stepped = build_line()
+        fast = build_line()
+
+        # act
+        for ii in range(0, 2001):
+            stepped.update(1 + ii * 0.5)
+        result = FastForwardRunner(fast, tick_s=0.5).run(start_perf=1, end_perf=1001)
+
+        # assert
+        self.assertGreater(result.n_jumps, 0)
+        self.assertEqual(result.end_perf, 1001)
+        for id, station in stepped.Stations.items():
+            self.assertEqual(station.n_runs, fast.Stations[id].n_runs)
+            self.assertEqual(station.produced_totals, fast.Stations[id].produced_totals)
+            self.assertEqual(station.available_output, fast.Stations[id].available_output)
+
+    def test__profile_driven_stations_are_stepped(self):
+        # arrange
+        stepped = _line_with_unfed_sink()
+        fast = _line_with_unfed_sink()
+
+        # act
+        for ii in range(0, 2001):
+            stepped.update(1 + ii * 0.5)
+        result = FastForwardRunner(fast, tick_s=0.5).run(start_perf=1, end_perf=1001)
+
+        # assert
+        self.assertEqual(result.n_jumps, 0)
+        self.assertEqual(stepped.Stations['SHIPPING'].tally.unmet_qty, 200)
+        self.assertEqual(fast.Stations['SHIPPING'].tally.unmet_qty, stepped.Stations['SHIPPING'].tally.unmet_qty)
@@ -0,0 +1,152 @@
+import random
+import unittest
+from coopprodsystem import ProductionLine, Station
+from coopprodsystem.factory import KpiEngine, P2Quantile, EwmaRate, SinkStation, StationStatus, \
+    station_resource_def_EA_uom
+from coopstorage.my_dataclasses import ResourceUoM
+import tests.sku_manifest as skus
+from tests.uom_manifest import each
+from tests.line_manifest import build_line
+from tests.station_manifest import StationType
+
+
+def _shipping_line():
+    pl = build_line()
+    sink = SinkStation(id='SHIPPING',
+                       input_reqs=[station_resource_def_EA_uom(content_resource=skus.sku_g, content_qty=1,
+                                                               storage_capacity=100)])
+    pl.add_stations([(sink, (9, 9))])
+    pl.add_relationships({sink: [(pl.Stations[StationType.DUMMY_3.name], [ResourceUoM(skus.sku_g, each)])]})
+    return pl, sink
+
+
+def _stored_wip(pl) -> float:
+    return sum(sum(x.stored_inputs.values()) + sum(x.available_output.values()) for x in pl.Stations.values()) + \
+           sum(x.content.qty for x in pl.StationTransfers)
+
+
+class Test_KpiEngine(unittest.TestCase):
+
+    def test__p2_quantile_tracks_exact_quantile(self):
+        # arrange
+        rng = random.Random(1)
+        samples = [rng.expovariate(1) for _ in range(20000)]
+        sketches = {q: P2Quantile(q) for q in (0.5, 0.9, 0.99)}
+
+        # act
+        for x in samples:
+            for sketch in sketches.values():
+                sketch.record(x)
+
+        # assert
+        ordered = sorted(samples)
+        for q, sketch in sketches.items():
+            self.assertAlmostEqual(sketch.value(), ordered[int(q * len(ordered))], delta=0.05 * ordered[-1] * q)
+
+    def test__ewma_rate_converges_to_steady_rate(self):
+        # arrange
+        rate = EwmaRate(tau_s=30)
+
+        # act
+        for t in range(1, 601):
+            rate.record(2, t / 2)
+
+        # assert
+        self.assertAlmostEqual(rate.rate(300), 4, delta=0.1)
+        self.assertLess(rate.rate(450), 0.1)
+
+    def test__wip_and_line_throughput_follow_the_line(self):
+        # arrange
+        pl, sink = _shipping_line()
+        kpis = KpiEngine(line=pl)
+
+        # act
+        mismatches = 0
+        for t in range(1, 600):
+            pl.update(t / 2)
+            mismatches += kpis.wip()['level'] != _stored_wip(pl)
+        kpis.stop()
+
+        # assert
+        self.assertEqual(mismatches, 0)
+        self.assertGreater(sink.tally.total_qty, 0)
+        self.assertEqual(kpis.snapshot()['line']['completed_qty'], sink.tally.total_qty)
+        self.assertEqual(kpis.station_kpis('SHIPPING')['completed_qty'], sink.tally.total_qty)
+
+    def test__station_kpis_satisfy_littles_law(self):
+        # arrange
+        pl, _ = _shipping_line()
+        kpis = KpiEngine(line=pl)
+
+        # act
+        for t in range(1, 600):
+            pl.update(t / 2)
+        kpis.stop()
+        check = kpis.littles_law(StationType.DUMMY_1.name)
+        station = kpis.station_kpis(StationType.DUMMY_1.name)
+
+        # assert
+        self.assertAlmostEqual(check.ratio, 1, delta=0.05)
+        self.assertLessEqual(station['cycle_time_p50_s'], station['cycle_time_p99_s'])
+        self.assertLessEqual(station['cycle_time_p99_s'], station['cycle_time_max_s'])
+
+    def test__cycle_time_pairs_out_of_order_runs(self):
+        # arrange
+        run_s = iter([10] + [0.5] * 100)
+        station = Station(id='two_slots',
+                          input_reqs=[],
+                          output=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=1,
+                                                              storage_capacity=100)],
+                          production_timer_sec_callback=lambda: next(run_s),
+                          production_slots=2,
+                          start_on_init=False)
+        pl = ProductionLine(init_stations=[(station, (0, 0))], start_on_init=False)
+        kpis = KpiEngine(line=pl)
+
+        # act
+        for t in range(1, 6):
+            pl.update(t)
+        kpis.stop()
+
+        # assert
+        self.assertEqual(kpis.station_kpis('two_slots')['cycle_time_max_s'], 1)
+
+    def test__starved_ratio_matches_sampled_status(self):
+        # arrange
+        pl, _ = _shipping_line()
+        kpis = KpiEngine(line=pl)
+        station = pl.Stations[StationType.DUMMY_1.name]
+        starved_ticks = 0
+
+        # act
+        n_ticks = 600
+        for t in range(1, n_ticks + 1):
+            pl.update(t / 2)
+            starved_ticks += StationStatus.STARVED in station.status
+        kpis.stop()
+
+        # assert
+        self.assertAlmostEqual(kpis.starved_ratio(station.id), starved_ticks / n_ticks, delta=0.05)
+        self.assertIsNotNone(kpis.blocked_ratio(station.id))
+
+    def test__throughput_drop_is_flagged(self):
+        # arrange
+        pl, sink = _shipping_line()
+        kpis = KpiEngine(line=pl, rate_tau_s=10, baseline_tau_s=200)
+        for t in range(1, 800):
+            pl.update(t / 2)
+        flagged_before = kpis.throughput_drops()
+
+        # act
+        pl.remove_relationships([(StationType.DUMMY_3.name, sink.id)])
+        for t in range(800, 900):
+            pl.update(t / 2)
+        kpis.stop()
+
+        # assert
+        self.assertNotIn(sink.id, flagged_before)
+        self.assertIn(sink.id, kpis.throughput_drops(time_perf=450))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from coopprodsystem.factory import LineOptimizer, LineConfig, SearchSpace, build_line_from_config, INPUT, OUTPUT, \
+    StationProductionStrategy, TransferAllocationStrategy
+from coopstorage.my_dataclasses import ResourceUoM
+from tests.line_manifest import RELATIONSHIPS
+from tests.station_manifest import STATIONS, StationType
+import tests.sku_manifest as skus
+from tests.uom_manifest import each
+
+
+def _build(config: LineConfig):
+    return build_line_from_config(
+        templates={template.id: template for template in STATIONS.values()},
+        relationships={to.name: [(frm.name, rus) for frm, rus in froms] for to, froms in RELATIONSHIPS.items()},
+        config=config)
+
+
+SEARCH_SPACE = SearchSpace(
+    capacities={
+        (StationType.DUMMY_1.name, INPUT, ResourceUoM(skus.sku_a, each)): [5, 10, 20],
+        (StationType.DUMMY_3.name, OUTPUT, ResourceUoM(skus.sku_g, each)): [3, 6],
+    },
+    strategies={StationType.DUMMY_1.name: [StationProductionStrategy.PRODUCE_IF_ALL_SPACE_AVAIL,
+                                           StationProductionStrategy.PRODUCE_IF_ANY_SPACE_AVAIL]},
+    transfer_allocation_strategies=[TransferAllocationStrategy.PROPORTIONAL, TransferAllocationStrategy.GREEDY]
+)
+
+
+class Test_LineOptimizer(unittest.TestCase):
+
+    def test__config_applies_capacities(self):
+        # arrange
+        config = SEARCH_SPACE.config((2, 1, 1, 1))
+
+        # act
+        line = _build(config)
+        dummy_1 = line.Stations[StationType.DUMMY_1.name]
+
+        # assert
+        self.assertEqual(SEARCH_SPACE.size, 24)
+        self.assertEqual(dummy_1.space_for_input[ResourceUoM(skus.sku_a, each)], 20)
+        self.assertEqual(dummy_1.production_strategy, StationProductionStrategy.PRODUCE_IF_ANY_SPACE_AVAIL)
+        self.assertEqual(line.transfer_allocation_strategy, TransferAllocationStrategy.GREEDY)
+
+    def test__evaluations_are_cached(self):
+        # arrange
+        optimizer = LineOptimizer(_build, SEARCH_SPACE, sim_s=60, n_workers=1, seed=0)
+        config = SEARCH_SPACE.config((0, 0, 0, 0))
+
+        # act
+        first, again = optimizer.evaluate([config, config])
+
+        # assert
+        self.assertEqual(optimizer.n_simulations, 1)
+        self.assertIs(first, again)
+        self.assertGreater(first.throughput, 0)
+
+    def test__parallel_search_returns_best_seen(self):
+        # arrange
+        optimizer = LineOptimizer(_build, SEARCH_SPACE, sim_s=60, population_size=6, n_workers=2, seed=1)
+
+        # act
+        best = optimizer.run(n_generations=3)
+
+        # assert
+        self.assertEqual(optimizer.n_simulations, len(optimizer.cache))
+        self.assertLessEqual(optimizer.n_simulations, 18)
+        self.assertEqual(best.score, max(x.score for x in optimizer.cache.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
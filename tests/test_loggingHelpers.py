@@ -0,0 +1,71 @@
+import logging
+import unittest
+from coopprodsystem.loggingHelpers import should_log, enable_sampled_logging, disable_sampled_logging, \
+    start_background_logging, stop_background_logging
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class Test_LoggingHelpers(unittest.TestCase):
+
+    def test__should_log_respects_level(self):
+        # arrange
+        logger = logging.getLogger('coopprodsystem.test_level')
+        logger.setLevel(logging.WARNING)
+
+        # act
+        # assert
+        self.assertFalse(should_log(logger, logging.INFO))
+        self.assertTrue(should_log(logger, logging.WARNING))
+
+    def test__sampled_logging(self):
+        # arrange
+        logger = logging.getLogger('coopprodsystem.test_sampled.child')
+        enable_sampled_logging(every_n=3, logger_name='coopprodsystem.test_sampled')
+
+        # act
+        passed = [should_log(logger, logging.DEBUG) for _ in range(9)]
+        disable_sampled_logging('coopprodsystem.test_sampled')
+
+        # assert
+        self.assertEqual(sum(passed), 3)
+        self.assertTrue(should_log(logger, logging.DEBUG))
+
+    def test__background_logging(self):
+        # arrange
+        handler = _ListHandler()
+        logger = logging.getLogger('coopprodsystem.test_background')
+        logger.setLevel(logging.INFO)
+
+        # act
+        start_background_logging(handlers=[handler], logger_name='coopprodsystem.test_background')
+        logger.info("msg %s", 1)
+        stop_background_logging(logger_name='coopprodsystem.test_background')
+
+        # assert
+        self.assertEqual(len(handler.records), 1)
+        self.assertEqual(handler.records[0].getMessage(), "msg 1")
+
+    def test__background_logging_renders_args_when_logged(self):
+        # arrange
+        handler = _ListHandler()
+        logger = logging.getLogger('coopprodsystem.test_background_args')
+        logger.setLevel(logging.INFO)
+        state = ['IDLE']
+
+        # act
+        start_background_logging(handlers=[handler], logger_name='coopprodsystem.test_background_args')
+        logger.info("status %s", state)
+        state[0] = 'PRODUCING'
+        stop_background_logging(logger_name='coopprodsystem.test_background_args')
+
+        # assert
+        self.assertEqual(handler.records[0].getMessage(), "status ['IDLE']")
+        self.assertIsNone(handler.records[0].args)
@@ -0,0 +1,177 @@
+import gc
+import logging
+import os
+import unittest
+import weakref
+from pubsub import pub
+import coopprodsystem.events as cevents
+from coopprodsystem.factory import EventRecorder
+from tests.line_manifest import build_line
+from tests.station_manifest import StationType
+
+# soak benchmark size, e.g. COOPPRODSYSTEM_SOAK_TICKS=2000000 python -m pytest tests/test_longRun.py
+SOAK_TICKS = int(os.environ.get('COOPPRODSYSTEM_SOAK_TICKS', 3000))
+SOAK_TICK_S = 0.5
+SOAK_OBJECT_TOLERANCE = 250
+SOAK_RSS_TOLERANCE_BYTES = 16 * 1024 * 1024
+
+
+def _rss_bytes():
+    """Current resident set size, None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _measure():
+    gc.collect()
+    return len(gc.get_objects()), _rss_bytes()
+
+
+def soak(n_ticks: int, tick_s: float = SOAK_TICK_S):
+    """Run the manifest line in long-run mode for n_ticks, draining finished goods, and return the (object count, rss)
+    measured after warmup and at the end"""
+    pl = build_line(long_run=True)
+    end = pl.Stations[StationType.DUMMY_3.name]
+
+    def _run(first: int, last: int):
+        for tick in range(first, last):
+            pl.update(tick * tick_s)
+            output = end.available_output_as_content
+            if output:
+                end.remove_output(output)
+
+    # handlers that retain records (e.g. pytest's log capture) grow with every logged event, which is not what is
+    # being measured; the line is soaked with its per-event logging off
+    package_logger = logging.getLogger('coopprodsystem')
+    level = package_logger.level
+    package_logger.setLevel(logging.ERROR)
+    try:
+        warmup = min(1000, n_ticks // 4)
+        _run(1, warmup)
+        baseline = _measure()
+        _run(warmup, n_ticks)
+        final = _measure()
+    finally:
+        package_logger.setLevel(level)
+        pl.disable_long_run_mode()
+    return baseline, final
+
+
+class Test_LongRun(unittest.TestCase):
+
+    def tearDown(self) -> None:
+        cevents.set_weak_event_refs(False)
+
+    def test__soak_object_count_and_rss_stay_flat(self):
+        # act
+        (objects_0, rss_0), (objects_1, rss_1) = soak(SOAK_TICKS)
+
+        # assert
+        self.assertLessEqual(objects_1 - objects_0, SOAK_OBJECT_TOLERANCE)
+        if rss_0 is not None:
+            self.assertLessEqual(rss_1 - rss_0, SOAK_RSS_TOLERANCE_BYTES)
+
+    def test__finished_transfer_records_are_recycled(self):
+        # arrange
+        pl = build_line(long_run=True)
+        tick = 1
+        while not pl.StationTransfers:
+            tick += 1
+            pl.update(tick)
+        transfer = pl.StationTransfers[0]
+        first_id = transfer.id
+
+        # act
+        while transfer.id == first_id and transfer.content is not None:
+            tick += 1
+            pl.update(tick)
+        released = transfer.content is None
+        while not any(x is transfer for x in pl.StationTransfers) and tick < 200:
+            tick += 1
+            pl.update(tick)
+
+        # assert
+        self.assertTrue(released)
+        self.assertTrue(any(x is transfer for x in pl.StationTransfers))
+        self.assertNotEqual(transfer.id, first_id)
+        self.assertIsNotNone(transfer.from_station)
+
+    def test__retained_event_args_do_not_keep_removed_station_alive(self):
+        # arrange
+        pl = build_line(long_run=True)
+        retained = []
+
+        def _keep(args):
+            retained.append(args)
+
+        pub.subscribe(_keep, cevents.ProductionEventType.PRODUCTION_STARTED_AT_STATION.name)
+        for tick in range(1, 80):
+            pl.update(tick)
+        station_ref = weakref.ref(pl.Stations[StationType.DUMMY_3.name])
+        retained = [x for x in retained if x.station.id == StationType.DUMMY_3.name]
+
+        # act
+        pl.remove_stations([StationType.DUMMY_3.name])
+        for tick in range(80, 100):
+            pl.update(tick)
+        gc.collect()
+        pub.unsubscribe(_keep, cevents.ProductionEventType.PRODUCTION_STARTED_AT_STATION.name)
+
+        # assert
+        self.assertTrue(retained)
+        self.assertIsNone(station_ref())
+        with self.assertRaises(ReferenceError):
+            retained[0].station.id
+
+    def test__weak_event_refs_stay_on_while_any_line_holds_them(self):
+        # arrange
+        gc.collect()
+        pl_a = build_line(long_run=True)
+        pl_b = build_line(long_run=True)
+
+        # act
+        pl_a.disable_long_run_mode()
+        on_with_b = cevents.weak_event_refs()
+        pl_b.disable_long_run_mode()
+
+        # assert
+        self.assertTrue(on_with_b)
+        self.assertFalse(cevents.weak_event_refs())
+
+    def test__transfer_records_are_not_recycled_while_args_are_queued(self):
+        # arrange
+        pl = build_line(long_run=True)
+        cevents.register_deferred_consumer()
+
+        # act
+        try:
+            for tick in range(1, 60):
+                pl.update(tick)
+        finally:
+            cevents.unregister_deferred_consumer()
+            pl.disable_long_run_mode()
+
+        # assert
+        self.assertEqual(pl._transfer_pool, [])
+
+    def test__event_recorder_keeps_most_recent_events(self):
+        # arrange
+        pl = build_line()
+        recorder = EventRecorder(line=pl, max_events=10)
+
+        # act
+        for tick in range(1, 100):
+            pl.update(tick)
+        recorder.stop()
+
+        # assert
+        self.assertEqual(len(recorder.events), 10)
+        self.assertGreater(recorder.n_recorded, 10)
+        self.assertEqual(recorder.events[-1].time_perf, max(x.time_perf for x in recorder.events))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+from coopprodsystem import Station, station_resource_def_EA_uom
+from coopprodsystem.factory import LotTracker, LotQueue, LotNotRetainedException
+from coopstorage.my_dataclasses import ResourceUoM, Content
+from tests.line_manifest import build_line
+from tests.station_manifest import StationType
+import tests.sku_manifest as skus
+from tests.uom_manifest import each
+
+
+class Test_LotTracking(unittest.TestCase):
+
+    def test__tracker_genealogy_and_cycle_time(self):
+        # arrange
+        tracker = LotTracker()
+        ru_a, ru_c = ResourceUoM(skus.sku_a, each), ResourceUoM(skus.sku_c, each)
+
+        # act
+        raw_1 = tracker.new_lot(ru_a, 3, created_perf=1)
+        raw_2 = tracker.new_lot(ru_a, 3, created_perf=2)
+        made = tracker.new_lot(ru_c, 1, created_perf=6, station_id='s1', parents=[raw_1, raw_2, raw_1])
+        tracker.mark_consumed(raw_1, 4)
+        tracker.mark_consumed(raw_1, 5)
+
+        # assert
+        self.assertEqual(tracker.parents(made), [raw_1, raw_2])
+        self.assertEqual(tracker.children(raw_2), [made])
+        self.assertEqual(tracker.cycle_time(raw_1), 3)
+        self.assertIsNone(tracker.cycle_time(raw_2))
+        self.assertEqual(tracker.lead_time(made), 5)
+        self.assertEqual(tracker.wip_ages(10, ru_a), [8])
+        self.assertEqual(tracker.station_id(made), 's1')
+
+    def test__tracker_evicts_consumed_lots_past_retention(self):
+        # arrange
+        tracker = LotTracker(max_retained_lots=10)
+        ru = ResourceUoM(skus.sku_a, each)
+        kept = tracker.new_lot(ru, 1, created_perf=0)
+
+        # act
+        for t in range(1, 100):
+            tracker.mark_consumed(tracker.new_lot(ru, 1, created_perf=t), t + 2)
+        made = tracker.new_lot(ru, 1, created_perf=100, parents=[kept])
+
+        # assert
+        self.assertLessEqual(tracker.n_retained, 11)
+        self.assertEqual(len(tracker), 101)
+        self.assertEqual(tracker.cycle_time_stats(ru).n, 99)
+        self.assertEqual(tracker.cycle_time_stats().mean_s, 2)
+        self.assertEqual(tracker.wip_ages(100, ru), [100, 0])
+        self.assertEqual(tracker.parents(made), [kept])
+        self.assertEqual(tracker.lead_time(made), 100)
+        self.assertRaises(LotNotRetainedException, lambda: tracker.created_perf(1))
+
+    def test__line_with_bounded_tracker(self):
+        # arrange
+        pl = build_line()
+        tracker = pl.enable_lot_tracking(LotTracker(max_retained_lots=20))
+
+        # act
+        for t in range(1, 120):
+            pl.update(t)
+
+        # assert
+        self.assertGreater(tracker.n_evicted, 0)
+        self.assertLessEqual(len(tracker._created), 20)
+        self.assertGreater(tracker.cycle_time_stats().n, len(tracker.cycle_times()))
+        for station in pl.Stations.values():
+            for ru, portions in station.output_lots.items():
+                for lot_id, _ in portions:
+                    self.assertIsNone(tracker.consumed_perf(lot_id))
+
+    def test__lot_queue_draws_fifo(self):
+        # arrange
+        queue = LotQueue()
+        queue.extend([(0, 2), (1, 3)])
+
+        # act
+        drawn, emptied = queue.draw(4)
+
+        # assert
+        self.assertEqual(drawn, [(0, 2), (1, 2)])
+        self.assertEqual(emptied, [0])
+        self.assertEqual(queue.portions, [(1, 1)])
+
+    def test__remove_output_consumes_only_emptied_lots(self):
+        # arrange
+        ru = ResourceUoM(skus.sku_a, each)
+        station = Station(id='lot_raw',
+                          input_reqs=[],
+                          output=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=3,
+                                                              storage_capacity=9)],
+                          production_timer_sec_callback=lambda: 1,
+                          start_on_init=False)
+        tracker = LotTracker()
+        station.set_lot_tracker(tracker)
+        station.update(1)
+        station.update(2.5)
+        lot_id = station.output_lots[ru][0][0]
+
+        # act
+        station.remove_output([Content(ru, 2)])
+        consumed_partly_drawn = tracker.consumed_perf(lot_id)
+        station.remove_output([Content(ru, 1)])
+
+        # assert
+        self.assertIsNone(consumed_partly_drawn)
+        self.assertIsNotNone(tracker.consumed_perf(lot_id))
+        self.assertEqual(station.output_lots[ru], [])
+
+    def test__line_records_genealogy_to_raw_material(self):
+        # arrange
+        pl = build_line()
+        tracker = pl.enable_lot_tracking()
+        end_station = pl.Stations[StationType.DUMMY_3.name]
+
+        # act
+        for t in range(1, 120):
+            pl.update(t)
+        final_lots = [lot_id for portions in end_station.output_lots.values() for lot_id, _ in portions]
+
+        # assert
+        self.assertGreater(end_station.n_runs, 0)
+        self.assertTrue(final_lots)
+        ancestor_stations = {tracker.station_id(x) for x in tracker.ancestors(final_lots[0])}
+        self.assertEqual(ancestor_stations, {StationType.RAW_1.name, StationType.RAW_2.name,
+                                            StationType.DUMMY_1.name, StationType.DUMMY_2.name})
+        self.assertTrue(all(x >= 0 for x in tracker.cycle_times()))
+        self.assertGreater(tracker.lead_time(final_lots[0]), 0)
+
+        for station in pl.Stations.values():
+            for ru, portions in station.input_lots.items():
+                self.assertAlmostEqual(sum(qty for _, qty in portions), station.stored_inputs.get(ru, 0))
+            for ru, portions in station.output_lots.items():
+                self.assertAlmostEqual(sum(qty for _, qty in portions), station.available_output.get(ru, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
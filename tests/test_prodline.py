@@ -1,6 +1,12 @@
+import cProfile
 import unittest
-from coopprodsystem import ProductionLine
-from tests.station_manifest import STATIONS
+from unittest import mock
+from coopprodsystem import ProductionLine, Station, station_factory, station_resource_def_EA_uom
+from coopstorage.my_dataclasses import ResourceUoM, content_factory
+import tests.sku_manifest as skus
+from tests.uom_manifest import each
+from tests.station_manifest import STATIONS, StationType
+from tests.line_manifest import build_line
 import random as rnd
 
 class Test_ProdLine(unittest.TestCase):
@@ -28,4 +34,175 @@ class Test_ProdLine(unittest.TestCase):
         )
 
         # assert
-        self.assertEqual(len(pl.Stations), len(stations))
\ No newline at end of file
+        self.assertEqual(len(pl.Stations), len(stations))
+
+    def test__profiled_update(self):
+        # arrange
+        stations = [(station_factory(x, id=f"profiled_{x.id}"), (0, 0)) for x in STATIONS.values()]
+        pl = ProductionLine(
+            init_stations=stations,
+            start_on_init=False
+        )
+        profiler = pl.enable_profiling()
+        profiler.capture(n_ticks=2)
+
+        # act
+        for ii in range(5):
+            pl.update(1 + ii)
+
+        # assert
+        self.assertEqual(profiler.phase_timings['update'].count, 5)
+        self.assertEqual(profiler.phase_timings['check_create_transfers'].count, 5)
+        self.assertEqual(len(profiler.station_timings), len(stations))
+        self.assertTrue(all(x.count == 5 for x in profiler.station_timings.values()))
+        self.assertIsNotNone(profiler.last_capture.stats)
+        self.assertFalse(profiler.capturing)
+
+    def test__profiled_update_skips_capture_when_another_profiler_is_active(self):
+        # arrange
+        pl = ProductionLine(init_stations=[(station_factory(STATIONS[StationType.RAW_1], id='profiled'), (0, 0))],
+                            start_on_init=False)
+        profiler = pl.enable_profiling()
+        profiler.capture(n_ticks=2)
+
+        # act
+        already_active = ValueError('Another profiling tool is already active')
+        with mock.patch.object(cProfile.Profile, 'enable', side_effect=already_active):
+            with self.assertLogs('coopprodsystem.factory.lineProfiler', level='WARNING'):
+                pl.update(1)
+        pl.update(2)
+
+        # assert
+        self.assertEqual(profiler.phase_timings['update'].count, 2)
+        self.assertFalse(profiler.capturing)
+        self.assertIsNone(profiler.last_capture)
+
+    def test__remove_station_returns_in_flight_transfers(self):
+        # arrange
+        pl = build_line()
+        t = 1
+        while not any(x.to_station.id == StationType.DUMMY_1.name for x in pl.StationTransfers):
+            t += 0.5
+            pl.update(t)
+        raw_1 = pl.Stations[StationType.RAW_1.name]
+        raw_1_output = sum(raw_1.available_output.values())
+        in_flight_from_raw_1 = sum(x.content.qty for x in pl.StationTransfers
+                                   if x.to_station.id == StationType.DUMMY_1.name and x.from_station is raw_1)
+
+        # act
+        pl.remove_stations([StationType.DUMMY_1.name])
+
+        # assert
+        self.assertNotIn(StationType.DUMMY_1.name, pl.Stations)
+        self.assertFalse(any(x.to_station.id == StationType.DUMMY_1.name for x in pl.StationTransfers))
+        self.assertNotIn(StationType.DUMMY_1.name, pl.Relationships)
+        self.assertEqual(pl.check_connections_from_station(StationType.RAW_1.name).keys(),
+                         {pl.Stations[StationType.DUMMY_2.name]})
+        self.assertEqual(sum(raw_1.available_output.values()), raw_1_output + in_flight_from_raw_1)
+        self.assertEqual(pl.qty_in_transit_to_station(StationType.DUMMY_1.name), {})
+
+    def test__replace_station_keeps_relationships_and_inventory(self):
+        # arrange
+        pl = build_line()
+        for ii in range(40):
+            pl.update(1 + ii * 0.5)
+        old = pl.Stations[StationType.DUMMY_3.name]
+        old_inputs = dict(old.stored_inputs)
+
+        # act
+        new = station_factory(STATIONS[StationType.DUMMY_3], id=StationType.DUMMY_3.name, production_slots=2)
+        replaced = pl.replace_station(new)
+        carried_inputs = dict(new.stored_inputs)
+        for ii in range(40, 80):
+            pl.update(1 + ii * 0.5)
+
+        # assert
+        self.assertIs(replaced, old)
+        self.assertIs(pl.Stations[StationType.DUMMY_3.name], new)
+        self.assertEqual(carried_inputs, old_inputs)
+        self.assertEqual(len(pl.Relationships[StationType.DUMMY_3.name]), 2)
+        self.assertGreater(new.n_runs, 0)
+
+    def test__replace_station_requeues_runs_in_progress(self):
+        # arrange
+        ru = ResourceUoM(skus.sku_a, each)
+
+        def _consumer(capacity):
+            return Station(id='consumer',
+                           input_reqs=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=3,
+                                                                   storage_capacity=capacity)],
+                           output=[station_resource_def_EA_uom(content_resource=skus.sku_b, content_qty=1,
+                                                               storage_capacity=10)],
+                           production_timer_sec_callback=lambda: 100)
+
+        pl = ProductionLine(init_stations=[(_consumer(9), (0, 0))], start_on_init=False)
+        tracker = pl.enable_lot_tracking()
+        old = pl.Stations['consumer']
+        for _ in range(3):
+            old.add_input([content_factory(resource_uom=ru, qty=3)])
+        run_lot, kept_lot, dropped_lot = [lot_id for lot_id, _ in old.input_lots[ru]]
+        pl.update(1)
+        in_progress = old.active_productions
+
+        # act
+        new = _consumer(5)
+        with self.assertLogs('coopprodsystem.factory.productionLine', level='WARNING'):
+            pl.replace_station(new)
+
+        # assert
+        requeued_lot = new.input_lots[ru][0][0]
+        self.assertEqual(in_progress, 1)
+        self.assertEqual(new.stored_inputs, {ru: 5})
+        self.assertEqual(new.input_lots[ru], [(requeued_lot, 3), (kept_lot, 2)])
+        self.assertEqual(tracker.parents(requeued_lot), [run_lot])
+        self.assertIsNone(tracker.consumed_perf(kept_lot))
+        self.assertIsNotNone(tracker.consumed_perf(dropped_lot))
+        self.assertEqual(len(tracker.wip_ages(1, ru)), 2)
+
+    def test__transfer_to_shrunk_buffer_returns_to_source(self):
+        # arrange
+        ru = ResourceUoM(skus.sku_a, each)
+
+        def _consumer(capacity):
+            return Station(id='consumer',
+                           input_reqs=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=3,
+                                                                   storage_capacity=capacity)],
+                           output=[station_resource_def_EA_uom(content_resource=skus.sku_b, content_qty=1,
+                                                               storage_capacity=10)],
+                           production_timer_sec_callback=lambda: 1)
+
+        feeder = Station(id='feeder',
+                         input_reqs=[],
+                         output=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=3,
+                                                             storage_capacity=9)],
+                         production_timer_sec_callback=lambda: 1)
+        pl = ProductionLine(init_stations=[(feeder, (0, 0)), (_consumer(9), (1, 0))], start_on_init=False)
+        pl.add_relationships({pl.Stations['consumer']: [(feeder, [ru])]})
+        pl.TransferTimeSCallback = lambda: 5
+        tick = 1
+        while not pl.StationTransfers:
+            tick += 1
+            pl.update(tick)
+        in_flight = sum(x.content.qty for x in pl.StationTransfers)
+
+        # act
+        pl.replace_station(_consumer(1))
+        pl.remove_relationships([('feeder', 'consumer')])
+        for t in range(tick + 1, tick + 8):
+            pl.update(t)
+
+        # assert
+        self.assertEqual(pl.StationTransfers, [])
+        self.assertEqual(pl.Stations['consumer'].stored_inputs.get(ru, 0), 0)
+        self.assertGreaterEqual(feeder.available_output.get(ru, 0), in_flight)
+
+    def test__remove_relationship(self):
+        # arrange
+        pl = build_line()
+
+        # act
+        pl.remove_relationships([(StationType.RAW_2.name, StationType.DUMMY_1.name)])
+
+        # assert
+        self.assertEqual(list(pl.Relationships[StationType.DUMMY_1.name].keys()), [StationType.RAW_1.name])
+        self.assertNotIn(StationType.DUMMY_1.name, [x.id for x in pl.check_connections_from_station(StationType.RAW_2.name)])
@@ -0,0 +1,103 @@
+import unittest
+from coopprodsystem import Station, station_resource_def_EA_uom
+from coopprodsystem.factory import ProductionLine, StationProductionStrategy
+from coopstorage.my_dataclasses import ResourceUoM
+import tests.sku_manifest as skus
+from tests.uom_manifest import each
+
+
+def _serial_line(strategy: StationProductionStrategy, **kwargs) -> ProductionLine:
+    """raw -> m1 -> m2, one unit per run, m2 (3s) is the bottleneck"""
+    def _station(id, input, output, production_s):
+        return Station(id=id,
+                       input_reqs=[station_resource_def_EA_uom(content_resource=input, content_qty=1,
+                                                               storage_capacity=10)] if input else [],
+                       output=[station_resource_def_EA_uom(content_resource=output, content_qty=1, storage_capacity=10)],
+                       production_timer_sec_callback=lambda: production_s,
+                       production_strategy=strategy)
+
+    raw = _station('raw', None, skus.sku_a, 1)
+    m1 = _station('m1', skus.sku_a, skus.sku_b, 2)
+    m2 = _station('m2', skus.sku_b, skus.sku_c, 3)
+    return ProductionLine(init_stations=[(raw, (0, 0)), (m1, (1, 0)), (m2, (2, 0))],
+                          init_relationship_map={m1: [(raw, [])], m2: [(m1, [])]},
+                          start_on_init=False,
+                          transfer_time_s_callback=lambda: 1,
+                          **kwargs)
+
+
+def _run(pl: ProductionLine, n_ticks: int = 300):
+    end = pl.Stations['m2']
+    shipped, wip, max_wip = 0, 0, 0
+    for t in range(1, n_ticks + 1):
+        pl.update(t)
+        output = end.available_output_as_content
+        if output:
+            shipped += sum(x.qty for x in end.remove_output(output))
+        wip += pl.wip()
+        max_wip = max(max_wip, pl.wip())
+    return shipped, wip / n_ticks, max_wip
+
+
+class Test_PullStrategies(unittest.TestCase):
+
+    def test__pull_station_off_line_needs_space_for_all_outputs(self):
+        # arrange
+        station = Station(id='joint',
+                          input_reqs=[],
+                          output=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=2,
+                                                              storage_capacity=2),
+                                  station_resource_def_EA_uom(content_resource=skus.sku_b, content_qty=1,
+                                                              storage_capacity=10)],
+                          production_timer_sec_callback=lambda: 1,
+                          production_strategy=StationProductionStrategy.KANBAN,
+                          start_on_init=False)
+
+        # act
+        for t in range(1, 10):
+            station.update(t)
+
+        # assert
+        self.assertEqual(station.n_runs, 1)
+        self.assertEqual(station.available_output[ResourceUoM(skus.sku_b, each)], 1)
+
+    def test__kanban_keeps_throughput_with_less_wip(self):
+        # arrange
+        push = _serial_line(StationProductionStrategy.PRODUCE_IF_ALL_SPACE_AVAIL)
+        kanban = _serial_line(StationProductionStrategy.KANBAN, default_kanban_cards=2)
+
+        # act
+        push_shipped, push_wip, _ = _run(push)
+        kanban_shipped, kanban_wip, _ = _run(kanban)
+
+        # assert
+        self.assertGreaterEqual(kanban_shipped, 0.95 * push_shipped)
+        self.assertLess(kanban_wip, push_wip / 3)
+
+    def test__conwip_caps_line_wip(self):
+        # arrange
+        pl = _serial_line(StationProductionStrategy.CONWIP, conwip_limit=4)
+
+        # act
+        shipped, _, max_wip = _run(pl)
+
+        # assert
+        self.assertLessEqual(max_wip, 4)
+        self.assertGreater(shipped, 90)
+
+    def test__produce_to_order_only_runs_on_downstream_shortage(self):
+        # arrange
+        pl = _serial_line(StationProductionStrategy.PRODUCE_TO_ORDER)
+        raw = pl.Stations['raw']
+
+        # act
+        shipped, _, max_wip = _run(pl)
+
+        # assert
+        self.assertGreater(shipped, 0)
+        self.assertLessEqual(max_wip, 3)
+        self.assertLessEqual(raw.n_runs, shipped + 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
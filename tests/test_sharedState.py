@@ -0,0 +1,61 @@
+import multiprocessing
+import unittest
+from coopprodsystem.factory import SharedLineStateReader, StationStatus
+from tests.line_manifest import build_line
+from tests.station_manifest import StationType
+
+
+def _read_in_other_process(name, queue):
+    reader = SharedLineStateReader(name)
+    queue.put(reader.snapshot())
+    reader.close()
+
+
+class Test_SharedState(unittest.TestCase):
+
+    def test__reader_sees_published_state(self):
+        # arrange
+        pl = build_line()
+        writer = pl.enable_shared_state()
+        reader = SharedLineStateReader(writer.name)
+
+        # act
+        for t in range(1, 30):
+            pl.update(t)
+        snapshot = reader.snapshot()
+        reader.close()
+        pl.disable_shared_state()
+
+        # assert
+        dummy_1 = pl.Stations[StationType.DUMMY_1.name]
+        state = snapshot['stations'][StationType.DUMMY_1.name]
+        self.assertEqual(snapshot['seq'], 2 * 29)
+        self.assertEqual(snapshot['time_perf'], 29)
+        self.assertEqual(state['n_runs'], dummy_1.n_runs)
+        self.assertEqual(state['status'], [x.name for x in StationStatus if x in dummy_1.status])
+        self.assertEqual(sum(state['inputs'].values()), sum(dummy_1.stored_inputs.values()))
+        self.assertEqual(sum(state['outputs'].values()), sum(dummy_1.available_output.values()))
+
+    def test__other_process_reads_snapshot(self):
+        # arrange
+        pl = build_line()
+        writer = pl.enable_shared_state()
+        for t in range(1, 10):
+            pl.update(t)
+        queue = multiprocessing.Queue()
+
+        # act
+        process = multiprocessing.Process(target=_read_in_other_process, args=(writer.name, queue))
+        process.start()
+        snapshot = queue.get(timeout=10)
+        process.join(10)
+        pl.disable_shared_state()
+
+        # assert
+        self.assertEqual(set(snapshot['stations']), set(str(x) for x in pl.Stations))
+        self.assertEqual(snapshot['stations'][StationType.RAW_1.name]['n_runs'],
+                         pl.Stations[StationType.RAW_1.name].n_runs)
+
+
+if __name__ == '__main__':
+    unittest.main()
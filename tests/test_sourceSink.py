@@ -0,0 +1,130 @@
+import os
+import random
+import tempfile
+import unittest
+from coopprodsystem import station_resource_def_EA_uom
+from coopprodsystem.factory import ProductionLine, SourceStation, SinkStation, ConstantProfile, PoissonProfile, \
+    ScheduleProfile, DemandProfile
+from coopstorage.my_dataclasses import ResourceUoM, content_factory
+import tests.sku_manifest as skus
+from tests.uom_manifest import each
+
+RU_A = ResourceUoM(skus.sku_a, each)
+
+
+def _source(profile, capacity: int = 10) -> SourceStation:
+    return SourceStation(id='source',
+                         output=station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=1,
+                                                            storage_capacity=capacity),
+                         profile=profile)
+
+
+def _sink(profile=None, backlog: bool = True) -> SinkStation:
+    return SinkStation(id='sink',
+                       input_reqs=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=1,
+                                                               storage_capacity=10)],
+                       profile=profile,
+                       backlog=backlog)
+
+
+class _StuckProfile(DemandProfile):
+    def next_event(self, after_offset_s: float):
+        return 1, 1
+
+
+class Test_SourceSink(unittest.TestCase):
+
+    def test__schedule_profile_from_csv_repeats(self):
+        # arrange
+        path = os.path.join(tempfile.mkdtemp(), 'schedule.csv')
+        with open(path, 'w') as f:
+            f.write("time_s,qty\n0,2\n4,1\n")
+
+        # act
+        profile = ScheduleProfile.from_csv(path, repeat_every_s=10)
+        events = [profile.first_event()]
+        for _ in range(3):
+            events.append(profile.next_event(events[-1][0]))
+
+        # assert
+        self.assertEqual(events, [(0, 2), (4, 1), (10, 2), (14, 1)])
+
+    def test__source_drops_arrivals_when_full(self):
+        # arrange
+        source = _source(ConstantProfile(interval_s=1, qty=3), capacity=10)
+
+        # act
+        for t in range(1, 7):
+            source.update(t)
+
+        # assert
+        self.assertEqual(source.available_output[RU_A], 10)
+        self.assertEqual(source.lost_qty, 5)
+        self.assertEqual(source.produced_totals[RU_A], 10)
+
+    def test__constant_profile_advances_with_fractional_interval(self):
+        # arrange
+        profile = ConstantProfile(interval_s=0.1)
+        source = _source(profile, capacity=1000)
+
+        # act
+        for t in range(1, 7):
+            source.update(t)
+        offsets = [profile.first_event()[0]]
+        for _ in range(100):
+            offsets.append(profile.next_event(offsets[-1])[0])
+
+        # assert
+        self.assertAlmostEqual(source.produced_totals[RU_A], 50, delta=1)
+        self.assertTrue(all(b > a for a, b in zip(offsets, offsets[1:])))
+
+    def test__profile_that_does_not_advance_is_dropped(self):
+        # arrange
+        source = _source(_StuckProfile())
+
+        # act
+        with self.assertLogs('coopprodsystem.factory.sourceSink', level='ERROR'):
+            for t in range(1, 4):
+                source.update(t)
+
+        # assert
+        self.assertEqual(source.produced_totals[RU_A], 1)
+
+    def test__sink_backlogs_unmet_demand(self):
+        # arrange
+        sink = _sink(ConstantProfile(interval_s=1, qty=2))
+
+        # act
+        sink.update(1)
+        sink.update(3)
+        backlog = sink.backlog_qty[RU_A]
+        sink.add_input([content_factory(resource_uom=RU_A, qty=5)])
+        sink.update(3.5)
+
+        # assert
+        self.assertEqual(backlog, 4)
+        self.assertEqual(sink.tally.total_qty, 4)
+        self.assertEqual(sink.stored_inputs[RU_A], 1)
+
+    def test__source_to_sink_line_tallies_throughput(self):
+        # arrange
+        source = _source(PoissonProfile(rate_per_s=1, rng=random.Random(0)))
+        sink = _sink()
+        pl = ProductionLine(init_stations=[(source, (0, 0)), (sink, (1, 0))],
+                            init_relationship_map={sink: [(source, [RU_A])]},
+                            start_on_init=False,
+                            transfer_time_s_callback=lambda: 1)
+
+        # act
+        for t in range(1, 201):
+            pl.update(t)
+
+        # assert
+        in_line = sum(source.available_output.values()) + sum(x.content.qty for x in pl.StationTransfers) + \
+                  sum(sink.stored_inputs.values())
+        self.assertEqual(sink.tally.total_qty + in_line, sum(source.produced_totals.values()))
+        self.assertGreater(sink.tally.rate(1, 200), 0.8)
+
+
+if __name__ == '__main__':
+    unittest.main()
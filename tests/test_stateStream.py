@@ -0,0 +1,105 @@
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from coopprodsystem.factory import StateStreamPublisher, BufferFrameSink, SocketFrameSink, FrameType, StateFrame, \
+    apply_frame, line_snapshot, read_frames
+from tests.line_manifest import build_line
+
+
+class Test_StateStream(unittest.TestCase):
+
+    def test__frame_round_trip(self):
+        # arrange
+        frame = StateFrame(FrameType.DELTA, 3, 12.5, {'stations': {'a': {'progress': 0.25, 'status': ['IDLE']}},
+                                                     'transfers_finished': ['x'], 'flag': True, 'n': None, 'i': -4})
+
+        # act
+        decoded = StateFrame.decode(frame.encode())
+
+        # assert
+        self.assertEqual(decoded, frame)
+
+    def test__deltas_reconstruct_line_state(self):
+        # arrange
+        pl = build_line()
+        sink = BufferFrameSink()
+        publisher = StateStreamPublisher(pl, sinks=[sink], keyframe_every=10)
+
+        # act
+        for t in range(1, 60):
+            pl.update(t)
+            publisher.publish(t)
+        state = None
+        for frame in sink.frames():
+            state = apply_frame(state, frame)
+        frames = sink.frames()
+        keyframe_sizes = [len(x.encode()) for x in frames if x.type == FrameType.KEYFRAME]
+        delta_sizes = [len(x.encode()) for x in frames if x.type == FrameType.DELTA]
+
+        # assert
+        self.assertEqual(state, line_snapshot(pl, 59))
+        self.assertEqual(len(keyframe_sizes), 6)
+        self.assertLess(sum(delta_sizes) / len(delta_sizes), sum(keyframe_sizes) / len(keyframe_sizes))
+
+    def test__publish_waits_for_line_update(self):
+        # arrange
+        pl = build_line()
+        publisher = StateStreamPublisher(pl, sinks=[BufferFrameSink()])
+        published = threading.Event()
+        thread = threading.Thread(target=lambda: (publisher.publish(1), published.set()), daemon=True)
+
+        # act
+        with pl.locked():
+            thread.start()
+            published_under_lock = published.wait(0.2)
+        thread.join(5)
+
+        # assert
+        self.assertFalse(published_under_lock)
+        self.assertTrue(published.is_set())
+
+    def test__tcp_sink_without_unix_sockets(self):
+        # arrange
+        af_unix = socket.AF_UNIX
+        del socket.AF_UNIX  # as on Windows
+
+        # act
+        try:
+            sink = SocketFrameSink(('127.0.0.1', 0))
+        finally:
+            socket.AF_UNIX = af_unix
+        port = sink.address[1]
+        sink.close()
+
+        # assert
+        self.assertGreater(port, 0)
+
+    def test__socket_viewer_starts_with_keyframe(self):
+        # arrange
+        pl = build_line()
+        path = os.path.join(tempfile.mkdtemp(), 'state.sock')
+        sink = SocketFrameSink(path)
+        publisher = StateStreamPublisher(pl, sinks=[sink], keyframe_every=1000)
+        pl.update(1)
+        publisher.publish(1)
+        viewer = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        viewer.connect(path)
+
+        # act
+        for t in range(2, 6):
+            pl.update(t)
+            publisher.publish(t)
+        publisher.close()
+        frames = list(read_frames(viewer.makefile('rb')))
+        viewer.close()
+
+        # assert
+        self.assertEqual(frames[0].type, FrameType.KEYFRAME)
+        self.assertEqual([x.seq for x in frames], [1, 2, 3, 4])
+        self.assertTrue(all(x.type == FrameType.DELTA for x in frames[1:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
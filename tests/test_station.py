@@ -1,5 +1,6 @@
 import unittest
-from coopprodsystem import Station, station_factory
+from coopprodsystem import Station, station_factory, station_resource_def_EA_uom
+from coopprodsystem.factory import StationProductionStrategy, StationStatus, OutputStorageToFullToProduceException
 import sku_manifest as skus
 import station_manifest as stations
 
@@ -18,3 +19,75 @@ class Test_Station(unittest.TestCase):
         self.assertEqual(len(station.InputStorageState.Locations), len(station.input_reqs))
         self.assertEqual(len(station.OutputStorageState.Locations), len(station.outputs))
         self.assertEqual(station.id, name)
+
+    def test__multi_slot_production(self):
+        # arrange
+        station = Station(id='multi_slot',
+                          input_reqs=[],
+                          output=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=1,
+                                                              storage_capacity=100)],
+                          production_timer_sec_callback=lambda: 3,
+                          production_slots=4)
+
+        # act
+        station.update(1)
+        active = station.active_productions
+        station.update(4.5)
+
+        # assert
+        self.assertEqual(active, 4)
+        self.assertEqual(sum(station.available_output.values()), 4)
+        self.assertEqual(station.n_runs, 4)
+
+    def test__multi_slot_reserves_output_space(self):
+        # arrange
+        station = Station(id='multi_slot_space',
+                          input_reqs=[],
+                          output=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=2,
+                                                              storage_capacity=5)],
+                          production_timer_sec_callback=lambda: 3,
+                          production_slots=4)
+
+        # act
+        station.update(1)
+
+        # assert
+        self.assertEqual(station.active_productions, 2)
+
+    def test__partial_start_keeps_exception_and_logs_once(self):
+        # arrange
+        station = Station(id='multi_slot_partial',
+                          input_reqs=[],
+                          output=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=2,
+                                                              storage_capacity=5)],
+                          production_timer_sec_callback=lambda: 0.5,
+                          production_slots=4)
+
+        # act
+        with self.assertLogs('coopprodsystem.factory.station', level='WARNING') as logs:
+            for t in range(1, 8):
+                station.update(t)
+                station.remove_output(station.available_output_as_content)
+
+        # assert
+        self.assertIsInstance(station.current_exception, OutputStorageToFullToProduceException)
+        self.assertEqual(len(logs.records), 1)
+
+    def test__not_full_while_producing(self):
+        # arrange
+        station = Station(id='any_space',
+                          input_reqs=[],
+                          output=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=3,
+                                                              storage_capacity=4)],
+                          production_timer_sec_callback=lambda: 3,
+                          production_strategy=StationProductionStrategy.PRODUCE_IF_ANY_SPACE_AVAIL)
+
+        # act
+        station.update(1)
+        station.update(4.5)
+        station.update(5)
+
+        # assert
+        self.assertTrue(station.producing)
+        self.assertNotIn(StationStatus.FULL, station.status)
+
@@ -0,0 +1,105 @@
+import unittest
+from coopprodsystem import ProductionLine, Station, station_resource_def_EA_uom
+from coopprodsystem.factory import TransferAllocationStrategy, TransferDemand, allocate_supply
+from coopstorage.my_dataclasses import ResourceUoM, Content
+import tests.sku_manifest as skus
+from tests.uom_manifest import each
+
+
+class Test_TransferAllocation(unittest.TestCase):
+
+    def test__enough_supply_fills_all(self):
+        # arrange
+        demands = [TransferDemand('a', 3), TransferDemand('b', 4)]
+
+        # act
+        allocation = allocate_supply(10, demands, TransferAllocationStrategy.PROPORTIONAL)
+
+        # assert
+        self.assertEqual(allocation, {'a': 3, 'b': 4})
+
+    def test__greedy(self):
+        # arrange
+        demands = [TransferDemand('a', 8), TransferDemand('b', 8)]
+
+        # act
+        allocation = allocate_supply(10, demands, TransferAllocationStrategy.GREEDY)
+
+        # assert
+        self.assertEqual(allocation, {'a': 8, 'b': 2})
+
+    def test__proportional_integral(self):
+        # arrange
+        demands = [TransferDemand('a', 10), TransferDemand('b', 5), TransferDemand('c', 5)]
+
+        # act
+        allocation = allocate_supply(7, demands, TransferAllocationStrategy.PROPORTIONAL)
+
+        # assert
+        self.assertEqual(sum(allocation.values()), 7)
+        self.assertTrue(all(float(x).is_integer() for x in allocation.values()))
+        self.assertEqual(allocation, {'a': 3, 'b': 2, 'c': 2})
+
+    def test__proportional_completes_runs_first(self):
+        # arrange
+        demands = [TransferDemand('a', 10, run_qty=5), TransferDemand('b', 10, run_qty=5)]
+
+        # act
+        allocation = allocate_supply(6, demands, TransferAllocationStrategy.PROPORTIONAL)
+
+        # assert
+        self.assertEqual(sum(allocation.values()), 6)
+        self.assertEqual(sorted(allocation.values()), [1, 5])
+
+    def test__proportional_short_supply_is_still_shared(self):
+        # arrange
+        demands = [TransferDemand('a', 10, run_qty=5), TransferDemand('b', 10, run_qty=5)]
+
+        # act
+        allocation = allocate_supply(2, demands, TransferAllocationStrategy.PROPORTIONAL)
+
+        # assert
+        self.assertEqual(allocation, {'a': 1, 'b': 1})
+
+    def test__priority_caps_at_demand(self):
+        # arrange
+        demands = [TransferDemand('a', 2, weight=3), TransferDemand('b', 10, weight=1)]
+
+        # act
+        allocation = allocate_supply(8, demands, TransferAllocationStrategy.PRIORITY)
+
+        # assert
+        self.assertEqual(allocation, {'a': 2, 'b': 6})
+
+    def test__shortest_queue_first(self):
+        # arrange
+        demands = [TransferDemand('a', 5, queue=4), TransferDemand('b', 5, queue=0)]
+
+        # act
+        allocation = allocate_supply(6, demands, TransferAllocationStrategy.SHORTEST_QUEUE_FIRST)
+
+        # assert
+        self.assertEqual(allocation, {'b': 5, 'a': 1})
+
+    def test__line_splits_feeder_output(self):
+        # arrange
+        ru = ResourceUoM(skus.sku_a, each)
+        feeder = Station(id='feeder', input_reqs=[],
+                         output=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=3, storage_capacity=6)],
+                         production_timer_sec_callback=lambda: 1)
+        consumers = [Station(id=f'consumer_{ii}',
+                             input_reqs=[station_resource_def_EA_uom(content_resource=skus.sku_a, content_qty=5, storage_capacity=10)],
+                             output=[station_resource_def_EA_uom(content_resource=skus.sku_c, content_qty=1, storage_capacity=100)],
+                             production_timer_sec_callback=lambda: 1) for ii in range(2)]
+        pl = ProductionLine(init_stations=[(x, (0, 0)) for x in [feeder] + consumers],
+                            init_relationship_map={x: [(feeder, [ru])] for x in consumers},
+                            start_on_init=False)
+
+        # act
+        for t in range(1, 200):
+            pl.update(t)
+
+        # assert
+        runs = [x.n_runs for x in consumers]
+        self.assertTrue(all(x > 0 for x in runs))
+        self.assertLessEqual(max(runs) - min(runs), 1)